@@ -0,0 +1,105 @@
+import json
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from dataStore.store import get_store, reload_store
+from dataStore.summaries import estimate_tokens
+from llmGateway.cache import get_cache
+
+STUB_TEXT = '{"services": ["Checking Accounts"], "products": ["Credit Cards"]}'
+
+
+def stub_client(prompts=None):
+    """Stands in for the shared Gemini client so the benchmark measures only the backend."""
+    part = SimpleNamespace(text=STUB_TEXT)
+    response = SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+    def generate_content(**kwargs):
+        if prompts is not None:
+            prompts.append(kwargs["contents"])
+        return response
+
+    async def agenerate_content(**kwargs):
+        return generate_content(**kwargs)
+
+    return SimpleNamespace(
+        models=SimpleNamespace(generate_content=generate_content),
+        aio=SimpleNamespace(models=SimpleNamespace(generate_content=agenerate_content)),
+    )
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Measures p50/p99 latency of /api/adr/ with the Gemini call stubbed out"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument("--cid", default="")
+        parser.add_argument("--flag", default="true")
+        parser.add_argument(
+            "--cold", action="store_true",
+            help="Reload the data files before every request (the old per-request loading)",
+        )
+        parser.add_argument(
+            "--prompts", type=int, default=0, metavar="N",
+            help="Compare prompt size and latency of raw vs summarized transactions over N customers",
+        )
+
+    def run(self, client, body, cold):
+        samples = []
+        for _ in range(self.count):
+            start = time.perf_counter()
+            if cold:
+                reload_store()
+            response = client.post("/api/adr/", body, content_type="application/json")
+            samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"/api/adr/ returned {response.status_code}")
+        return samples
+
+    def compare_prompts(self, client, count, flag):
+        store = get_store()
+        cids = (list(store.individuals)[:count // 2] + list(store.organizations))[:count]
+        for name, summarize in (("raw", False), ("summarized", True)):
+            prompts, samples = [], []
+            get_cache().clear()
+            with override_settings(RECOMMENDER_SUMMARIZE_TRANSACTIONS=summarize), \
+                    mock.patch("llmGateway.gateway.get_client", lambda: stub_client(prompts)):
+                for cid in cids:
+                    body = json.dumps({"message": cid, "flag": flag})
+                    start = time.perf_counter()
+                    client.post("/api/adr/", body, content_type="application/json")
+                    samples.append((time.perf_counter() - start) * 1000)
+            tokens = [estimate_tokens(prompt) for prompt in prompts]
+            self.stdout.write(
+                f"{name}: prompts={len(tokens)} tokens mean={sum(tokens) / max(1, len(tokens)):.0f} "
+                f"p99={percentile(tokens, 99) if tokens else 0} "
+                f"latency p50={percentile(samples, 50):.2f}ms p99={percentile(samples, 99):.2f}ms"
+            )
+
+    def handle(self, *args, **options):
+        self.count = options["requests"]
+        client = Client(HTTP_HOST="localhost")
+        if options["prompts"]:
+            self.compare_prompts(client, options["prompts"], options["flag"])
+            return
+        cid = options["cid"] or next(iter(get_store().individuals))
+        body = json.dumps({"message": cid, "flag": options["flag"]})
+
+        modes = [("cold", True), ("warm", False)] if options["cold"] else [("warm", False)]
+        with mock.patch("llmGateway.gateway.get_client", stub_client):
+            for name, cold in modes:
+                samples = self.run(client, body, cold)
+                self.stdout.write(
+                    f"{name}: requests={len(samples)} "
+                    f"p50={percentile(samples, 50):.2f}ms p99={percentile(samples, 99):.2f}ms"
+                )
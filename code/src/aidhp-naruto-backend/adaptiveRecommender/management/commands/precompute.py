@@ -0,0 +1,92 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from adaptiveRecommender.views import recommend_group as recommend_adr
+from contentRecommender.views import recommend_group as recommend_cdr
+from dataStore.serving import customer_fingerprint, get_serving_table
+from dataStore.store import get_store
+from llmGateway.batch import chunked
+
+
+def jobs(store, kinds):
+    """(kind, flag, group handler) for every result the views can serve."""
+    if "adr" in kinds:
+        yield "adr", True, partial(recommend_adr, store, "true")
+        yield "adr", False, partial(recommend_adr, store, "")
+    if "cdr" in kinds:
+        yield "cdr", False, recommend_cdr
+
+
+class Command(BaseCommand):
+    help = (
+        "Precomputes /api/adr/ (both flag modes) and /api/cdr/ results for every customer "
+        "into the serving table. Finished groups are committed as they complete, so an "
+        "interrupted run resumes where it stopped; customers whose data changed are redone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kinds", default="adr,cdr", help="Comma-separated subset of adr, cdr")
+        parser.add_argument("--workers", type=int, default=4, help="Groups generated concurrently")
+        parser.add_argument("--batch-size", type=int, default=None, help="Customers per prompt")
+        parser.add_argument("--limit", type=int, default=None, help="Only process the first N pending customers per job")
+        parser.add_argument("--restart", action="store_true", help="Discard stored results and start over")
+
+    def handle(self, *args, **options):
+        table = get_serving_table(create=True)
+        if table is None:
+            raise CommandError("SERVING_TABLE_PATH is not set.")
+        kinds = {kind.strip() for kind in options["kinds"].split(",") if kind.strip()}
+        if not kinds or kinds - {"adr", "cdr"}:
+            raise CommandError("--kinds must be a subset of adr, cdr")
+
+        store = get_store()
+        cids = sorted(store.individuals) + sorted(store.organizations)
+        fingerprints = {cid: customer_fingerprint(store, cid) for cid in cids}
+        batch_size = options["batch_size"] or getattr(settings, "RECOMMENDER_BATCH_SIZE", 10)
+
+        if options["restart"]:
+            for kind in kinds:
+                table.delete(kind=kind)
+        for kind, flag, handle_group in jobs(store, kinds):
+            stored = table.fingerprints(kind, flag)
+            outdated = [cid for cid in cids if stored.get(cid) != fingerprints[cid]]
+            pending = outdated[:options["limit"]]
+            self.stdout.write(f"{kind} flag={flag}: {len(cids) - len(outdated)} current, {len(pending)} to compute")
+            if pending:
+                self.run_job(table, kind, flag, handle_group, chunked(pending, batch_size), fingerprints, options["workers"])
+
+        counts = ", ".join(f"{kind} flag={flag}: {count}" for (kind, flag), count in sorted(table.counts().items()))
+        self.stdout.write(self.style.SUCCESS(f"Serving table {table.path}: {counts}"))
+
+    def run_job(self, table, kind, flag, handle_group, groups, fingerprints, workers):
+        start = time.perf_counter()
+        stored = failed = 0
+        pool = ThreadPoolExecutor(max_workers=workers)
+        futures = {pool.submit(handle_group, group): group for group in groups}
+        try:
+            for future in as_completed(futures):
+                try:
+                    results = future.result()
+                except Exception as e:
+                    failed += len(futures[future])
+                    self.stderr.write(f"{kind}: group of {len(futures[future])} failed: {e}")
+                    continue
+                rows = [
+                    (kind, result["cid"], flag, fingerprints[result["cid"]],
+                     {key: value for key, value in result.items() if key != "cid"})
+                    for result in results if "error" not in result
+                ]
+                # Committing per group is the checkpoint a rerun resumes from
+                table.put_many(rows)
+                stored += len(rows)
+                failed += len(results) - len(rows)
+        finally:
+            # On interrupt, drop the groups that have not started
+            pool.shutdown(wait=False, cancel_futures=True)
+        self.stdout.write(
+            f"{kind} flag={flag}: stored {stored}, failed {failed} in {time.perf_counter() - start:.1f}s"
+        )
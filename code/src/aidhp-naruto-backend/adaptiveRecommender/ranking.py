@@ -0,0 +1,126 @@
+"""
+Local ranking of catalog services and products against a customer profile.
+
+Catalog items and customer profiles are embedded as hashed TF-IDF vectors over
+word and character 4-gram features, and ranked by cosine similarity with one
+matrix-vector product per request.
+"""
+import re
+import weakref
+import zlib
+
+import numpy as np
+
+DIMENSIONS = 1 << 12
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {"and", "for", "the", "of", "to", "in", "with", "on", "a", "an", "or", "vs"}
+
+
+def tokens(text):
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        yield token
+
+
+def feature_indices(text):
+    """Hashes the words of a text and their character 4-grams into feature indices."""
+    indices = []
+    for token in tokens(text):
+        indices.append(zlib.crc32(token.encode("utf-8")) % DIMENSIONS)
+        padded = f"#{token}#"
+        for i in range(len(padded) - 3):
+            indices.append(zlib.crc32(padded[i:i + 4].encode("utf-8")) % DIMENSIONS)
+    return indices
+
+
+def hashed_counts(text):
+    return np.bincount(feature_indices(text), minlength=DIMENSIONS).astype(np.float32)
+
+
+def catalog_items(catalog, key):
+    """Flattens a [{'category': ..., key: [...]}] catalog into (category, name) pairs."""
+    return [(group["category"], name) for group in catalog for name in group.get(key, [])]
+
+
+class CatalogRanker:
+    """Scores the services and products of one catalog against free-text profiles."""
+
+    def __init__(self, services, products):
+        self.items = {
+            "services": catalog_items(services, "services"),
+            "products": catalog_items(products, "products"),
+        }
+        documents = [f"{category} {name} {name}" for kind in ("services", "products") for category, name in self.items[kind]]
+        counts = np.vstack([hashed_counts(document) for document in documents]) if documents else np.zeros((0, DIMENSIONS), np.float32)
+
+        document_frequency = (counts > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(documents)) / (1 + document_frequency)) + 1).astype(np.float32)
+        weights = counts * self.idf
+        norms = np.linalg.norm(weights, axis=1, keepdims=True)
+        weights /= np.where(norms == 0, 1, norms)
+
+        split = len(self.items["services"])
+        self.matrix = {"services": weights[:split], "products": weights[split:]}
+
+    def profile_vector(self, text):
+        vector = hashed_counts(text) * self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def top(self, kind, vector, k):
+        """Returns the k best (category, name, score) items of a kind, best first."""
+        scores = self.matrix[kind] @ vector
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.lexsort((best, -scores[best]))]
+        return [(*self.items[kind][i], float(scores[i])) for i in best]
+
+    def shortlist(self, text, k):
+        """Returns the top-k services and products, grouped back into catalog shape."""
+        vector = self.profile_vector(text)
+        return (
+            group_by_category(self.top("services", vector, k), "services"),
+            group_by_category(self.top("products", vector, k), "products"),
+        )
+
+    def recommend(self, text, k=3):
+        """Returns the names of the top-k services and products."""
+        vector = self.profile_vector(text)
+        return {
+            "services": [name for _, name, _ in self.top("services", vector, k)],
+            "products": [name for _, name, _ in self.top("products", vector, k)],
+        }
+
+
+def group_by_category(ranked, key):
+    groups = {}
+    for category, name, _ in ranked:
+        groups.setdefault(category, []).append(name)
+    return [{"category": category, key: names} for category, names in groups.items()]
+
+
+def customer_profile(store, cid, recent=False):
+    """Free-text profile of a customer: requirements, preferences and transaction types."""
+    record = store.customer(cid) or {}
+    parts = [record.get("REQUIREMENTS", ""), record.get("PREFERENCES", "")]
+    parts.extend(txn["TYPE"] for txn in store.customer_transactions(cid))
+    if recent:
+        parts.extend(txn["TYPE"] for txn in store.recent_transactions(cid))
+    return ", ".join(part for part in parts if part)
+
+
+_rankers = weakref.WeakKeyDictionary()
+
+
+def get_ranker(store, cid):
+    """Returns the ranker for the catalog that applies to a CID, built once per store."""
+    rankers = _rankers.setdefault(store, {})
+    kind = "ORG" if cid.startswith("ORG") else "IND"
+    if kind not in rankers:
+        rankers[kind] = CatalogRanker(store.services(cid), store.products(cid))
+    return rankers[kind]
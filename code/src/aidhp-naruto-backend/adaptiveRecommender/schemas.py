@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+
+
+class Recommendations(BaseModel):
+    """Services and products picked for one customer."""
+    services: list[str]
+    products: list[str]
+
+
+class CustomerRecommendations(BaseModel):
+    """One customer's entry in a batch answer."""
+    cid: str
+    services: list[str]
+    products: list[str]
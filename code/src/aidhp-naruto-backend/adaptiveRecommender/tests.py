@@ -1,3 +1,219 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+
+from django.test import AsyncRequestFactory, TestCase, override_settings
+
+from contentRecommender.views import AsyncContentRecommenderBatchView, AsyncContentRecommenderView
+from dataStore.serving import ServingTable, get_serving_table
+from dataStore.store import get_store
+from dataStore.summaries import estimate_tokens
+from llmGateway.cache import get_cache
+from llmGateway.gateway import generate_text
+from llmGateway.scheduler import current_deadline
+from .management.commands.benchadr import stub_client
+from .ranking import CatalogRanker
+from .views import AsyncAdaptiveRecommenderBatchView, AsyncAdaptiveRecommenderView, build_batch_query
+
+
+@mock.patch("llmGateway.gateway.get_client", stub_client)
+@override_settings(SERVING_TABLE_PATH=None)
+class AdaptiveRecommenderViewTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.cid = next(iter(get_store().individuals))
+
+    def test_recommendations_for_known_customer(self):
+        response = self.client.post("/api/adr/", {"message": self.cid, "flag": "true"}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["services"], ["Checking Accounts"])
+
+    def test_unknown_customer_returns_empty_lists(self):
+        response = self.client.post("/api/adr/", {"message": "IND9999999"}, content_type="application/json")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {"services": [], "products": []})
+
+    def test_local_mode_skips_the_model(self):
+        with mock.patch("llmGateway.structured.generate_text") as generate:
+            response = self.client.post(
+                "/api/adr/", {"message": self.cid, "flag": "true", "mode": "local"}, content_type="application/json"
+            )
+        generate.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["services"]), 3)
+        self.assertEqual(len(response.json()["products"]), 3)
+
+    def test_similar_customers(self):
+        response = self.client.post("/api/similar/", {"message": self.cid, "k": 3}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["similar"]), 3)
+
+    async def test_async_view(self):
+        request = AsyncRequestFactory().post(
+            "/api/adr/", json.dumps({"message": self.cid, "flag": ""}), content_type="application/json"
+        )
+        response = await AsyncAdaptiveRecommenderView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["products"], ["Credit Cards"])
+
+    async def test_async_views_reject_bodies_that_are_not_objects(self):
+        views = (AsyncAdaptiveRecommenderView, AsyncAdaptiveRecommenderBatchView,
+                 AsyncContentRecommenderView, AsyncContentRecommenderBatchView)
+        for view in views:
+            for body in ("[]", "not json"):
+                request = AsyncRequestFactory().post("/api/adr/", body, content_type="application/json")
+                response = await view.as_view()(request)
+                self.assertEqual(response.status_code, 400, (view.__name__, body))
+
+
+@override_settings(GEMINI_BACKEND="fake")
+class BatchRecommenderTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        store = get_store()
+        self.cids = list(store.individuals)[:3] + list(store.organizations)[:2]
+
+    def results(self, lines):
+        return {result["cid"]: result for result in map(json.loads, lines)}
+
+    def test_batch_streams_one_line_per_cid(self):
+        body = {"cids": self.cids + ["IND9999999"], "flag": "true", "batch_size": 2}
+        with mock.patch("llmGateway.structured.generate_text", wraps=generate_text) as generate:
+            response = self.client.post("/api/adr/batch/", body, content_type="application/json")
+            results = self.results(b"".join(response.streaming_content).decode().splitlines())
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(generate.call_count, 3)
+        self.assertEqual(set(results), set(body["cids"]))
+        self.assertEqual(results["IND9999999"], {"cid": "IND9999999", "error": "User not found."})
+        self.assertTrue(all(len(results[cid]["services"]) == 3 for cid in self.cids))
+
+    def test_failed_group_does_not_fail_the_batch(self):
+        calls = []
+
+        def flaky(endpoint, query, **kwargs):
+            calls.append(query)
+            if len(calls) == 1:
+                raise RuntimeError("upstream unavailable")
+            return generate_text(endpoint, query, **kwargs)
+
+        with mock.patch("llmGateway.structured.generate_text", flaky), \
+                override_settings(RECOMMENDER_BATCH_CONCURRENCY=1):
+            response = self.client.post("/api/adr/batch/", {"cids": self.cids, "batch_size": 3}, content_type="application/json")
+            results = self.results(b"".join(response.streaming_content).decode().splitlines())
+        self.assertEqual([results[cid]["error"] for cid in self.cids[:3]], ["upstream unavailable"] * 3)
+        self.assertIn("services", results[self.cids[3]])
+
+    def test_group_prompt_shares_the_token_budget(self):
+        store = get_store()
+        with override_settings(RECOMMENDER_PROMPT_TOKEN_BUDGET=0):
+            unbounded, _ = build_batch_query(store, "true", self.cids)
+        with override_settings(RECOMMENDER_PROMPT_TOKEN_BUDGET=3000):
+            query, _ = build_batch_query(store, "true", self.cids)
+        self.assertGreater(estimate_tokens(unbounded), 3000)
+        self.assertLessEqual(estimate_tokens(query), 3000)
+
+    def test_groups_run_in_the_request_context(self):
+        deadlines = []
+
+        def generate(endpoint, query, **kwargs):
+            deadlines.append(current_deadline())
+            return generate_text(endpoint, query, **kwargs)
+
+        body = {"cids": self.cids, "batch_size": 2}
+        with mock.patch("llmGateway.structured.generate_text", generate):
+            response = self.client.post(
+                "/api/adr/batch/", body, content_type="application/json", HTTP_X_REQUEST_TIMEOUT="5"
+            )
+            # The response is read after the middleware has reset the deadline
+            self.assertIsNone(current_deadline())
+            b"".join(response.streaming_content)
+        self.assertEqual(len(deadlines), 3)
+        self.assertTrue(all(d is not None for d in deadlines))
+
+    def test_rejects_invalid_cid_list(self):
+        response = self.client.post("/api/adr/batch/", {"cids": []}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async_batch_view(self):
+        request = AsyncRequestFactory().post(
+            "/api/adr/batch/", json.dumps({"cids": self.cids, "batch_size": 2}), content_type="application/json"
+        )
+        response = await AsyncAdaptiveRecommenderBatchView.as_view()(request)
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual(set(self.results(b"".join(lines).decode().splitlines())), set(self.cids))
+
+
+class PrecomputeTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        serving = override_settings(GEMINI_BACKEND="fake", SERVING_TABLE_PATH=os.path.join(tmp.name, "serving.sqlite3"))
+        serving.enable()
+        self.addCleanup(serving.disable)
+
+    def precompute(self, **options):
+        out = StringIO()
+        call_command("precompute", limit=4, batch_size=2, workers=2, stdout=out, **options)
+        return out.getvalue()
+
+    def test_views_serve_precomputed_results(self):
+        self.precompute(kinds="adr")
+        counts = get_serving_table().counts()
+        self.assertEqual(counts, {("adr", True): 4, ("adr", False): 4})
+
+        cid = sorted(get_store().individuals)[0]
+        with mock.patch("llmGateway.structured.generate_text") as generate:
+            response = self.client.post("/api/adr/", {"message": cid, "flag": "true"}, content_type="application/json")
+        generate.assert_not_called()
+        self.assertEqual(len(response.json()["services"]), 3)
+
+    async def test_async_views_read_the_serving_table_off_the_event_loop(self):
+        await sync_to_async(self.precompute)(kinds="adr,cdr")
+        cid = sorted(get_store().individuals)[0]
+        on_loop = []
+        get = ServingTable.get
+
+        def recording(*args, **kwargs):
+            on_loop.append(asyncio._get_running_loop() is not None)
+            return get(*args, **kwargs)
+
+        with mock.patch.object(ServingTable, "get", recording), \
+                mock.patch("llmGateway.structured.agenerate_text") as generate:
+            for view, path in ((AsyncAdaptiveRecommenderView, "/api/adr/"), (AsyncContentRecommenderView, "/api/cdr/")):
+                request = AsyncRequestFactory().post(path, json.dumps({"message": cid}), content_type="application/json")
+                self.assertEqual((await view.as_view()(request)).status_code, 200)
+        generate.assert_not_called()
+        self.assertEqual(on_loop, [False, False])
+
+    def test_resume_skips_current_and_redoes_changed_customers(self):
+        self.precompute(kinds="cdr")
+        self.assertIn("4 current, 4 to compute", self.precompute(kinds="cdr"))
+
+        cid = sorted(get_store().individuals)[0]
+        with mock.patch("dataStore.serving.customer_fingerprint", return_value="changed"), \
+                mock.patch("llmGateway.structured.generate_text", return_value='{"links": []}') as generate:
+            self.client.post("/api/cdr/", {"message": cid}, content_type="application/json")
+        generate.assert_called_once()
+        with mock.patch("adaptiveRecommender.management.commands.precompute.customer_fingerprint", return_value="changed"):
+            self.assertIn("0 current, 4 to compute", self.precompute(kinds="cdr"))
+
+
+class CatalogRankerTests(TestCase):
+    def test_ranks_matching_items_first(self):
+        ranker = CatalogRanker(
+            [{"category": "Bank Accounts", "services": ["Checking Accounts", "Offshore Accounts"]},
+             {"category": "Fraud", "services": ["Fraud Monitoring"]}],
+            [{"category": "Loans", "products": ["Auto Loans", "Student Loans"]}],
+        )
+        recommended = ranker.recommend("Financial Fraud Prevention, Auto Loan Payment", k=1)
+        self.assertEqual(recommended, {"services": ["Fraud Monitoring"], "products": ["Auto Loans"]})
+
+        services, products = ranker.shortlist("Fraud Prevention", 2)
+        self.assertEqual(services[0], {"category": "Fraud", "services": ["Fraud Monitoring"]})
@@ -1,6 +1,21 @@
+from django.conf import settings
 from django.urls import path
-from .views import AdaptiveRecommenderView
+from django.views.decorators.csrf import csrf_exempt
+from .views import (
+    AsyncAdaptiveRecommenderBatchView, AsyncAdaptiveRecommenderView,
+    AdaptiveRecommenderBatchView, AdaptiveRecommenderView, SimilarCustomersView,
+)
+
+# Async views hold a coroutine, not a worker thread, per in-flight Gemini call
+if settings.ASYNC_VIEWS:
+    view = csrf_exempt(AsyncAdaptiveRecommenderView.as_view())
+    batch_view = csrf_exempt(AsyncAdaptiveRecommenderBatchView.as_view())
+else:
+    view = AdaptiveRecommenderView.as_view()
+    batch_view = AdaptiveRecommenderBatchView.as_view()
 
 urlpatterns = [
-    path('adr/', AdaptiveRecommenderView.as_view(), name='adaptive_recommender'),
-]
\ No newline at end of file
+    path('adr/', view, name='adaptive_recommender'),
+    path('adr/batch/', batch_view, name='adaptive_recommender_batch'),
+    path('similar/', SimilarCustomersView.as_view(), name='similar_customers'),
+]
@@ -1,121 +1,354 @@
-import pickle
-from google import genai
-from django.shortcuts import render
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from dotenv import load_dotenv
-import re
 import json
+from functools import partial
+from dataStore.db import aread, get_records
+from dataStore.features import peer_profile
+from dataStore.serving import aserve_precomputed, serve_precomputed
+from dataStore.store import get_store
+from dataStore.summaries import estimate_tokens, format_record, summarize_transactions
+from llmGateway.batch import NDJSONRenderer, arun_batches, chunked, ndjson_response, parse_batch_request, run_batches
+from llmGateway.breaker import CircuitOpen
+from llmGateway.scheduler import Overloaded, overloaded_response
+from llmGateway.structured import StructuredOutputError, agenerate_structured, generate_structured
+from telemetry.spans import span
+from .ranking import customer_profile, get_ranker
+from .schemas import CustomerRecommendations, Recommendations
+
+EMPTY_RECOMMENDATIONS = {
+    'services': [],
+    'products': []
+}
+
+
+def selection_instruction(flag):
+    if (flag):
+        return "Select three distinct best matches by adapting with recent transactions from the service as well as product."
+    return "Select three distinct best matches from the service as well as product."
+
+
+def compose_context(cname, services, products, record, transactions, peers):
+    return (f"Financial services provided to the {cname} are {services},"
+    f"financial products for the {cname} are {products}."
+    f"For the {cname} as {record} with {transactions}."
+    f"{peers}")
+
+
+def compose_query(context, flag):
+    return (f"You are a bank. {context}"
+    f"{selection_instruction(flag)}"
+    f"Generate json strictly with only two keys 'services' and 'products' without extra fields.")
+
+
+def customer_context(store, flag, cid, reserve=0, budget=None):
+    """
+    Describes one customer for a recommendation prompt: catalog shortlist,
+    record, transactions and peer hints. Raises KeyError for unknown CIDs.
+    ``reserve`` is the token count of the surrounding prompt text and
+    ``budget`` replaces RECOMMENDER_PROMPT_TOKEN_BUDGET when given.
+    """
+    records = get_records(store)
+    if (cid[0:3] == "ORG"):
+        cname = "organizations"
+    elif (cid[0:3] == "IND"):
+        cname = "individuals"
+    else:
+        raise KeyError(cid)
+    record = records.customer(cid)
+    if record is None:
+        raise KeyError(cid)
+
+    # Only the locally best-matching catalog items are sent to the model
+    shortlist_size = getattr(settings, "RECOMMENDER_SHORTLIST_SIZE", 0)
+    if shortlist_size:
+        profile = customer_profile(store, cid, recent=bool(flag))
+        services, products = get_ranker(store, cid).shortlist(profile, shortlist_size)
+    else:
+        services = records.services(cid)
+        products = records.products(cid)
+
+    # What the most similar customers have, without an extra model call
+    peers = ""
+    peer_count = getattr(settings, "RECOMMENDER_PEER_COUNT", 0)
+    if peer_count:
+        profile = peer_profile(store, cid, k=peer_count)
+        peers = (f"Similar customers also prefer {profile['preferences']} "
+                 f"and recently made {profile['transaction_types']} transactions.")
+
+    if not getattr(settings, "RECOMMENDER_SUMMARIZE_TRANSACTIONS", True):
+        txn = records.customer_transactions(cid)
+        if (flag):
+            transactions = f"old transactions {txn} and recent transactions {records.recent_transactions(cid)}"
+        else:
+            transactions = f"transactions {txn}"
+        return compose_context(cname, services, products, record, transactions, peers)
+
+    # Shrink the transaction summary, then drop the peer hint, until the prompt fits the budget
+    if budget is None:
+        budget = getattr(settings, "RECOMMENDER_PROMPT_TOKEN_BUDGET", 0)
+    for top, hint in ((5, peers), (3, peers), (1, peers), (1, "")):
+        summary = summarize_transactions(store, cid, recent=bool(flag), top=top)
+        context = compose_context(
+            cname, services, products, format_record(record), f"transaction summary:\n{summary}\n", hint
+        )
+        if not budget or reserve + estimate_tokens(context) <= budget:
+            break
+    return context
+
+
+def build_query(store, flag, cid):
+    """Builds the recommendation prompt for a customer; raises KeyError for unknown CIDs."""
+    reserve = estimate_tokens(compose_query("", flag))
+    return compose_query(customer_context(store, flag, cid, reserve), flag)
+
+
+def compose_batch_query(sections, flag):
+    return (f"You are a bank. Recommend separately for each of the following {len(sections)} customers.\n"
+    + "\n".join(sections) + "\n"
+    f"For each customer: {selection_instruction(flag)}"
+    f"Generate json strictly as a list with one entry per customer, giving its customer ID as 'cid' "
+    f"and its 'services' and 'products'.")
+
+
+def build_batch_query(store, flag, cids):
+    """
+    Builds one prompt covering a group of customers. Returns (query, errors);
+    query is None when no CID of the group is known. The prompt token budget
+    is split evenly between the customers of the group.
+    """
+    budget = getattr(settings, "RECOMMENDER_PROMPT_TOKEN_BUDGET", 0)
+    if budget:
+        budget = max(1, (budget - estimate_tokens(compose_batch_query([""] * len(cids), flag))) // len(cids))
+    sections = []
+    errors = []
+    for cid in cids:
+        try:
+            reserve = estimate_tokens(f"Customer {cid}: ")
+            sections.append(f"Customer {cid}: {customer_context(store, flag, cid, reserve, budget)}")
+        except KeyError:
+            errors.append({"cid": cid, "error": "User not found."})
+    if not sections:
+        return None, errors
+    return compose_batch_query(sections, flag), errors
+
+
+def local_recommendations(store, flag, cid):
+    """Returns the local top 3 services and products without calling the model."""
+    if store.customer(cid) is None:
+        raise KeyError(cid)
+    profile = customer_profile(store, cid, recent=bool(flag))
+    return get_ranker(store, cid).recommend(profile, k=3)
+
+
+def batch_results(store, flag, answers, cids):
+    """
+    Splits a batch answer into one result per CID, in the order of ``cids``;
+    CIDs the answer left out get ``local_recommendations``.
+    """
+    by_cid = {answer.cid: answer for answer in answers}
+    results = []
+    for cid in cids:
+        answer = by_cid.get(cid)
+        if answer is not None:
+            results.append({"cid": cid, "services": answer.services, "products": answer.products})
+        else:
+            results.append({"cid": cid, **local_recommendations(store, flag, cid)})
+    return results
+
+
+def local_batch(store, flag, group):
+    results = []
+    for cid in group:
+        try:
+            results.append({"cid": cid, **local_recommendations(store, flag, cid)})
+        except KeyError:
+            results.append({"cid": cid, "error": "User not found."})
+    return results
+
+
+def recommend_group(store, flag, group):
+    """
+    Recommendations for a group of CIDs from one model call, or local ones
+    while the circuit is open or the model keeps answering off-schema.
+    """
+    query, results = build_batch_query(store, flag, group)
+    if query is not None:
+        known = [cid for cid in group if cid not in {error["cid"] for error in results}]
+        try:
+            answers = generate_structured("adr", query, list[CustomerRecommendations], tags=known)
+            results += batch_results(store, flag, answers, known)
+        except (CircuitOpen, StructuredOutputError):
+            results += local_batch(store, flag, known)
+    return results
+
+
+async def arecommend_group(store, flag, group):
+    query, results = await aread(build_batch_query, store, flag, group)
+    if query is not None:
+        known = [cid for cid in group if cid not in {error["cid"] for error in results}]
+        try:
+            answers = await agenerate_structured("adr", query, list[CustomerRecommendations], tags=known)
+            results += await aread(batch_results, store, flag, answers, known)
+        except (CircuitOpen, StructuredOutputError):
+            results += await aread(local_batch, store, flag, known)
+    return results
+
+
+def read_body(request):
+    """The JSON object of an async view's request body; raises ValueError when it is not one."""
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        raise ValueError("Request body must be JSON.") from None
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object.")
+    return data
 
-# Load environment variables
-load_dotenv()
 
 class AdaptiveRecommenderView(APIView):
     def post(self, request):
-        fhx = open("data/individual.dat", "rb")
-        fhy = open("data/organization.dat", "rb")
-        fhw = open("data/transaction.dat", "rb")
-        fhu = open("data/orgsvc.dat", "rb")
-        fha = open("data/orgprd.dat", "rb")
-        fhb = open("data/indsvc.dat", "rb")
-        fhc = open("data/indprd.dat", "rb")
-        fhd = open("data/txnadapt.dat", "rb")
-
-        individuals = pickle.load(fhx)
-        organizations = pickle.load(fhy)
-        transactions = pickle.load(fhw)
-        txnadapt = pickle.load(fhd)
-
-        orgsvcs = pickle.load(fhu)
-        orgprds = pickle.load(fha)
-        indsvcs = pickle.load(fhb)
-        indprds = pickle.load(fhc)
-
-        fhx.close()
-        fhy.close()
-        fhw.close()
-        fhu.close()
-        fha.close()
-        fhb.close()
-        fhc.close()
-        fhd.close()
-
-        client = genai.Client(api_key="GEMINI_API_KEY")
-
         try:
             flag = request.data.get('flag', '')
             cid = request.data.get('message', '')
-            txn = {}
-            txnadpt = {}
-            record = {}
-            orgrecord = {}
-            indrecord = {}
-            services = {}
-            products = {}
-
-            if (cid[0:3] == "ORG"):
-                cname = "organizations"
-                orgrecord = organizations[cid]
-                txn = transactions[cid]
-                txnadpt = txnadapt[cid]
-                record = orgrecord
-                services = orgsvcs
-                products = orgprds
-            elif (cid[0:3] == "IND"):
-                cname = "individuals"
-                indrecord = individuals[cid]
-                txn = transactions[cid]
-                txnadpt = txnadapt[cid]
-                record = indrecord
-                services = indsvcs
-                products = indprds
-
-            if (flag):
-                query = (f"You are a bank. Financial services provided to the {cname} are {services},"
-                f"financial products for the {cname} are {products}."
-                f"For the {cname} as {record} with old transactions {txn} and recent transactions {txnadpt}."
-                f"Select three distinct best matches by adapting with recent transactions from the service as well as product."
-                f"Generate json strictly with only two keys 'services' and 'products' without extra fields.")
+
+            with span("data_load"):
+                store = get_store()
+
+            if request.data.get('mode') == 'local':
+                with span("rank"):
+                    recommendations = local_recommendations(store, flag, cid)
+                return Response(recommendations, status=status.HTTP_200_OK)
+
+            with span("serving_lookup"):
+                precomputed = serve_precomputed(store, "adr", cid, flag)
+            if precomputed is not None:
+                return Response(precomputed, status=status.HTTP_200_OK)
+
+            with span("prompt_build"):
+                query = build_query(store, flag, cid)
+            try:
+                recommendations = generate_structured("adr", query, Recommendations, tags=(cid,)).model_dump()
+            except (CircuitOpen, StructuredOutputError):
+                # Gemini is down or keeps answering off-schema: answer from the local ranker
+                with span("rank"):
+                    recommendations = local_recommendations(store, flag, cid)
+            return Response(recommendations, status=status.HTTP_200_OK)
+
+        except Overloaded as e:
+            return overloaded_response(e)
+        except Exception as e:
+            return Response(EMPTY_RECOMMENDATIONS, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class SimilarCustomersView(APIView):
+    """Returns the customers most similar to a CID and what they have in common."""
+
+    def post(self, request):
+        cid = request.data.get('message', '')
+        store = get_store()
+        if not cid or store.customer(cid) is None:
+            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            k = max(1, min(int(request.data.get('k', 5)), 50))
+        except (TypeError, ValueError):
+            return Response({"error": "k must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        profile = peer_profile(store, cid, k=k)
+        return Response({
+            'similar': [
+                {'cid': peer, 'name': store.customer(peer)['NAME'], 'score': round(score, 4)}
+                for peer, score in profile['similar']
+            ],
+            'preferences': profile['preferences'],
+            'transaction_types': profile['transaction_types'],
+        }, status=status.HTTP_200_OK)
+
+
+class AsyncAdaptiveRecommenderView(View):
+    """Async version of AdaptiveRecommenderView for ASGI deployments."""
+
+    async def post(self, request):
+        try:
+            data = read_body(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            flag = data.get('flag', '')
+            cid = data.get('message', '')
+            with span("data_load"):
+                store = get_store()
+
+            if data.get('mode') == 'local':
+                with span("rank"):
+                    recommendations = await aread(local_recommendations, store, flag, cid)
             else:
-                query = (f"You are a bank. Financial services provided to the {cname} are {services},"
-                f"financial products for the {cname} are {products}."
-                f"For the {cname} as {record} with transactions {txn}."
-                f"Select three distinct best matches from the service as well as product."
-                f"Generate json strictly with only two keys 'services' and 'products' without extra fields.")
-
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=query
-            )
-
-            if response and response.candidates:
-                candidate = response.candidates[0]
-                response_text = "".join([part.text for part in candidate.content.parts if part.text])
-                
-                # Extract clean JSON using regex
-                json_match = re.search(r'\{[^}]*"services":[^}]*"products":[^}]*\}', response_text)
-                
-                if json_match:
-                    try:
-                        # Parse and validate the extracted JSON
-                        clean_json_str = json_match.group(0)
-                        parsed_data = json.loads(clean_json_str)
-                        
-                        # Ensure the parsed data has the correct structure
-                        if 'services' in parsed_data and 'products' in parsed_data:
-                            return Response(parsed_data, status=status.HTTP_200_OK)
-                    except (json.JSONDecodeError, ValueError):
-                        pass
-                
-                # Fallback error response
-                return Response({
-                    'services': [],
-                    'products': []
-                }, status=status.HTTP_200_OK)
+                with span("serving_lookup"):
+                    recommendations = await aserve_precomputed(store, "adr", cid, flag)
+            if recommendations is None:
+                with span("prompt_build"):
+                    query = await aread(build_query, store, flag, cid)
+                try:
+                    answer = await agenerate_structured("adr", query, Recommendations, tags=(cid,))
+                    recommendations = answer.model_dump()
+                except (CircuitOpen, StructuredOutputError):
+                    with span("rank"):
+                        recommendations = await aread(local_recommendations, store, flag, cid)
+
+            with span("serialize"):
+                return JsonResponse(recommendations, status=status.HTTP_200_OK)
 
+        except Overloaded as e:
+            return overloaded_response(e)
         except Exception as e:
-            return Response({
-                'services': [],
-                'products': []
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return JsonResponse(EMPTY_RECOMMENDATIONS, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AdaptiveRecommenderBatchView(APIView):
+    """
+    Recommendations for many CIDs per call, streamed as NDJSON: one line per
+    CID, in the order groups finish. Unknown CIDs and failed groups get an
+    'error' line instead of failing the batch.
+    """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
+    def post(self, request):
+        cids, batch_size, error = parse_batch_request(request.data)
+        if error:
+            return Response(error[0], status=error[1])
+
+        store = get_store()
+        flag = request.data.get('flag', '')
+        if request.data.get('mode') == 'local':
+            handle = partial(local_batch, store, flag)
+        else:
+            handle = partial(recommend_group, store, flag)
+        return ndjson_response(run_batches(chunked(cids, batch_size), handle))
+
+
+class AsyncAdaptiveRecommenderBatchView(View):
+    """Async version of AdaptiveRecommenderBatchView for ASGI deployments."""
+
+    async def post(self, request):
+        try:
+            data = read_body(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        cids, batch_size, error = parse_batch_request(data)
+        if error:
+            return JsonResponse(error[0], status=error[1])
+
+        store = get_store()
+        flag = data.get('flag', '')
+        if data.get('mode') == 'local':
+            async def handle(group):
+                return await aread(local_batch, store, flag, group)
+        else:
+            handle = partial(arecommend_group, store, flag)
+        return ndjson_response(arun_batches(chunked(cids, batch_size), handle))
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +40,9 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "rest_framework",
     "corsheaders",
+    "dataStore",
+    "llmGateway",
+    "telemetry",
     "chatbot",
     "imageGen",
     "adaptiveRecommender",
@@ -47,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "telemetry.middleware.TimingMiddleware",
+    "llmGateway.middleware.DeadlineMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -84,6 +90,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "backend.wsgi.application"
 
+# Serve the async API views; enable when running under ASGI (e.g. uvicorn backend.asgi:application)
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "False").lower() in ("1", "true")
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -136,3 +145,172 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Customer data files (individual.dat, transaction.dat, ...)
+
+DATA_DIR = BASE_DIR / "data"
+
+# Memory-mapped columnar copy of DATA_DIR, built by `manage.py compiledata`
+COLUMNAR_DATA_DIR = DATA_DIR / "columnar"
+
+# Customer feature matrices for nearest-neighbour search, built by `manage.py buildfeatures`
+FEATURE_INDEX_DIR = DATA_DIR / "features"
+
+# Load the customer data store when the app registry is ready
+DATA_STORE_PRELOAD = True
+
+# Append-only log of new recent transactions, replayed over txnadapt.dat and
+# tailed by every worker at most this often. POST /api/transactions/ is
+# enabled only when TRANSACTION_INGEST_TOKEN is set (sent as a Bearer token);
+# `manage.py ingesttxns` always works.
+TRANSACTION_LOG_PATH = DATA_DIR / "txnadapt.log"
+TRANSACTION_LOG_POLL_SECONDS = 1.0
+TRANSACTION_INGEST_TOKEN = os.getenv("TRANSACTION_INGEST_TOKEN")
+
+# Where views read a single customer's record, transactions and catalogs:
+# "files" (the store above) or "database" (the dataStore tables, filled by
+# `manage.py loaddb`; ingested transactions are always inserted there too).
+# Transaction summaries and peer profiles come from the store either way.
+CUSTOMER_DATA_SOURCE = os.getenv("CUSTOMER_DATA_SOURCE", "files")
+
+# Number of locally ranked services and products sent to the model by /api/adr/
+# (0 sends the whole catalog)
+RECOMMENDER_SHORTLIST_SIZE = 10
+
+# Number of similar customers summarized into recommendation prompts (0 disables)
+RECOMMENDER_PEER_COUNT = 10
+
+# Send transaction aggregates instead of raw transaction lists, within a prompt token budget
+RECOMMENDER_SUMMARIZE_TRANSACTIONS = True
+RECOMMENDER_PROMPT_TOKEN_BUDGET = 1500
+
+# Batch endpoints (/api/adr/batch/, /api/cdr/batch/): customers per prompt,
+# prompts in flight per request, and CIDs accepted per request
+RECOMMENDER_BATCH_SIZE = 10
+RECOMMENDER_BATCH_CONCURRENCY = 4
+RECOMMENDER_BATCH_MAX_CIDS = 1000
+
+# Precomputed adr/cdr results filled by `manage.py precompute` and served
+# before live generation (None disables the lookup)
+SERVING_TABLE_PATH = DATA_DIR / "serving.sqlite3"
+
+# Generated images, re-encoded with Pillow and stored on disk under the hash
+# of their bytes (see imageGen/cache.py); PATH None disables the cache.
+# RESPONSE is what POST /api/imageGen/ returns unless the request picks one:
+# "base64" inlines the image, "url" only links to GET /api/images/<hash>.<ext>,
+# which is served with an ETag and a long max-age.
+IMAGE_CACHE = {
+    "PATH": DATA_DIR / "images",
+    "MAX_BYTES": 256 * 1024 * 1024,
+    "FORMAT": "WEBP",
+    "QUALITY": 80,
+    "MAX_SIZE": 768,
+    "RESPONSE": "base64",
+}
+
+# Speculative image generation (see imageGen/generation.py): when ENABLED,
+# /api/cdr/ starts generating the image of its first title on one of WORKERS
+# threads, so the client's /api/imageGen/ call finds it cached or in flight.
+# At most MAX_PENDING jobs wait to be claimed; one unclaimed after
+# CLAIM_TIMEOUT seconds is cancelled. It spends an image call on every cdr
+# answer, so enable it where clients do ask for the image.
+SPECULATIVE_IMAGES = {
+    "ENABLED": False,
+    "WORKERS": 2,
+    "MAX_PENDING": 32,
+    "CLAIM_TIMEOUT": 120,
+}
+
+# Chatbot conversation memory per signed session_id (see chatbot/memory.py):
+# the history sent with each message stays within TOKEN_BUDGET, older turns
+# being compacted into a summary of at most SUMMARY_TOKENS. Without PATH,
+# conversations live in one process (at most MAX_SESSIONS, LRU), which only
+# suits a single worker; with PATH, every turn is written to that SQLite file
+# and shared by all workers. Sessions idle for TTL seconds are forgotten.
+CHAT_MEMORY = {
+    "MAX_SESSIONS": 1000,
+    "TOKEN_BUDGET": 1500,
+    "SUMMARY_TOKENS": 300,
+    "TTL": 3600,
+    "PATH": DATA_DIR / "chat_sessions.sqlite3",
+}
+
+# Gemini response cache: bounded in-memory LRU plus an optional on-disk tier.
+# TTLs are in seconds per endpoint; 0 disables caching for that endpoint.
+
+LLM_CACHE = {
+    "MAX_ENTRIES": 1024,
+    "MAX_BYTES": 64 * 1024 * 1024,
+    "DISK_PATH": None,
+    "TTL": {
+        "chat": 300,
+        "adr": 3600,
+        "cdr": 3600,
+        "idr": 900,
+        "graph": 900,
+        "image": 86400,
+    },
+}
+
+# Admission control for Gemini calls (see llmGateway/scheduler.py). Endpoints
+# map to priority classes (0 runs first); each class has a bounded queue and a
+# timeout in seconds, queueing included. Models get a concurrency cap and a
+# token bucket refilled at RPM requests per minute (0: no rate limit);
+# "default" covers the rest.
+# Speculative image jobs run in the last class with a small queue, so they
+# never take queue places from requested images.
+LLM_SCHEDULER = {
+    "ENABLED": True,
+    "PRIORITY": {"chat": 0, "adr": 1, "cdr": 1, "idr": 2, "graph": 2, "image": 3, "image_speculative": 4},
+    "QUEUE_LIMIT": {0: 64, 1: 128, 2: 16, 3: 8, 4: 2},
+    "TIMEOUT": {0: 20, 1: 60, 2: 60, 3: 90, 4: 90},
+    "MODELS": {
+        "default": {"CONCURRENCY": 16, "RPM": 1000, "BURST": 20},
+        "gemini-2.0-flash-exp-image-generation": {"CONCURRENCY": 4, "RPM": 60, "BURST": 4},
+    },
+}
+
+# Circuit breaker per Gemini model (see llmGateway/breaker.py): after
+# FAILURE_THRESHOLD consecutive failures calls fail fast for COOLDOWN seconds
+# and views answer from local data. TIMEOUT is the per-endpoint limit, in
+# seconds, after which an upstream call is abandoned and counted as failed.
+LLM_BREAKER = {
+    "ENABLED": True,
+    "FAILURE_THRESHOLD": 5,
+    "COOLDOWN": 30,
+    "TIMEOUT": {"chat": 15, "adr": 10, "cdr": 10, "idr": 20, "graph": 20, "image": 45, "image_speculative": 45},
+}
+
+# JSON answers of adr and cdr are generated against a pydantic schema and
+# validated (see llmGateway/structured.py). An invalid answer is retried with
+# its validation errors at most RETRIES times, then the view answers locally.
+LLM_STRUCTURED_OUTPUT = {
+    "RETRIES": 1,
+}
+
+# Timeout for Gemini requests made through the shared client, in milliseconds
+GEMINI_TIMEOUT_MS = 60000
+
+# "gemini" calls the real API; "fake" answers locally with canned responses
+# (see llmGateway/fake.py), for benchmarks and tests
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "gemini")
+
+FAKE_GEMINI = {
+    "LATENCY_MS": int(os.getenv("FAKE_GEMINI_LATENCY_MS", "0")),
+    "JITTER_MS": 0,
+    "TEXT_CHARS": 600,
+    "IMAGE_BYTES": 64 * 1024,
+    "STREAM_CHUNKS": 8,
+}
+
+# Request timing, stage spans and the Prometheus endpoint at /api/metrics/.
+# With PROFILING on, requests sent with an X-Profile header are sampled and
+# their folded stacks written to PROFILE_DIR.
+TELEMETRY = {
+    "ENABLED": True,
+    "SIGNIFICANT_DIGITS": 2,
+    "SERVER_TIMING": True,
+    "PROFILING": os.getenv("TELEMETRY_PROFILING", "False").lower() in ("1", "true"),
+    "PROFILE_INTERVAL_MS": 5,
+    "PROFILE_DIR": BASE_DIR / "profiles",
+}
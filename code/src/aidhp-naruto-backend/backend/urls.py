@@ -24,5 +24,7 @@ urlpatterns = [
     path('api/',include('adaptiveRecommender.urls')),
     path('api/',include('contentRecommender.urls')),
     path('api/',include('insightRecommender.urls')),
-    path('api/',include('graphCreator.urls'))
+    path('api/',include('graphCreator.urls')),
+    path('api/',include('telemetry.urls')),
+    path('api/',include('dataStore.urls'))
 ]
\ No newline at end of file
@@ -0,0 +1,257 @@
+"""
+Per-session conversation memory for the chatbot.
+
+A ``Conversation`` holds the latest turns verbatim and a rolling summary of
+older ones, within a strict token budget (CHAT_MEMORY["TOKEN_BUDGET"]). When
+a new turn pushes it over, the oldest turns are compacted into one-line
+summaries, and the oldest summary lines are dropped once the summary
+outgrows SUMMARY_TOKENS. Compaction is local, so it never costs a model
+call, and prompts stay bounded however long a chat runs.
+
+Session IDs are issued by the server and signed, so a client can only
+continue its own sessions. ``SessionStore`` keeps conversations in an LRU of
+at most MAX_SESSIONS in this process, which only suits a single worker. With
+PATH set, every turn is written through to an SQLite file that all worker
+processes read, so consecutive turns may land on any worker. A session idle
+for longer than TTL seconds is forgotten.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+
+from dataStore.summaries import estimate_tokens
+from telemetry.metrics import registry
+
+DEFAULT_MEMORY_SETTINGS = {
+    "MAX_SESSIONS": 1000,
+    "TOKEN_BUDGET": 1500,
+    "SUMMARY_TOKENS": 300,
+    "TTL": 3600,
+    "PATH": None,
+}
+
+signer = signing.Signer(salt="chatbot.session")
+# Tokens kept of each side of a turn when it is compacted into a summary line
+QUESTION_TOKENS = 30
+ANSWER_TOKENS = 50
+HEADER_TOKENS = 20
+
+
+def memory_settings():
+    return {**DEFAULT_MEMORY_SETTINGS, **getattr(settings, "CHAT_MEMORY", {})}
+
+
+def new_session_id():
+    return signer.sign(uuid.uuid4().hex)
+
+
+def check_session_id(session_id):
+    """Returns a session ID issued by ``new_session_id``; raises ValueError for any other value."""
+    if not isinstance(session_id, str) or len(session_id) > 128:
+        raise ValueError("Invalid session_id.")
+    try:
+        signer.unsign(session_id)
+    except signing.BadSignature:
+        raise ValueError("Invalid session_id.") from None
+    return session_id
+
+
+def clip(text, tokens):
+    """The first sentence of ``text``, cut to about ``tokens`` tokens."""
+    text = " ".join(str(text).split())
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    limit = tokens * 4
+    return sentence if len(sentence) <= limit else sentence[:limit - 3].rstrip() + "..."
+
+
+class Conversation:
+    """Recent turns plus a rolling summary of earlier ones, within a token budget."""
+
+    def __init__(self, budget, summary_tokens, turns=(), summary=(), touched=None):
+        self.budget = budget
+        self.summary_tokens = summary_tokens
+        self.turns = [tuple(turn) for turn in turns]
+        self.summary = list(summary)
+        self.touched = touched or time.time()
+        self.lock = threading.Lock()
+
+    def tokens(self):
+        return estimate_tokens(self.history())
+
+    def add(self, question, answer):
+        """Records a turn, then compacts the oldest turns until the history fits the budget."""
+        with self.lock:
+            # A single turn never gets more than what is left beside a full summary and the headers
+            room = max(1, self.budget - self.summary_tokens - HEADER_TOKENS) * 4
+            question = question[:room // 2]
+            self.turns.append((question, answer[:room - len(question)]))
+            self.touched = time.time()
+            compacted = 0
+            while len(self.turns) > 1 and self.tokens() > self.budget:
+                question, answer = self.turns.pop(0)
+                self.summary.append(f"- Asked: {clip(question, QUESTION_TOKENS)} Advised: {clip(answer, ANSWER_TOKENS)}")
+                compacted += 1
+                while len(self.summary) > 1 and estimate_tokens("\n".join(self.summary)) > self.summary_tokens:
+                    self.summary.pop(0)
+            while self.summary and self.tokens() > self.budget:
+                self.summary.pop(0)
+        if compacted:
+            registry.increment("aidhp_chat_memory_total", compacted, event="compacted")
+
+    def history(self):
+        """The conversation so far as prompt text, or '' for a new session."""
+        parts = []
+        if self.summary:
+            parts.append("Summary of the earlier conversation:\n" + "\n".join(self.summary))
+        if self.turns:
+            parts.append("Recent conversation:\n" + "\n".join(
+                f"User: {question}\nAdvisor: {answer}" for question, answer in self.turns
+            ))
+        return "\n".join(parts)
+
+    def state(self):
+        return {"turns": self.turns, "summary": self.summary, "touched": self.touched}
+
+
+class SessionFile:
+    """SQLite file holding every conversation, shared by all worker processes."""
+
+    def __init__(self, path, max_sessions):
+        self.path = str(path)
+        self.max_sessions = max_sessions
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, state TEXT NOT NULL, touched REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched)")
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, session_id, expires_before):
+        """Returns the stored state of a live session, or None."""
+        row = self.connection().execute(
+            "SELECT state FROM sessions WHERE id = ? AND touched >= ?", (session_id, expires_before),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, session_id, conversation, expires_before):
+        """Writes a session, then drops expired ones and the least recently used past ``max_sessions``."""
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, touched) VALUES (?, ?, ?)",
+                (session_id, json.dumps(conversation.state()), conversation.touched),
+            )
+            expired = conn.execute("DELETE FROM sessions WHERE touched < ?", (expires_before,)).rowcount
+            evicted = conn.execute(
+                "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY touched DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            ).rowcount
+        return expired, evicted
+
+
+class SessionStore:
+    """Conversations by session ID: an LRU in this process, or the SQLite file at PATH."""
+
+    def __init__(self, options):
+        self.options = options
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.file = SessionFile(options["PATH"], options["MAX_SESSIONS"]) if options["PATH"] else None
+
+    def new_conversation(self, state=None):
+        state = state or {}
+        return Conversation(
+            self.options["TOKEN_BUDGET"], self.options["SUMMARY_TOKENS"],
+            state.get("turns", ()), state.get("summary", ()), state.get("touched"),
+        )
+
+    def expires_before(self, now):
+        return now - self.options["TTL"]
+
+    def get(self, session_id):
+        """Returns the conversation of a known, live session, or None."""
+        now = time.time()
+        if self.file is not None:
+            state = self.file.get(session_id, self.expires_before(now))
+            return self.new_conversation(state) if state is not None else None
+        with self.lock:
+            conversation = self.sessions.get(session_id)
+            if conversation is None:
+                return None
+            if conversation.touched < self.expires_before(now):
+                del self.sessions[session_id]
+                registry.increment("aidhp_chat_memory_total", event="expired")
+                return None
+            self.sessions.move_to_end(session_id)
+            return conversation
+
+    def create(self):
+        """
+        Starts a session; returns (session_id, conversation). Nothing is
+        stored until ``add`` records its first answer, so requests that fail
+        never take a place among MAX_SESSIONS.
+        """
+        return new_session_id(), self.new_conversation()
+
+    def add(self, session_id, conversation, question, answer):
+        """Records a turn of a session and writes the session back, storing a new one."""
+        conversation.add(question, answer)
+        self.save(session_id, conversation)
+
+    def save(self, session_id, conversation):
+        if self.file is not None:
+            expired, evicted = self.file.put(session_id, conversation, self.expires_before(time.time()))
+            if expired:
+                registry.increment("aidhp_chat_memory_total", expired, event="expired")
+        else:
+            evicted = self.remember(session_id, conversation)
+        if evicted:
+            registry.increment("aidhp_chat_memory_total", evicted, event="evicted")
+
+    def remember(self, session_id, conversation):
+        """Puts a session at the head of the in-process LRU; returns the number evicted."""
+        with self.lock:
+            self.sessions[session_id] = conversation
+            self.sessions.move_to_end(session_id)
+            evicted = 0
+            while len(self.sessions) > self.options["MAX_SESSIONS"]:
+                self.sessions.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+_sessions = None
+_sessions_lock = threading.Lock()
+
+
+def get_sessions():
+    """Returns the process-wide session store, rebuilt when CHAT_MEMORY changes."""
+    global _sessions
+    options = memory_settings()
+    if _sessions is None or _sessions.options != options:
+        with _sessions_lock:
+            if _sessions is None or _sessions.options != options:
+                _sessions = SessionStore(options)
+    return _sessions
+
+
+registry.describe("aidhp_chat_memory_total", "Chat session memory events (compacted turns, evictions, expiries)")
@@ -1,3 +1,232 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import AsyncRequestFactory, TestCase, override_settings
+
+from llmGateway.cache import get_cache
+from llmGateway.client import TEXT_MODEL
+from llmGateway.scheduler import Overloaded, get_scheduler
+from telemetry.metrics import registry
+
+from .memory import SessionFile, SessionStore, get_sessions, new_session_id
+from .views import AsyncFinanceChatbotView
+
+
+def chunk(text):
+    part = SimpleNamespace(text=text)
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+class UpstreamStream:
+    """Minimal stand-in for the generator returned by generate_content_stream."""
+
+    def __init__(self, texts):
+        self.texts = iter(texts)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return chunk(next(self.texts))
+
+    def close(self):
+        self.closed = True
+
+
+# Sessions stay in this process, not in the data directory
+@override_settings(CHAT_MEMORY={"PATH": None})
+class FinanceChatbotStreamingTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.upstream = UpstreamStream(["Save ", "early."])
+        self.calls = []
+
+        def generate_content_stream(**kwargs):
+            self.calls.append(kwargs)
+            return self.upstream
+
+        client = SimpleNamespace(models=SimpleNamespace(generate_content_stream=generate_content_stream))
+        patcher = mock.patch("llmGateway.gateway.get_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_streams_chunks_then_disclaimer(self):
+        response = self.client.post(
+            "/api/chat/", {"message": "budget tips", "stream": True}, content_type="application/json"
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join(response.streaming_content).decode()
+        self.assertIn('data: {"text": "Save "}', body)
+        self.assertIn("event: disclaimer", body)
+        self.assertTrue(body.endswith("event: done\ndata: {}\n\n"))
+        self.assertTrue(self.upstream.closed)
+
+    def test_empty_stream_is_not_cached(self):
+        self.upstream.texts = iter([])
+        response = self.client.post(
+            "/api/chat/", {"message": "budget tips", "stream": True}, content_type="application/json"
+        )
+        b"".join(response.streaming_content)
+        self.upstream = UpstreamStream(["Save ", "early."])
+        body = b"".join(self.client.post(
+            "/api/chat/", {"message": "budget tips", "stream": True}, content_type="application/json"
+        ).streaming_content).decode()
+        self.assertIn('data: {"text": "Save "}', body)
+
+    def test_request_deadline_reaches_the_stream(self):
+        response = self.client.post(
+            "/api/chat/", {"message": "budget tips", "stream": True}, content_type="application/json",
+            HTTP_X_REQUEST_TIMEOUT="5",
+        )
+        b"".join(response.streaming_content)
+        self.assertLessEqual(self.calls[0]["config"].http_options.timeout, 5000)
+
+    def test_unread_response_frees_its_slot(self):
+        response = self.client.post(
+            "/api/chat/", {"message": "budget tips", "stream": True}, content_type="application/json"
+        )
+        self.assertEqual(get_scheduler().lane(TEXT_MODEL).stats()["active"], 1)
+        response.close()
+        self.assertEqual(get_scheduler().lane(TEXT_MODEL).stats()["active"], 0)
+        self.assertEqual(self.calls, [])
+
+    def test_disconnect_closes_upstream(self):
+        response = self.client.post(
+            "/api/chat/", {"message": "budget tips"}, content_type="application/json",
+            HTTP_ACCEPT="text/event-stream",
+        )
+        events = iter(response.streaming_content)
+        self.assertIn(b"event: session", next(events))
+        next(events)
+        response.close()
+        self.assertTrue(self.upstream.closed)
+
+
+@override_settings(CHAT_MEMORY={"MAX_SESSIONS": 10, "TOKEN_BUDGET": 200, "SUMMARY_TOKENS": 60, "PATH": None})
+class ChatMemoryTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            "chatbot.views.generate_text", side_effect=lambda endpoint, prompt: f"Advice {len(prompt)}. More follows."
+        )
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def chat(self, message, session_id=None):
+        data = {"message": message}
+        if session_id is not None:
+            data["session_id"] = session_id
+        return self.client.post("/api/chat/", data, content_type="application/json")
+
+    def test_follow_up_sees_earlier_turn(self):
+        session_id = self.chat("Should I open a savings account?").data["session_id"]
+        self.assertEqual(self.chat("How much should I put in it?", session_id).data["session_id"], session_id)
+        prompt = self.generate.call_args.args[1]
+        self.assertIn("User: Should I open a savings account?", prompt)
+        self.assertIn("How much should I put in it?", prompt)
+
+        self.chat("Unrelated question")
+        self.assertNotIn("Recent conversation", self.generate.call_args.args[1])
+
+    def test_history_stays_within_budget(self):
+        session_id = self.chat("Start").data["session_id"]
+        for i in range(40):
+            self.chat(f"Question {i} about mortgages and " + "rates " * 30, session_id)
+        conversation = get_sessions().get(session_id)
+        self.assertLessEqual(conversation.tokens(), 200)
+        self.assertTrue(conversation.summary)
+        self.assertTrue(conversation.summary[-1].startswith("- Asked: Question"))
+        self.assertGreater(registry.counters[("aidhp_chat_memory_total", (("event", "compacted"),))], 0)
+
+    def test_evicted_session_starts_over_under_a_new_id(self):
+        with override_settings(CHAT_MEMORY={"MAX_SESSIONS": 1, "TOKEN_BUDGET": 200, "SUMMARY_TOKENS": 60, "PATH": None}):
+            first = self.chat("Is gold a good hedge?").data["session_id"]
+            self.chat("Other customer")
+            self.assertEqual(len(get_sessions()), 1)
+            response = self.chat("And silver?", first)
+        self.assertNotEqual(response.data["session_id"], first)
+        self.assertNotIn("gold", self.generate.call_args.args[1])
+
+    def test_workers_share_sessions_through_the_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            options = {"MAX_SESSIONS": 10, "TOKEN_BUDGET": 200, "SUMMARY_TOKENS": 60, "TTL": 3600,
+                       "PATH": os.path.join(tmp, "sessions.sqlite3")}
+            with override_settings(CHAT_MEMORY=options):
+                session_id = self.chat("Is gold a good hedge?").data["session_id"]
+                # Another worker process has its own store over the same file
+                other = SessionStore(options)
+                conversation = other.get(session_id)
+                self.assertEqual(conversation.turns[0][0], "Is gold a good hedge?")
+                other.add(session_id, conversation, "And silver?", "Less so.")
+                self.chat("And platinum?", session_id)
+            self.assertIn("User: And silver?", self.generate.call_args.args[1])
+
+    def test_only_issued_session_ids_are_accepted(self):
+        for forged in ("../etc", "aaaaaaaa", "0123456789abcdef0123456789abcdef:forged"):
+            self.assertEqual(self.chat("Hello", forged).status_code, 400)
+        self.generate.assert_not_called()
+
+        # Signed by this server but unknown here: a new session
+        unknown = new_session_id()
+        response = self.chat("Hello", unknown)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data["session_id"], unknown)
+
+    @override_settings(CHAT_MEMORY={"MAX_SESSIONS": 5, "TOKEN_BUDGET": 200, "SUMMARY_TOKENS": 60, "PATH": None})
+    def test_sessions_are_stored_after_an_answer(self):
+        stored = len(get_sessions())
+        self.generate.side_effect = Overloaded("Too many pending requests.")
+        self.assertEqual(self.chat("Hello").status_code, 429)
+        self.generate.side_effect = RuntimeError("upstream down")
+        self.assertEqual(self.chat("Hello").status_code, 500)
+        self.assertEqual(len(get_sessions()), stored)
+
+        self.generate.side_effect = lambda endpoint, prompt: "Advice."
+        session_id = self.chat("Hello").data["session_id"]
+        self.assertEqual(len(get_sessions()), stored + 1)
+        self.assertIsNotNone(get_sessions().get(session_id))
+
+    def test_stream_flag_is_parsed_strictly(self):
+        response = self.client.post("/api/chat/", {"message": "Hello", "stream": "false"}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("message", response.data)
+        response = self.client.post("/api/chat/", {"message": "Hello", "stream": "maybe"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.generate.call_count, 1)
+
+    def test_upstream_value_errors_are_server_errors(self):
+        self.generate.side_effect = ValueError("bad upstream payload")
+        self.assertEqual(self.chat("Hello").status_code, 500)
+
+    async def test_async_view_keeps_session_io_off_the_event_loop(self):
+        on_loop = []
+
+        def recording(method):
+            def wrapper(*args, **kwargs):
+                on_loop.append(asyncio._get_running_loop() is not None)
+                return method(*args, **kwargs)
+            return wrapper
+
+        with tempfile.TemporaryDirectory() as tmp:
+            options = {"MAX_SESSIONS": 10, "TOKEN_BUDGET": 200, "SUMMARY_TOKENS": 60,
+                       "PATH": os.path.join(tmp, "sessions.sqlite3")}
+            with override_settings(CHAT_MEMORY=options), \
+                    mock.patch("chatbot.views.agenerate_text", mock.AsyncMock(return_value="Diversify.")), \
+                    mock.patch.object(SessionFile, "get", recording(SessionFile.get)), \
+                    mock.patch.object(SessionFile, "put", recording(SessionFile.put)):
+                view = AsyncFinanceChatbotView.as_view()
+                first = await view(AsyncRequestFactory().post(
+                    "/api/chat/", json.dumps({"message": "Is gold a good hedge?"}), content_type="application/json"
+                ))
+                session_id = json.loads(first.content)["session_id"]
+                second = await view(AsyncRequestFactory().post(
+                    "/api/chat/", json.dumps({"message": "And silver?", "session_id": session_id}),
+                    content_type="application/json",
+                ))
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(on_loop)
+        self.assertFalse(any(on_loop))
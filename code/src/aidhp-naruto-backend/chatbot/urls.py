@@ -1,6 +1,14 @@
+from django.conf import settings
 from django.urls import path
-from .views import FinanceChatbotView
+from django.views.decorators.csrf import csrf_exempt
+from .views import AsyncFinanceChatbotView, FinanceChatbotView
+
+# Async views hold a coroutine, not a worker thread, per in-flight Gemini call
+if settings.ASYNC_VIEWS:
+    view = csrf_exempt(AsyncFinanceChatbotView.as_view())
+else:
+    view = FinanceChatbotView.as_view()
 
 urlpatterns = [
-    path('chat/', FinanceChatbotView.as_view(), name='finance_chatbot'),
+    path('chat/', view, name='finance_chatbot'),
 ]
\ No newline at end of file
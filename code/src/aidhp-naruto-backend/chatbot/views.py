@@ -1,37 +1,220 @@
 # chatbot/views.py
-import os
+import json
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import google.generativeai as genai
-from dotenv import load_dotenv
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from llmGateway.gateway import agenerate_text, astream_text, generate_text, stream_text
+from llmGateway.scheduler import Overloaded, overloaded_response
+from .memory import check_session_id, get_sessions
+
+DISCLAIMER = "\n\n⚠️ DISCLAIMER: This is general financial advice. " \
+             "Investment decisions carry risk. Always consult a professional financial advisor " \
+             "before making any financial decisions. We are not responsible for any financial losses."
+
+
+def build_prompt(user_input, history=""):
+    if not history:
+        return f"You are a financial advisor chatbot. Provide professional advice for this query: {user_input}"
+    return (f"You are a financial advisor chatbot.\n{history}\n"
+            f"Continuing this conversation, provide professional advice for this query: {user_input}")
+
+
+def session_conversation(data):
+    """
+    Returns (session_id, conversation) for a request. A request without a
+    session_id, or with one that expired or was evicted, starts a new
+    session under a fresh ID, stored once it has an answer; raises
+    ValueError for IDs the server never issued.
+    """
+    session_id = data.get('session_id')
+    if session_id:
+        conversation = get_sessions().get(check_session_id(session_id))
+        if conversation is not None:
+            return session_id, conversation
+    return get_sessions().create()
+
+
+def parse_stream(value):
+    """The stream flag as a bool; the strings "false" and "0" do not ask for a stream."""
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("1", "true", "yes"):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ("0", "false", "no"):
+        return False
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    raise ValueError("stream must be true or false.")
+
+
+def wants_stream(request, data):
+    """
+    Streaming is requested with {"stream": true} or an Accept:
+    text/event-stream header; raises ValueError for other stream values.
+    """
+    return parse_stream(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def stream_events(chunks, user_input, session_id, conversation):
+    """
+    Yields an opened answer stream as Server-Sent Events: a 'session' event,
+    one 'message' event per chunk, then a 'disclaimer' event and a 'done'
+    event. A complete answer is added to the conversation. If the client
+    disconnects the server closes this generator, which closes the stream.
+    """
+    try:
+        yield sse_event({'session_id': session_id}, event='session')
+        answer = []
+        for chunk in chunks:
+            answer.append(chunk)
+            yield sse_event({'text': chunk})
+        get_sessions().add(session_id, conversation, user_input, "".join(answer))
+        yield sse_event({'text': DISCLAIMER}, event='disclaimer')
+        yield sse_event({}, event='done')
+    except Exception as e:
+        yield sse_event({'error': str(e)}, event='error')
+    finally:
+        chunks.close()
+
+
+async def astream_events(chunks, user_input, session_id, conversation):
+    """Async version of stream_events; a disconnect cancels the upstream stream."""
+    try:
+        yield sse_event({'session_id': session_id}, event='session')
+        answer = []
+        async for chunk in chunks:
+            answer.append(chunk)
+            yield sse_event({'text': chunk})
+        await sync_to_async(get_sessions().add)(session_id, conversation, user_input, "".join(answer))
+        yield sse_event({'text': DISCLAIMER}, event='disclaimer')
+        yield sse_event({}, event='done')
+    except Exception as e:
+        yield sse_event({'error': str(e)}, event='error')
+    finally:
+        await chunks.aclose()
+
+
+class EventStream:
+    """
+    SSE events over an answer stream. Closing the response closes the answer
+    stream too, so its scheduler slot is freed even if no event was sent.
+    """
+
+    def __init__(self, events, chunks):
+        self.events = events
+        self.chunks = chunks
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        self.events.close()
+        self.chunks.close()
+
+
+class AsyncEventStream(EventStream):
+    def __iter__(self):
+        raise TypeError("AsyncEventStream is consumed with async for.")
+
+    def __aiter__(self):
+        return self.events
+
+    def close(self):
+        # A started events generator closes the stream itself
+        self.chunks.close()
+
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets DRF accept text/event-stream requests; errors are rendered as one SSE event."""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event(data, event='error').encode('utf-8')
 
-# Load environment variables
-load_dotenv()
 
 class FinanceChatbotView(APIView):
-    def __init__(self):
-        # Configure Gemini API
-        genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
 
     def post(self, request):
+        user_input = request.data.get('message', '')
         try:
-            user_input = request.data.get('message', '')
-            
-            response = self.model.generate_content(
-                f"You are a financial advisor chatbot. Provide professional advice for this query: {user_input}"
-            )
-            
-            full_response = response.text + "\n\n⚠️ DISCLAIMER: This is general financial advice. " \
-                            "Investment decisions carry risk. Always consult a professional financial advisor " \
-                            "before making any financial decisions. We are not responsible for any financial losses."
-            
+            stream = wants_stream(request, request.data)
+            session_id, conversation = session_conversation(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if stream:
+                # Opening the stream takes the scheduler slot, so overload is still a 429/503
+                chunks = stream_text("chat", build_prompt(user_input, conversation.history()))
+                return event_stream_response(
+                    EventStream(stream_events(chunks, user_input, session_id, conversation), chunks)
+                )
+
+            response_text = generate_text("chat", build_prompt(user_input, conversation.history()))
+            get_sessions().add(session_id, conversation, user_input, response_text)
+
+            full_response = response_text + DISCLAIMER
+
             return Response({
-                'message': full_response
+                'message': full_response,
+                'session_id': session_id
             }, status=status.HTTP_200_OK)
-        
+
+        except Overloaded as e:
+            return overloaded_response(e)
         except Exception as e:
             return Response({
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncFinanceChatbotView(View):
+    """Async version of FinanceChatbotView for ASGI deployments."""
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b"{}")
+            user_input = data.get('message', '')
+            stream = wants_stream(request, data)
+            # The session file is SQLite: keep its reads and writes off the event loop
+            session_id, conversation = await sync_to_async(session_conversation)(data)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if stream:
+                chunks = await astream_text("chat", build_prompt(user_input, conversation.history()))
+                return event_stream_response(
+                    AsyncEventStream(astream_events(chunks, user_input, session_id, conversation), chunks)
+                )
+
+            response_text = await agenerate_text("chat", build_prompt(user_input, conversation.history()))
+            await sync_to_async(get_sessions().add)(session_id, conversation, user_input, response_text)
+
+            return JsonResponse(
+                {'message': response_text + DISCLAIMER, 'session_id': session_id}, status=status.HTTP_200_OK
+            )
+
+        except Overloaded as e:
+            return overloaded_response(e)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,52 @@
+from pydantic import BaseModel, ValidationError, field_validator
+
+
+class ContentLink(BaseModel):
+    """A piece of financial education content and where to find it."""
+    title: str
+    url: str
+
+    @field_validator("url")
+    @classmethod
+    def http_url(cls, url):
+        url = url.strip()
+        if not url.startswith(("http://", "https://")) or any(c.isspace() for c in url):
+            raise ValueError("must be an http(s) URL")
+        return url
+
+
+def valid_links(items):
+    """The items that validate as ``ContentLink``; one bad link does not reject the answer."""
+    if not isinstance(items, list):
+        return items
+    links = []
+    for item in items:
+        try:
+            links.append(ContentLink.model_validate(item))
+        except ValidationError:
+            continue
+    return links
+
+
+class ContentRecommendations(BaseModel):
+    links: list[ContentLink]
+
+    @field_validator("links", mode="before")
+    @classmethod
+    def drop_invalid(cls, links):
+        valid = valid_links(links)
+        if links and not valid:
+            # Nothing usable left: fail, so the model is asked again
+            raise ValueError("no link is a valid http(s) URL")
+        return valid
+
+
+class CustomerContent(BaseModel):
+    """One customer's entry in a batch answer; one left without links is answered locally."""
+    cid: str
+    links: list[ContentLink]
+
+    @field_validator("links", mode="before")
+    @classmethod
+    def drop_invalid(cls, links):
+        return valid_links(links)
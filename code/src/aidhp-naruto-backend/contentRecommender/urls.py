@@ -1,6 +1,20 @@
+from django.conf import settings
 from django.urls import path
-from .views import ContentRecommenderView
+from django.views.decorators.csrf import csrf_exempt
+from .views import (
+    AsyncContentRecommenderBatchView, AsyncContentRecommenderView,
+    ContentRecommenderBatchView, ContentRecommenderView,
+)
+
+# Async views hold a coroutine, not a worker thread, per in-flight Gemini call
+if settings.ASYNC_VIEWS:
+    view = csrf_exempt(AsyncContentRecommenderView.as_view())
+    batch_view = csrf_exempt(AsyncContentRecommenderBatchView.as_view())
+else:
+    view = ContentRecommenderView.as_view()
+    batch_view = ContentRecommenderBatchView.as_view()
 
 urlpatterns = [
-    path('cdr/', ContentRecommenderView.as_view(), name='content_recommender'),
-]
\ No newline at end of file
+    path('cdr/', view, name='content_recommender'),
+    path('cdr/batch/', batch_view, name='content_recommender_batch'),
+]
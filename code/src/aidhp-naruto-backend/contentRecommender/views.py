@@ -1,99 +1,253 @@
-import pickle
-from django.shortcuts import render
-import os
+import json
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import google.generativeai as genai
-from dotenv import load_dotenv
-import re
+from urllib.parse import quote_plus
+from dataStore.db import aread, get_records
+from dataStore.features import peer_profile
+from dataStore.serving import aserve_precomputed, serve_precomputed
+from dataStore.store import get_store
+from imageGen.generation import speculate
+from llmGateway.batch import NDJSONRenderer, arun_batches, chunked, ndjson_response, parse_batch_request, run_batches
+from llmGateway.breaker import CircuitOpen
+from llmGateway.scheduler import Overloaded, overloaded_response
+from llmGateway.structured import StructuredOutputError, agenerate_structured, generate_structured
+from .schemas import ContentLink, ContentRecommendations, CustomerContent
 
-# Load environment variables
-load_dotenv()
 
-class ContentRecommenderView(APIView):
+def find_customer(user_input):
+    """Returns (user_data, None) or (None, (error payload, status)) for a CID."""
+    if not user_input:
+        return None, ({"error": "Message is required."}, status.HTTP_400_BAD_REQUEST)
+
+    # Determine user data
+    if not user_input.startswith(('IND', 'ORG')):
+        return None, ({"error": "Invalid user ID format."}, status.HTTP_400_BAD_REQUEST)
+    user_data = get_records(get_store()).customer(user_input)
+
+    if not user_data:
+        return None, ({"error": "User not found."}, status.HTTP_404_NOT_FOUND)
+    return user_data, None
+
+
+CONTENT_RULES = (
+    "The content should include name of content and actual links to financial blogs, financial videos, financial courses, etc. present on web for financial education. "
+    "Do not give anything else than the list of name with a working link. Do not provide any other description of content and html tags. Generate only one link for each recommendation. "
+    "Give each recommendation as its 'title' and 'url'. "
+)
+
+
+def peer_interests(cid):
+    peer_count = getattr(settings, "RECOMMENDER_PEER_COUNT", 0)
+    if not peer_count:
+        return ""
+    profile = peer_profile(get_store(), cid, k=peer_count)
+    return f" Similar customers are also interested in: {', '.join(profile['preferences'])}."
+
+
+# Topic search on a financial education site, for content picked without the model
+LOCAL_CONTENT_URL = "https://www.investopedia.com/search?q={}"
+
+
+def local_content(cid, user_data, count=5):
+    """
+    Content recommendations from the customer's own preferences and
+    requirements, then those of similar customers, as education-site searches.
+    """
+    topics = []
+    for field in ('PREFERENCES', 'REQUIREMENTS'):
+        topics += [topic.strip() for topic in (user_data.get(field) or "").split(",")]
+    if getattr(settings, "RECOMMENDER_PEER_COUNT", 0):
+        topics += peer_profile(get_store(), cid, k=settings.RECOMMENDER_PEER_COUNT)['preferences']
+    topics = [topic for topic in dict.fromkeys(topics) if topic][:count]
+    return build_response([
+        ContentLink(title=f"{topic} explained", url=LOCAL_CONTENT_URL.format(quote_plus(topic))) for topic in topics
+    ])
+
+
+def build_prompt(cid, user_data):
+    return (
+        "System, generate a list of 5 personalized content recommendations from financial content for the given customer. "
+        f"{CONTENT_RULES}"
+        f"The customer details are: {user_data}"
+        f"{peer_interests(cid)}"
+    )
+
+
+def build_batch_prompt(customers):
+    """One prompt for a group of (cid, user_data) pairs, answered as a list of ``CustomerContent``."""
+    details = "\n".join(f"Customer {cid}: {user_data}{peer_interests(cid)}" for cid, user_data in customers)
+    return (
+        "System, generate a list of 5 personalized content recommendations from financial content for each of the given customers. "
+        f"{CONTENT_RULES}"
+        "Answer with one entry per customer, giving its customer ID as 'cid' and its 'links'. "
+        f"The customers are:\n{details}"
+    )
+
+
+def batch_results(answers, customers):
+    """
+    Splits a batch answer into one result per (cid, user_data) of
+    ``customers``, in their order; customers the answer left out, or left
+    without links, get ``local_content``.
+    """
+    by_cid = {answer.cid: answer for answer in answers}
+    results = []
+    for cid, user_data in customers:
+        response = build_response(by_cid[cid].links if cid in by_cid else [])
+        if not response['message']:
+            response = local_content(cid, user_data)
+        results.append({"cid": cid, **response})
+    return results
+
+
+def split_known(cids):
+    """Returns ([(cid, user_data)], [error results]) for a group of CIDs."""
+    customers, errors = [], []
+    for cid in cids:
+        user_data, error = find_customer(cid)
+        if error:
+            errors.append({"cid": cid, **error[0]})
+        else:
+            customers.append((cid, user_data))
+    return customers, errors
+
+
+def local_group(customers):
+    return [{"cid": cid, **local_content(cid, user_data)} for cid, user_data in customers]
+
+
+def recommend_group(group):
+    customers, results = split_known(group)
+    if customers:
+        cids = [cid for cid, _ in customers]
+        try:
+            answers = generate_structured("cdr", build_batch_prompt(customers), list[CustomerContent], tags=cids)
+        except (CircuitOpen, StructuredOutputError):
+            return results + local_group(customers)
+        results += batch_results(answers, customers)
+    return results
+
+
+async def arecommend_group(group):
+    customers, results = await aread(split_known, group)
+    if customers:
+        cids = [cid for cid, _ in customers]
+        try:
+            prompt = await aread(build_batch_prompt, customers)
+            answers = await agenerate_structured("cdr", prompt, list[CustomerContent], tags=cids)
+        except (CircuitOpen, StructuredOutputError):
+            return results + await aread(local_group, customers)
+        results += await aread(batch_results, answers, customers)
+    return results
+
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # Configure model once during initialization
-        self.BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        genai.configure(api_key='GEMINI_API_KEY')  
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
-        # Load data once
-        self.individuals = self.load_pickle_file("individual.dat")
-        self.organizations = self.load_pickle_file("organization.dat")
-
-    def load_pickle_file(self, filename):
-        """Utility method to load pickle files"""
-        file_path = os.path.join(self.BASE_DIR, "data", filename)
-        with open(file_path, "rb") as f:
-            return pickle.load(f)
-
-    def format_links(self, text):
-        """Formats text with title and link"""
-        lines = text.strip().split("\n")
-        formatted_output = ""
-
-        for line in lines:
-            # Match format with **Title** - URL
-            match = re.match(r'\*\*(.+?)\*\*\s+-\s+(https?://\S+)', line)
-            if match:
-                title = match.group(1).strip()
-                link = match.group(2).strip()
-                formatted_output += f"{title}\nLink: {link}\n\n"
-
-        return formatted_output
+def build_response(links):
+    """Formats content links as the response message and picks the first title as the image prompt."""
+    links = [link for link in links if link.title.strip()]
+    return {
+        'message': "\n\n".join(f"{link.title.strip()}\nLink: {link.url}" for link in links),
+        'image_gen_prompt': links[0].title.strip() if links else ''
+    }
+
+
+def read_body(request):
+    """The JSON object of an async view's request body; raises ValueError when it is not one."""
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        raise ValueError("Request body must be JSON.") from None
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object.")
+    return data
+
+
+class ContentRecommenderView(APIView):
 
     def post(self, request):
         try:
-            user_input = request.data.get('message', '')
-            if not user_input:
-                return Response({"error": "Message is required."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Determine user data
-            if user_input.startswith('IND'):
-                user_data = self.individuals.get(user_input)
-            elif user_input.startswith('ORG'):
-                user_data = self.organizations.get(user_input)
-            else:
-                return Response({"error": "Invalid user ID format."}, status=status.HTTP_400_BAD_REQUEST)
-
-            if not user_data:
-                return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+            cid = request.data.get('message', '')
+            user_data, error = find_customer(cid)
+            if error:
+                return Response(error[0], status=error[1])
+
+            precomputed = serve_precomputed(get_store(), "cdr", cid)
+            if precomputed is not None:
+                return Response(speculate(precomputed), status=status.HTTP_200_OK)
 
             # Generate content
-            response = self.model.generate_content(
-                "System, generate a list of 5 personalized content recommendations from financial content for the given customer. "
-                "The content should include name of content and actual links to financial blogs, financial videos, financial courses, etc. present on web for financial education. "
-                "Do not give anything else than the list of name with a working link. Do not provide any other description of content and html tags. Generate only one link for each recommendation. "
-                "Give response in format **Title** - Link. "
-                f"The customer details are: {user_data}"
-            )
-
-            formatted_text = ""
-            first_header = ""  
-
-            if response and response.candidates:
-                for candidate in response.candidates:
-                    for part in candidate.content.parts:
-                        
-                        formatted_part = self.format_links(part.text)
-                        formatted_text += formatted_part
-
-                        
-                        if not first_header:
-                            
-                            match = re.search(r'^(.*?)\nLink:', formatted_part, re.MULTILINE)
-                            if match:
-                                first_header = match.group(1).strip()
-
-           
-            return Response({
-                'message': formatted_text.strip(),
-                'image_gen_prompt': first_header
-            }, status=status.HTTP_200_OK)
+            try:
+                answer = generate_structured("cdr", build_prompt(cid, user_data), ContentRecommendations, tags=(cid,))
+            except (CircuitOpen, StructuredOutputError):
+                return Response(speculate(local_content(cid, user_data)), status=status.HTTP_200_OK)
 
+            # The client asks for the image next; start generating it now
+            return Response(speculate(build_response(answer.links)), status=status.HTTP_200_OK)
+
+        except Overloaded as e:
+            return overloaded_response(e)
         except Exception as e:
             return Response({
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncContentRecommenderView(View):
+    """Async version of ContentRecommenderView for ASGI deployments."""
+
+    async def post(self, request):
+        try:
+            cid = read_body(request).get('message', '')
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user_data, error = await aread(find_customer, cid)
+            if error:
+                return JsonResponse(error[0], status=error[1])
+
+            precomputed = await aserve_precomputed(get_store(), "cdr", cid)
+            if precomputed is not None:
+                return JsonResponse(speculate(precomputed), status=status.HTTP_200_OK)
+
+            try:
+                prompt = await aread(build_prompt, cid, user_data)
+                answer = await agenerate_structured("cdr", prompt, ContentRecommendations, tags=(cid,))
+            except (CircuitOpen, StructuredOutputError):
+                return JsonResponse(speculate(await aread(local_content, cid, user_data)), status=status.HTTP_200_OK)
+
+            return JsonResponse(speculate(build_response(answer.links)), status=status.HTTP_200_OK)
+
+        except Overloaded as e:
+            return overloaded_response(e)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ContentRecommenderBatchView(APIView):
+    """Content recommendations for many CIDs per call, streamed as NDJSON."""
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
+    def post(self, request):
+        cids, batch_size, error = parse_batch_request(request.data)
+        if error:
+            return Response(error[0], status=error[1])
+        return ndjson_response(run_batches(chunked(cids, batch_size), recommend_group))
+
+
+class AsyncContentRecommenderBatchView(View):
+    """Async version of ContentRecommenderBatchView for ASGI deployments."""
+
+    async def post(self, request):
+        try:
+            data = read_body(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        cids, batch_size, error = parse_batch_request(data)
+        if error:
+            return JsonResponse(error[0], status=error[1])
+        return ndjson_response(arun_batches(chunked(cids, batch_size), arecommend_group))
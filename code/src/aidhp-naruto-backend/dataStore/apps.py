@@ -0,0 +1,17 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class DatastoreConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "dataStore"
+
+    def ready(self):
+        from .serving import invalidate_customers
+        from .store import add_change_listener
+        add_change_listener(invalidate_customers)
+
+        # Load the customer data once per process instead of once per request
+        if getattr(settings, "DATA_STORE_PRELOAD", True):
+            from .store import get_store
+            get_store()
@@ -0,0 +1,324 @@
+"""
+Columnar format for the customer and transaction data files.
+
+A compiled directory holds one ``.npy`` file per column plus ``manifest.json``:
+
+    manifest.json                  column order, encodings, vocabularies, sources
+    individual.<COLUMN>.npy        one row per individual, sorted by CID
+    organization.<COLUMN>.npy      one row per organization, sorted by CID
+    transaction.<COLUMN>.npy       one row per transaction, grouped by CID
+    transaction.cids.npy           CIDs that own transactions, sorted
+    transaction.offsets.npy        CID i owns rows offsets[i]:offsets[i + 1]
+
+Arrays are opened with ``mmap_mode="r"`` so every worker process shares the
+same page-cached copy instead of unpickling its own.
+"""
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from collections.abc import Mapping
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+CUSTOMER_TABLES = {"individual": "individual.dat", "organization": "organization.dat"}
+TRANSACTION_TABLES = {"transaction": "transaction.dat", "txnadapt": "txnadapt.dat"}
+
+# Low-cardinality text columns are stored as int32 codes into a shared vocabulary
+DICTIONARY_COLUMNS = ("TYPE", "MODE", "COUNTRY", "OCCUPATION", "GENDER", "EDUCATION", "INDUSTRY", "SECTOR")
+DATE_COLUMNS = ("DATE", "DOB")
+INTEGER_COLUMNS = ("AMOUNT",)
+
+
+def column_encoding(name):
+    if name in DICTIONARY_COLUMNS:
+        return "dictionary"
+    if name in DATE_COLUMNS:
+        return "date"
+    if name in INTEGER_COLUMNS:
+        return "int"
+    return "bytes"
+
+
+class Vocabulary:
+    """Maps the values of a dictionary-encoded column to dense int32 codes."""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+def encode_column(name, values, vocab):
+    encoding = column_encoding(name)
+    if encoding == "dictionary":
+        codes = vocab.setdefault(name, Vocabulary())
+        return np.fromiter((codes.encode(v) for v in values), dtype=np.int32, count=len(values))
+    if encoding == "date":
+        return np.array(values, dtype="datetime64[D]")
+    if encoding == "int":
+        return np.array(values, dtype=np.int64)
+    encoded = [str(v).encode("utf-8") for v in values]
+    width = max((len(v) for v in encoded), default=1) or 1
+    return np.array(encoded, dtype=f"S{width}")
+
+
+def decode_value(encoding, array, row, vocab):
+    value = array[row]
+    if encoding == "dictionary":
+        return vocab.values[value]
+    if encoding == "date":
+        return value.item()
+    if encoding == "int":
+        return int(value)
+    return value.decode("utf-8")
+
+
+class CustomerTable(Mapping):
+    """Read-only CID -> record mapping over the columns of a customer table."""
+
+    def __init__(self, name, columns, order, vocab):
+        self.name = name
+        self.columns = columns
+        self.order = order
+        self.vocab = vocab
+        self.encodings = {column: column_encoding(column) for column in order}
+        self.index = {cid.decode("utf-8"): row for row, cid in enumerate(columns["CID"].tolist())}
+
+    def record(self, row):
+        return {
+            column: decode_value(self.encodings[column], self.columns[column], row, self.vocab.get(column))
+            for column in self.order
+        }
+
+    def __getitem__(self, cid):
+        return self.record(self.index[cid])
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, cid):
+        return cid in self.index
+
+
+class TransactionTable(Mapping):
+    """Read-only CID -> transaction list mapping over columnar transactions."""
+
+    def __init__(self, name, columns, order, vocab, cids, offsets):
+        self.name = name
+        self.columns = columns
+        self.order = order
+        self.vocab = vocab
+        self.encodings = {column: column_encoding(column) for column in order}
+        self.cids = cids
+        self.offsets = offsets
+        self.index = {cid.decode("utf-8"): i for i, cid in enumerate(cids.tolist())}
+
+    @property
+    def amount(self):
+        return self.columns["AMOUNT"]
+
+    @property
+    def date(self):
+        return self.columns["DATE"]
+
+    @property
+    def type(self):
+        return self.columns["TYPE"]
+
+    @property
+    def mode(self):
+        return self.columns["MODE"]
+
+    def rows(self, cid):
+        """Returns the row range owned by a CID (empty when it has no transactions)."""
+        i = self.index.get(cid)
+        if i is None:
+            return slice(0, 0)
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def owners(self):
+        """Returns, for every row, the position of its CID in ``cids``."""
+        return np.repeat(np.arange(len(self.cids)), np.diff(self.offsets))
+
+    def values(self, cid, column):
+        """Returns one column of a CID's rows as an array (dictionary columns as codes)."""
+        return np.asarray(self.columns[column][self.rows(cid)])
+
+    def parts(self):
+        """Columnar tables that together hold every row; see ``txnlog.LoggedTransactionTable``."""
+        return [self]
+
+    def record(self, row, cid):
+        record = {}
+        for column in self.order:
+            if column == "CID":
+                record[column] = cid
+            else:
+                record[column] = decode_value(self.encodings[column], self.columns[column], row, self.vocab.get(column))
+        return record
+
+    def __getitem__(self, cid):
+        i = self.index[cid]
+        return [self.record(row, cid) for row in range(int(self.offsets[i]), int(self.offsets[i + 1]))]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, cid):
+        return cid in self.index
+
+    @property
+    def row_count(self):
+        return int(self.offsets[-1]) if len(self.offsets) else 0
+
+
+def build_customer_columns(records, vocab):
+    cids = sorted(records)
+    order = list(next(iter(records.values())).keys()) if records else ["CID"]
+    columns = {
+        column: encode_column(column, [records[cid].get(column) for cid in cids], vocab)
+        for column in order
+    }
+    return columns, order
+
+
+def build_transaction_columns(records, vocab):
+    cids = sorted(records)
+    rows = [txn for cid in cids for txn in records[cid]]
+    order = list(rows[0].keys()) if rows else ["CID", "TYPE", "AMOUNT", "MODE", "DATE"]
+    columns = {
+        column: encode_column(column, [txn[column] for txn in rows], vocab)
+        for column in order if column != "CID"
+    }
+    columns["cids"] = encode_column("CID", cids, vocab)
+    columns["offsets"] = np.concatenate(([0], np.cumsum([len(records[cid]) for cid in cids]))).astype(np.int64)
+    return columns, order
+
+
+def load_pickle(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def build_tables(data_dir):
+    """Compiles the pickled data files into in-memory column arrays."""
+    vocab = {}
+    tables = {}
+    for name, filename in CUSTOMER_TABLES.items():
+        tables[name] = build_customer_columns(load_pickle(os.path.join(data_dir, filename)), vocab)
+    for name, filename in TRANSACTION_TABLES.items():
+        tables[name] = build_transaction_columns(load_pickle(os.path.join(data_dir, filename)), vocab)
+    return tables, vocab
+
+
+def wrap_tables(tables, vocab):
+    result = {}
+    for name, (columns, order) in tables.items():
+        if name in TRANSACTION_TABLES:
+            cids = columns.pop("cids")
+            offsets = columns.pop("offsets")
+            result[name] = TransactionTable(name, columns, order, vocab, cids, offsets)
+        else:
+            result[name] = CustomerTable(name, columns, order, vocab)
+    return result
+
+
+def source_stamps(data_dir):
+    stamps = {}
+    for filename in list(CUSTOMER_TABLES.values()) + list(TRANSACTION_TABLES.values()):
+        path = os.path.join(data_dir, filename)
+        if os.path.exists(path):
+            stamps[filename] = os.path.getmtime(path)
+    return stamps
+
+
+def compile_data(data_dir, output_dir):
+    """Compiles the pickled data files into a columnar directory, replacing it atomically."""
+    tables, vocab = build_tables(data_dir)
+    manifest = {
+        "version": FORMAT_VERSION,
+        "sources": source_stamps(data_dir),
+        "vocab": {column: codes.values for column, codes in vocab.items()},
+        "tables": {},
+    }
+
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".columnar-", dir=parent)
+    try:
+        for name, (columns, order) in tables.items():
+            for column, array in columns.items():
+                np.save(os.path.join(staging, f"{name}.{column}.npy"), array)
+            manifest["tables"][name] = {"order": order, "columns": sorted(columns)}
+        with open(os.path.join(staging, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.rename(staging, output_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def read_manifest(compiled_dir):
+    path = os.path.join(compiled_dir, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    return manifest if manifest.get("version") == FORMAT_VERSION else None
+
+
+def is_current(manifest, data_dir):
+    """True when the compiled copy was built from the data files currently on disk."""
+    stamps = source_stamps(data_dir)
+    return manifest is not None and all(
+        manifest["sources"].get(filename) == mtime for filename, mtime in stamps.items()
+    )
+
+
+def open_tables(compiled_dir, manifest=None):
+    """Opens a compiled directory, memory-mapping every column."""
+    manifest = manifest or read_manifest(compiled_dir)
+    vocab = {column: Vocabulary(values) for column, values in manifest["vocab"].items()}
+    tables = {}
+    for name, meta in manifest["tables"].items():
+        columns = {
+            column: np.load(os.path.join(compiled_dir, f"{name}.{column}.npy"), mmap_mode="r")
+            for column in meta["columns"]
+        }
+        tables[name] = (columns, meta["order"])
+    return wrap_tables(tables, vocab)
+
+
+def load_tables(data_dir, compiled_dir=None):
+    """Returns the data tables, memory-mapped when an up-to-date compiled copy exists."""
+    if compiled_dir:
+        manifest = read_manifest(compiled_dir)
+        if is_current(manifest, data_dir):
+            return open_tables(compiled_dir, manifest)
+    tables, vocab = build_tables(data_dir)
+    return wrap_tables(tables, vocab)
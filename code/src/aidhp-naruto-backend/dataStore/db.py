@@ -0,0 +1,196 @@
+"""
+Relational copy of the customer data, in the configured database.
+
+``manage.py loaddb`` fills the dataStore tables from the data files in
+chunks. ``DatabaseStore`` answers the per-customer lookups of
+``CustomerStore`` (``customer``, ``customer_transactions``,
+``recent_transactions``, ``services``, ``products``) with indexed queries
+that read only the rows of the CID asked for. Views get it from
+``get_records`` when CUSTOMER_DATA_SOURCE is "database". Aggregates
+(transaction summaries, shortlists, peer profiles and analytics over the
+whole customer base) keep using the columnar store, which holds the same
+rows: ingested transactions go to both.
+"""
+import threading
+import time
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import CatalogItem, DatabaseLoad, Individual, Organization, Transaction
+
+CUSTOMER_MODELS = {"IND": Individual, "ORG": Organization}
+TRANSACTION_COLUMNS = ("cid", "type", "amount", "mode", "date")
+# How often cached catalogs are checked against the latest loaddb run
+LOAD_CHECK_SECONDS = 1.0
+
+
+def field_names(model):
+    return [field.name for field in model._meta.concrete_fields]
+
+
+def as_record(values):
+    """A database row as the record dict of the data files (upper-case keys, same order)."""
+    return {name.upper(): value for name, value in values.items()}
+
+
+def as_model(model, record):
+    names = set(field_names(model))
+    return model(**{key.lower(): value for key, value in record.items() if key.lower() in names})
+
+
+def as_transaction(window, txn):
+    return Transaction(window=window, **{column: txn[column.upper()] for column in TRANSACTION_COLUMNS})
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def bulk_insert(model, objects, batch_size):
+    count = 0
+    for batch in batches(objects, batch_size):
+        model.objects.bulk_create(batch, batch_size=batch_size)
+        count += len(batch)
+    return count
+
+
+def load_database(store, batch_size=5000):
+    """
+    Replaces the dataStore tables with the contents of ``store`` in one
+    database transaction, inserting ``batch_size`` rows at a time. Returns
+    the row count per table.
+    """
+    catalogs = (
+        (CatalogItem.INDIVIDUAL, CatalogItem.PRODUCT, store.indprds, "products"),
+        (CatalogItem.INDIVIDUAL, CatalogItem.SERVICE, store.indsvcs, "services"),
+        (CatalogItem.ORGANIZATION, CatalogItem.PRODUCT, store.orgprds, "products"),
+        (CatalogItem.ORGANIZATION, CatalogItem.SERVICE, store.orgsvcs, "services"),
+    )
+    with transaction.atomic():
+        for model in (Transaction, CatalogItem, Individual, Organization):
+            model.objects.all().delete()
+        DatabaseLoad.objects.create()
+        return {
+            "individuals": bulk_insert(Individual, (as_model(Individual, r) for r in store.individuals.values()), batch_size),
+            "organizations": bulk_insert(Organization, (as_model(Organization, r) for r in store.organizations.values()), batch_size),
+            "transactions": sum(
+                bulk_insert(Transaction, (as_transaction(window, txn) for cid in table for txn in table[cid]), batch_size)
+                for window, table in ((Transaction.OLD, store.transactions), (Transaction.RECENT, store.txnadapt))
+            ),
+            "catalog items": bulk_insert(CatalogItem, (
+                CatalogItem(segment=segment, kind=kind, category=group["category"], name=name, position=position)
+                for segment, kind, catalog, key in catalogs
+                for position, (group, name) in enumerate((group, name) for group in catalog for name in group[key])
+            ), batch_size),
+        }
+
+
+class DatabaseStore:
+    """Per-customer lookups of ``CustomerStore``, each reading only the rows it returns."""
+
+    def __init__(self):
+        self.catalogs = {}
+        self.lock = threading.Lock()
+        self.load = None
+        self.load_checked = 0.0
+
+    def check_load(self):
+        """Drops the cached catalogs once ``loaddb`` has run again; checks every LOAD_CHECK_SECONDS at most."""
+        now = time.monotonic()
+        if now - self.load_checked < LOAD_CHECK_SECONDS:
+            return
+        latest = DatabaseLoad.objects.order_by("-id").values_list("id", flat=True).first()
+        with self.lock:
+            self.load_checked = now
+            if latest != self.load:
+                self.load = latest
+                self.catalogs = {}
+
+    def customer(self, cid):
+        """Returns the individual or organization record for a CID, or None."""
+        model = CUSTOMER_MODELS.get(str(cid)[:3])
+        if model is None:
+            return None
+        values = model.objects.filter(cid=cid).values(*field_names(model)).first()
+        return as_record(values) if values else None
+
+    def transactions(self, cid, window):
+        rows = Transaction.objects.filter(cid=cid, window=window).order_by("id").values_list(*TRANSACTION_COLUMNS)
+        return [dict(zip(("CID", "TYPE", "AMOUNT", "MODE", "DATE"), row)) for row in rows]
+
+    def customer_transactions(self, cid):
+        """Returns the old transactions for a CID."""
+        return self.transactions(cid, Transaction.OLD)
+
+    def recent_transactions(self, cid):
+        """Returns the recent (adaptive) transactions for a CID."""
+        return self.transactions(cid, Transaction.RECENT)
+
+    def catalog(self, cid, kind):
+        """The catalog in the data files' shape; catalogs are small and read once per load."""
+        self.check_load()
+        segment = CatalogItem.ORGANIZATION if str(cid).startswith("ORG") else CatalogItem.INDIVIDUAL
+        catalog = self.catalogs.get((segment, kind))
+        if catalog is None:
+            groups = {}
+            items = CatalogItem.objects.filter(segment=segment, kind=kind).order_by("position")
+            for category, name in items.values_list("category", "name"):
+                groups.setdefault(category, []).append(name)
+            key = f"{kind}s"
+            catalog = [{"category": category, key: names} for category, names in groups.items()]
+            with self.lock:
+                self.catalogs[(segment, kind)] = catalog
+        return catalog
+
+    def services(self, cid):
+        """Returns the service catalog matching the customer type of a CID."""
+        return self.catalog(cid, CatalogItem.SERVICE)
+
+    def products(self, cid):
+        """Returns the product catalog matching the customer type of a CID."""
+        return self.catalog(cid, CatalogItem.PRODUCT)
+
+
+def reads_database():
+    return getattr(settings, "CUSTOMER_DATA_SOURCE", "files") == "database"
+
+
+def keeps_database_copy():
+    """
+    Whether ingested transactions also go to the database: when it is read,
+    or once ``migrate`` has created its tables. A database never migrated is left alone.
+    """
+    return reads_database() or Transaction._meta.db_table in connection.introspection.table_names()
+
+
+def save_recent_transactions(transactions):
+    """Adds ingested transactions, normalized by ``normalize_transaction``, to the database copy."""
+    Transaction.objects.bulk_create([as_transaction(Transaction.RECENT, txn) for txn in transactions])
+
+
+async def aread(func, *args):
+    """Calls ``func`` from an async view; when it may query the database, in a worker thread."""
+    if not reads_database():
+        return func(*args)
+    return await sync_to_async(func)(*args)
+
+
+_records = None
+
+
+def get_records(store):
+    """
+    Returns where views should read one customer's rows from: the database
+    when CUSTOMER_DATA_SOURCE is "database", else ``store`` itself.
+    """
+    global _records
+    if not reads_database():
+        return store
+    if _records is None:
+        _records = DatabaseStore()
+    return _records
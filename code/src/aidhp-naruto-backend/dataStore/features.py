@@ -0,0 +1,231 @@
+"""
+Customer feature vectors and an exact nearest-neighbour index over all CIDs.
+
+Each customer is described by four L2-normalized blocks, concatenated and
+normalized again so that a dot product is a cosine similarity:
+
+    preferences     multi-hot over the preference vocabulary
+    requirements    multi-hot over the requirement vocabulary
+    type spend      share of spend per transaction TYPE (old and recent)
+    mode spend      share of spend per transaction MODE (old and recent)
+
+Individuals and organizations have different vocabularies and get separate
+indexes. ``manage.py buildfeatures`` stores them next to the data files.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+from django.conf import settings
+
+from .columnar import source_stamps
+
+KINDS = {
+    "individual": {"preferences": "indprfs.dat", "requirements": "indreqs.dat"},
+    "organization": {"preferences": "orgprfs.dat", "requirements": "orgreqs.dat"},
+}
+BLOCK_WEIGHTS = {"preferences": 1.0, "requirements": 1.0, "types": 0.5, "modes": 0.5}
+
+
+def vocabulary(values):
+    """Flattens a vocabulary file (a list, or a dict of lists by sector) into sorted terms."""
+    if isinstance(values, dict):
+        values = [term for terms in values.values() for term in terms]
+    return sorted(set(values))
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    return matrix
+
+
+def multi_hot(records, field, terms):
+    index = {term: i for i, term in enumerate(terms)}
+    matrix = np.zeros((len(records), len(terms)), dtype=np.float32)
+    for row, record in enumerate(records):
+        for term in (record.get(field) or "").split(", "):
+            column = index.get(term)
+            if column is not None:
+                matrix[row, column] = 1
+    return matrix
+
+
+def spend_histogram(tables, column, cids, size):
+    """
+    Total spend of each customer per code of a dictionary column, over
+    several tables; ``build_features`` normalizes the rows.
+    """
+    row_of = {cid: row for row, cid in enumerate(cids)}
+    totals = np.zeros((len(cids), size), dtype=np.float64)
+    for table in (part for table in tables for part in table.parts()):
+        owners = np.array([row_of.get(cid, -1) for cid in table.index], dtype=np.int64)[table.owners()]
+        keep = owners >= 0
+        codes = np.asarray(table.columns[column])[keep]
+        amounts = np.asarray(table.amount, dtype=np.float64)[keep]
+        np.add.at(totals, (owners[keep], codes), amounts)
+    return totals.astype(np.float32)
+
+
+def build_features(store, kind):
+    """Returns (cids, matrix, blocks) for every customer of a kind."""
+    spec = KINDS[kind]
+    customers = store.individuals if kind == "individual" else store.organizations
+    cids = sorted(customers)
+    records = [customers[cid] for cid in cids]
+    tables = [store.transactions, store.txnadapt]
+    vocab = store.transactions.vocab
+
+    blocks = {
+        "preferences": multi_hot(records, "PREFERENCES", vocabulary(store.load_pickle_file(spec["preferences"], default=[]))),
+        "requirements": multi_hot(records, "REQUIREMENTS", vocabulary(store.load_pickle_file(spec["requirements"], default=[]))),
+        "types": spend_histogram(tables, "TYPE", cids, len(vocab["TYPE"])),
+        "modes": spend_histogram(tables, "MODE", cids, len(vocab["MODE"])),
+    }
+    matrix = np.hstack([normalize_rows(blocks[name]) * weight for name, weight in BLOCK_WEIGHTS.items()])
+    layout = {name: block.shape[1] for name, block in blocks.items()}
+    return cids, normalize_rows(matrix).astype(np.float32), layout
+
+
+class NeighbourIndex:
+    """Exact cosine top-K search over a row-normalized feature matrix."""
+
+    def __init__(self, cids, matrix):
+        self.cids = list(cids)
+        self.matrix = matrix
+        self.row_of = {cid: row for row, cid in enumerate(self.cids)}
+
+    def __contains__(self, cid):
+        return cid in self.row_of
+
+    def __len__(self):
+        return len(self.cids)
+
+    def search(self, rows, k, batch_size=1024):
+        """
+        Returns (indices, scores) of the k nearest rows for each query row,
+        best first, excluding the query row itself (no columns when k is 0
+        or there is no other row). Queries are scored in
+        batches so memory stays at batch_size x len(index).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        k = min(k, len(self.cids) - 1)
+        if k <= 0:
+            return np.empty((len(rows), 0), dtype=np.int64), np.empty((len(rows), 0), dtype=np.float32)
+        indices = np.empty((len(rows), k), dtype=np.int64)
+        scores = np.empty((len(rows), k), dtype=np.float32)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            similarity = np.asarray(self.matrix[batch]) @ np.asarray(self.matrix).T
+            similarity[np.arange(len(batch)), batch] = -np.inf
+            top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(similarity, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            indices[start:start + len(batch)] = np.take_along_axis(top, order, axis=1)
+            scores[start:start + len(batch)] = np.take_along_axis(top_scores, order, axis=1)
+        return indices, scores
+
+    def neighbours(self, cid, k=5):
+        """Returns [(cid, score)] of the k customers most similar to a CID."""
+        row = self.row_of.get(cid)
+        if row is None or k <= 0:
+            return []
+        indices, scores = self.search([row], k)
+        return [(self.cids[i], float(score)) for i, score in zip(indices[0], scores[0])]
+
+    def batch_neighbours(self, cids, k=5):
+        """Returns {cid: [(cid, score)]} for many CIDs in one batched pass."""
+        known = [cid for cid in cids if cid in self.row_of]
+        if not known:
+            return {}
+        indices, scores = self.search([self.row_of[cid] for cid in known], k)
+        return {
+            cid: [(self.cids[i], float(score)) for i, score in zip(indices[n], scores[n])]
+            for n, cid in enumerate(known)
+        }
+
+
+def save_indexes(store, output_dir):
+    """Builds the feature matrices of every kind and writes them to output_dir atomically."""
+    manifest = {"sources": source_stamps(store.data_dir), "kinds": {}}
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".features-", dir=parent)
+    try:
+        for kind in KINDS:
+            cids, matrix, layout = build_features(store, kind)
+            np.save(os.path.join(staging, f"{kind}.matrix.npy"), matrix)
+            np.save(os.path.join(staging, f"{kind}.cids.npy"), np.array(cids, dtype="S"))
+            manifest["kinds"][kind] = {"rows": len(cids), "layout": layout}
+        with open(os.path.join(staging, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.rename(staging, output_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def load_index(store, kind, index_dir=None):
+    """Opens a stored index when it matches the data files, otherwise builds one in memory."""
+    if index_dir:
+        manifest_path = os.path.join(index_dir, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("sources") == source_stamps(store.data_dir) and kind in manifest["kinds"]:
+                matrix = np.load(os.path.join(index_dir, f"{kind}.matrix.npy"), mmap_mode="r")
+                cids = [cid.decode("utf-8") for cid in np.load(os.path.join(index_dir, f"{kind}.cids.npy")).tolist()]
+                return NeighbourIndex(cids, matrix)
+    cids, matrix, _ = build_features(store, kind)
+    return NeighbourIndex(cids, matrix)
+
+
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def get_neighbour_index(store, cid):
+    """Returns the index for the customer kind of a CID, loaded once per store."""
+    kind = "organization" if cid.startswith("ORG") else "individual"
+    with _indexes_lock:
+        indexes = _indexes.setdefault(store, {})
+        if kind not in indexes:
+            indexes[kind] = load_index(store, kind, getattr(settings, "FEATURE_INDEX_DIR", None))
+        return indexes[kind]
+
+
+def peer_profile(store, cid, k=10, limit=3):
+    """
+    Summarizes what the k most similar customers have that this one does not:
+    their most common preferences and transaction types.
+    """
+    record = store.customer(cid)
+    if record is None:
+        return {"similar": [], "preferences": [], "transaction_types": []}
+    neighbours = get_neighbour_index(store, cid).neighbours(cid, k)
+
+    own = set((record.get("PREFERENCES") or "").split(", "))
+    preferences = {}
+    types = {}
+    for peer, _ in neighbours:
+        for term in (store.customer(peer).get("PREFERENCES") or "").split(", "):
+            if term and term not in own:
+                preferences[term] = preferences.get(term, 0) + 1
+        for txn in store.recent_transactions(peer):
+            types[txn["TYPE"]] = types.get(txn["TYPE"], 0) + 1
+
+    def most_common(counts):
+        return [term for term, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+
+    return {
+        "similar": neighbours,
+        "preferences": most_common(preferences),
+        "transaction_types": most_common(types),
+    }
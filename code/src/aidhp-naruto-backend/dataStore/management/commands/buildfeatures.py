@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dataStore.features import save_indexes
+from dataStore.store import get_store
+
+
+class Command(BaseCommand):
+    help = "Builds the customer feature matrices used for nearest-neighbour search"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=str(settings.FEATURE_INDEX_DIR))
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        manifest = save_indexes(get_store(), options["output"])
+        elapsed = time.perf_counter() - start
+        for kind, meta in manifest["kinds"].items():
+            layout = ", ".join(f"{name}={size}" for name, size in meta["layout"].items())
+            self.stdout.write(f"{kind}: {meta['rows']} customers ({layout})")
+        self.stdout.write(self.style.SUCCESS(f"Built {options['output']} in {elapsed:.2f}s"))
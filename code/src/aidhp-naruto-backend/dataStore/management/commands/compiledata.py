@@ -0,0 +1,22 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dataStore.columnar import compile_data
+
+
+class Command(BaseCommand):
+    help = "Compiles the pickled customer and transaction files into the memory-mapped columnar format"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--data-dir", default=str(settings.DATA_DIR))
+        parser.add_argument("--output", default=str(settings.COLUMNAR_DATA_DIR))
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        manifest = compile_data(options["data_dir"], options["output"])
+        elapsed = time.perf_counter() - start
+        for name, meta in manifest["tables"].items():
+            self.stdout.write(f"{name}: {', '.join(meta['columns'])}")
+        self.stdout.write(self.style.SUCCESS(f"Compiled {options['output']} in {elapsed:.2f}s"))
@@ -0,0 +1,47 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from dataStore.store import get_store
+
+
+def read_transactions(f):
+    """Reads a JSON array of transactions, or one JSON object per line."""
+    text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Appends recent transactions (a JSON array or JSON lines with CID, TYPE, AMOUNT, "
+        "MODE, DATE) to the transaction log. Running workers pick them up without a reload."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to read, or - for stdin")
+
+    def handle(self, *args, **options):
+        try:
+            if options["path"] == "-":
+                transactions = read_transactions(sys.stdin)
+            else:
+                with open(options["path"]) as f:
+                    transactions = read_transactions(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read transactions: {e}")
+
+        store = get_store()
+        unknown = sorted({str(txn.get("CID")) for txn in transactions if store.customer(str(txn.get("CID", ""))) is None})
+        if unknown:
+            raise CommandError(f"Unknown CIDs: {', '.join(unknown[:10])}")
+        try:
+            touched = store.ingest(transactions)
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e))
+        except DatabaseError as e:
+            raise CommandError(f"Could not save transactions: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Appended {len(transactions)} transactions for {len(touched)} customers"))
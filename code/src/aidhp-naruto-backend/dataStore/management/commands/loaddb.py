@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dataStore.db import load_database
+from dataStore.store import get_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Replaces the customer, transaction and catalog tables in the database with the contents "
+        "of the data files and the transaction log, inserting rows in batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        counts = load_database(get_store(), options["batch_size"])
+        elapsed = time.perf_counter() - start
+        for table, count in counts.items():
+            self.stdout.write(f"{table}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Loaded the database in {elapsed:.2f}s"))
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Individual',
+            fields=[
+                ('cid', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('gender', models.CharField(blank=True, max_length=10)),
+                ('dob', models.DateField(null=True)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('education', models.CharField(blank=True, max_length=100)),
+                ('occupation', models.CharField(blank=True, max_length=200)),
+                ('requirements', models.TextField(blank=True)),
+                ('preferences', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Organization',
+            fields=[
+                ('name', models.CharField(max_length=200)),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('industry', models.CharField(blank=True, max_length=200)),
+                ('sector', models.CharField(blank=True, max_length=200)),
+                ('cid', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('requirements', models.TextField(blank=True)),
+                ('preferences', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CatalogItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.CharField(choices=[('individual', 'Individual'), ('organization', 'Organization')], max_length=12)),
+                ('kind', models.CharField(choices=[('product', 'Product'), ('service', 'Service')], max_length=7)),
+                ('category', models.CharField(max_length=200)),
+                ('name', models.CharField(max_length=200)),
+                ('position', models.PositiveIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['segment', 'kind', 'position'], name='catalog_segment_kind')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cid', models.CharField(max_length=10)),
+                ('window', models.CharField(choices=[('old', 'Old'), ('recent', 'Recent')], max_length=6)),
+                ('type', models.CharField(max_length=200)),
+                ('amount', models.BigIntegerField()),
+                ('mode', models.CharField(max_length=50)),
+                ('date', models.DateField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cid', 'date'], name='transaction_cid_date'), models.Index(fields=['type'], name='transaction_type'), models.Index(fields=['mode'], name='transaction_mode')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataStore', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatabaseLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('loaded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
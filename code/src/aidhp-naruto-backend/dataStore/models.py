@@ -0,0 +1,69 @@
+from django.db import models
+
+
+class Individual(models.Model):
+    """A row of individual.dat. Fields are declared in the order of the pickled records."""
+    cid = models.CharField(max_length=10, primary_key=True)
+    name = models.CharField(max_length=200)
+    gender = models.CharField(max_length=10, blank=True)
+    dob = models.DateField(null=True)
+    city = models.CharField(max_length=100, blank=True)
+    country = models.CharField(max_length=100, blank=True)
+    education = models.CharField(max_length=100, blank=True)
+    occupation = models.CharField(max_length=200, blank=True)
+    requirements = models.TextField(blank=True)
+    preferences = models.TextField(blank=True)
+
+
+class Organization(models.Model):
+    """A row of organization.dat."""
+    name = models.CharField(max_length=200)
+    country = models.CharField(max_length=100, blank=True)
+    industry = models.CharField(max_length=200, blank=True)
+    sector = models.CharField(max_length=200, blank=True)
+    cid = models.CharField(max_length=10, primary_key=True)
+    requirements = models.TextField(blank=True)
+    preferences = models.TextField(blank=True)
+
+
+class Transaction(models.Model):
+    """A transaction of transaction.dat (old) or txnadapt.dat and its log (recent)."""
+    OLD = "old"
+    RECENT = "recent"
+
+    cid = models.CharField(max_length=10)
+    window = models.CharField(max_length=6, choices=[(OLD, "Old"), (RECENT, "Recent")])
+    type = models.CharField(max_length=200)
+    amount = models.BigIntegerField()
+    mode = models.CharField(max_length=50)
+    date = models.DateField()
+
+    class Meta:
+        indexes = [
+            # Also serves lookups by CID alone, as its leading column
+            models.Index(fields=["cid", "date"], name="transaction_cid_date"),
+            models.Index(fields=["type"], name="transaction_type"),
+            models.Index(fields=["mode"], name="transaction_mode"),
+        ]
+
+
+class CatalogItem(models.Model):
+    """A product or service of the indprd/orgprd/indsvc/orgsvc catalogs, in catalog order."""
+    INDIVIDUAL = "individual"
+    ORGANIZATION = "organization"
+    PRODUCT = "product"
+    SERVICE = "service"
+
+    segment = models.CharField(max_length=12, choices=[(INDIVIDUAL, "Individual"), (ORGANIZATION, "Organization")])
+    kind = models.CharField(max_length=7, choices=[(PRODUCT, "Product"), (SERVICE, "Service")])
+    category = models.CharField(max_length=200)
+    name = models.CharField(max_length=200)
+    position = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["segment", "kind", "position"], name="catalog_segment_kind")]
+
+
+class DatabaseLoad(models.Model):
+    """One run of ``manage.py loaddb``; processes drop what they cached from an older load."""
+    loaded_at = models.DateTimeField(auto_now_add=True)
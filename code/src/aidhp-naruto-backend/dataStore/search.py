@@ -0,0 +1,401 @@
+"""
+In-memory search indexes over the customer and transaction tables.
+
+``CustomerIndex`` numbers every customer in CID order (individuals, then
+organizations) and keeps:
+
+- a prefix trie over the casefolded NAME and each word of it, whose nodes
+  are ranges of a sorted key array, expanded on first visit;
+- a packed bitmap per value of the categorical columns (COUNTRY, OCCUPATION,
+  INDUSTRY, ...) and per tag of the comma-separated PREFERENCES and
+  REQUIREMENTS, so filters combine with bitwise AND/OR.
+
+``TransactionIndex`` keeps the ids of every transaction (transaction.dat,
+then txnadapt.dat, then log rows in append order) sorted by AMOUNT and by
+DATE. Range queries are binary searches; rows appended to the log are
+merged in by ``refresh``, which publishes them as a new snapshot.
+
+Both return pages in a fixed order with an opaque cursor naming the last
+row served, so paging is stable while new transactions arrive.
+"""
+import base64
+import bisect
+import json
+import threading
+
+import numpy as np
+
+from .columnar import column_encoding
+
+CUSTOMER_FIELDS = {
+    "country": "COUNTRY",
+    "city": "CITY",
+    "gender": "GENDER",
+    "education": "EDUCATION",
+    "occupation": "OCCUPATION",
+    "industry": "INDUSTRY",
+    "sector": "SECTOR",
+    "preference": "PREFERENCES",
+    "requirement": "REQUIREMENTS",
+}
+TAG_COLUMNS = ("PREFERENCES", "REQUIREMENTS")
+SEGMENTS = {"individuals": "IND", "organizations": "ORG"}
+TRANSACTION_ORDERS = ("date", "amount")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Rows checked per step when the other range filters the one ordered by
+SCAN_CHUNK = 4096
+
+
+def normalize(value):
+    return " ".join(str(value).split()).casefold()
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """The value of a cursor made by ``encode_cursor``; raises ValueError when it is not one."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeEncodeError):
+        raise ValueError("Invalid cursor.") from None
+
+
+class PrefixTrie:
+    """
+    Prefix trie over sorted string keys. A node is the range of keys sharing
+    its prefix; children are found by binary search on first visit and then
+    kept, so common prefixes cost one dict lookup per character.
+    """
+
+    def __init__(self, keys, ids):
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.ids = np.array([ids[i] for i in order], dtype=np.int64)
+        self.root = (0, len(self.keys), {})
+        self.lock = threading.Lock()
+
+    def find(self, prefix):
+        """Ids of the keys starting with ``prefix``, with repeats."""
+        lo, hi, children = self.root
+        for depth, char in enumerate(prefix):
+            child = children.get(char)
+            if child is None:
+                stem = prefix[:depth + 1]
+                start = bisect.bisect_left(self.keys, stem, lo, hi)
+                end = bisect.bisect_left(self.keys, stem[:-1] + chr(ord(char) + 1), start, hi)
+                child = (start, end, {})
+                with self.lock:
+                    children.setdefault(char, child)
+            lo, hi, children = child
+            if lo == hi:
+                break
+        return self.ids[lo:hi]
+
+
+class CustomerIndex:
+    """Name prefix and categorical filters over every customer, as packed bitmaps."""
+
+    def __init__(self, store):
+        self.store = store
+        self.tables = (store.individuals, store.organizations)
+        self.cids = [cid for table in self.tables for cid in table]
+        self.count = len(self.cids)
+        self.segments = {}
+        start = 0
+        for prefix, table in zip(SEGMENTS.values(), self.tables):
+            self.segments[prefix] = self.bitmap(np.arange(start, start + len(table)))
+            start += len(table)
+        self.empty = self.bitmap([])
+        self.everyone = self.bitmap(np.arange(self.count))
+        self.bitmaps = {column: self.build_bitmaps(column) for column in CUSTOMER_FIELDS.values()}
+        self.names = self.build_trie()
+
+    def bitmap(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) * 64 > self.count:
+            bits = np.zeros(self.count, dtype=bool)
+            bits[ids] = True
+            return np.packbits(bits)
+        bits = np.zeros((self.count + 7) // 8, dtype=np.uint8)
+        np.bitwise_or.at(bits, ids >> 3, (128 >> (ids & 7)).astype(np.uint8))
+        return bits
+
+    def table_starts(self):
+        """Yields each customer table with the global id of its first row."""
+        start = 0
+        for table in self.tables:
+            yield start, table
+            start += len(table)
+
+    def build_bitmaps(self, column):
+        members = {}
+        for start, table in self.table_starts():
+            if column not in table.columns:
+                continue
+            values = np.asarray(table.columns[column])
+            if column_encoding(column) == "dictionary":
+                labels, codes = table.vocab[column].values, values
+            else:
+                # Each distinct text is split and normalized once
+                uniques, codes = np.unique(values, return_inverse=True)
+                labels = [value.decode("utf-8") for value in uniques.tolist()]
+            order = np.argsort(codes, kind="stable")
+            present, first = np.unique(codes[order], return_index=True)
+            for code, ids in zip(present.tolist(), np.split(order + start, first[1:])):
+                texts = labels[code].split(",") if column in TAG_COLUMNS else [labels[code]]
+                for text in texts:
+                    if key := normalize(text):
+                        members.setdefault(key, []).append(ids)
+        return {key: self.bitmap(np.concatenate(groups)) for key, groups in members.items()}
+
+    def build_trie(self):
+        keys, ids = [], []
+        for start, table in self.table_starts():
+            for i, name in enumerate(np.asarray(table.columns["NAME"]).tolist(), start):
+                words = normalize(name.decode("utf-8")).split(" ")
+                # The whole name and each later word, so "shel" finds "Brent Shelton"
+                for w in range(len(words)):
+                    keys.append(" ".join(words[w:]))
+                    ids.append(i)
+        return PrefixTrie(keys, ids)
+
+    def match(self, name=None, filters=None, segment=None):
+        """
+        The bitmap of customers whose NAME (or a word of it) starts with
+        ``name``, in ``segment``, and holding one of the values given for
+        each field of ``filters`` ({field: [values]}).
+        """
+        bitmap = self.segments[SEGMENTS[segment]] if segment else self.everyone
+        for field, values in (filters or {}).items():
+            index = self.bitmaps[CUSTOMER_FIELDS[field]]
+            union = self.empty
+            for value in values:
+                union = union | index.get(normalize(value), self.empty)
+            bitmap = bitmap & union
+        if name:
+            bitmap = bitmap & self.bitmap(self.names.find(normalize(name)))
+        return bitmap
+
+    def search(self, name=None, filters=None, segment=None, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        """One page of matching customer records in CID order, the match count and the next cursor."""
+        bitmap = self.match(name, filters, segment)
+        start = 0
+        if cursor:
+            after = decode_cursor(cursor)
+            if not isinstance(after, str):
+                raise ValueError("Invalid cursor.")
+            start = bisect.bisect_right(self.cids, after)
+        # Unpack from the byte holding ``start`` onwards only
+        tail = np.unpackbits(bitmap[start // 8:])[start % 8:]
+        hits = np.flatnonzero(tail)[:page_size + 1] + start
+        page = hits[:page_size].tolist()
+        return {
+            "count": int(np.bitwise_count(bitmap).sum()),
+            "results": [self.store.customer(self.cids[i]) for i in page],
+            "next": encode_cursor(self.cids[page[-1]]) if len(hits) > page_size else None,
+        }
+
+
+class SortedColumn:
+    """Row ids ordered by (value, id), with the values in that order."""
+
+    def __init__(self, values, ids=None):
+        """``values`` by row id; or, with ``ids``, already in (value, id) order."""
+        self.ids = np.argsort(values, kind="stable") if ids is None else ids
+        self.values = values[self.ids] if ids is None else values
+
+    def merged(self, values, start):
+        """
+        A new column that also holds rows ``start``, ``start + 1``, ...
+        with ``values``; their ids exceed any held. This one is left as is.
+        """
+        order = np.argsort(values, kind="stable")
+        at = np.searchsorted(self.values, values[order], side="right")
+        return SortedColumn(np.insert(self.values, at, values[order]), np.insert(self.ids, at, order + start))
+
+    def range(self, low=None, high=None):
+        """Positions [lo, hi) of the values in [low, high]."""
+        lo = 0 if low is None else int(np.searchsorted(self.values, low, side="left"))
+        hi = len(self.values) if high is None else int(np.searchsorted(self.values, high, side="right"))
+        return lo, hi
+
+    def position_after(self, value, row):
+        """Position of the first entry after (``value``, ``row``)."""
+        first = int(np.searchsorted(self.values, value, side="left"))
+        last = int(np.searchsorted(self.values, value, side="right"))
+        return first + int(np.searchsorted(self.ids[first:last], row, side="right"))
+
+
+class TransactionSnapshot:
+    """
+    The sorted columns, values by row id and log rows of one ``refresh``.
+    Never changed once published, so a search reading one sees them agree.
+    """
+    __slots__ = ("values", "columns", "appended", "appended_ids")
+
+    def __init__(self, values, columns, appended, appended_ids):
+        self.values = values
+        self.columns = columns
+        self.appended = appended
+        self.appended_ids = appended_ids
+
+
+class TransactionIndex:
+    """
+    AMOUNT and DATE range queries over the transactions of both windows.
+    Dates are held as day numbers.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.sources = []
+        amounts, dates, start = [], [], 0
+        for window, table in (("old", store.transactions), ("recent", store.txnadapt)):
+            base = getattr(table, "base", table)
+            self.sources.append((start, window, base))
+            amounts.append(np.asarray(base.amount, dtype=np.int64))
+            dates.append(np.asarray(base.date).astype("datetime64[D]").astype(np.int64))
+            start += base.row_count
+        self.base_count = start
+        values = {"amount": np.concatenate(amounts), "date": np.concatenate(dates)}
+        columns = {name: SortedColumn(column) for name, column in values.items()}
+        self.snapshot = TransactionSnapshot(values, columns, (), {})
+        self.refresh()
+
+    def refresh(self):
+        """
+        Merges rows appended to the transaction log since the last call into
+        a new snapshot, published with one assignment once complete.
+        """
+        table = self.store.txnadapt
+        if not hasattr(table, "appended_since"):
+            return self
+        with self.lock:
+            current = self.snapshot
+            rows = table.appended_since(len(current.appended))
+            if not rows:
+                return self
+            start = self.base_count + len(current.appended)
+            new = {
+                "amount": np.array([row["AMOUNT"] for row in rows], dtype=np.int64),
+                "date": np.array([row["DATE"] for row in rows], dtype="datetime64[D]").astype(np.int64),
+            }
+            appended_ids = dict(current.appended_ids)
+            for i, row in enumerate(rows, start):
+                appended_ids[row["CID"]] = (*appended_ids.get(row["CID"], ()), i)
+            self.snapshot = TransactionSnapshot(
+                {name: np.concatenate([current.values[name], values]) for name, values in new.items()},
+                {name: current.columns[name].merged(values, start) for name, values in new.items()},
+                (*current.appended, *rows),
+                appended_ids,
+            )
+        return self
+
+    def record(self, snapshot, row):
+        if row >= self.base_count:
+            return {**snapshot.appended[row - self.base_count], "WINDOW": "recent"}
+        start, window, table = next(source for source in reversed(self.sources) if source[0] <= row)
+        row -= start
+        owner = int(np.searchsorted(table.offsets, row, side="right")) - 1
+        return {**table.record(row, table.cids[owner].decode("utf-8")), "WINDOW": window}
+
+    def customer_rows(self, snapshot, cid):
+        ids = []
+        for start, _, table in self.sources:
+            rows = table.rows(cid)
+            ids.append(np.arange(start + rows.start, start + rows.stop))
+        ids.append(np.array(snapshot.appended_ids.get(cid, ()), dtype=np.int64))
+        return np.concatenate(ids)
+
+    def within(self, snapshot, ids, ranges):
+        keep = np.ones(len(ids), dtype=bool)
+        for name, (low, high) in ranges.items():
+            if low is not None:
+                keep &= snapshot.values[name][ids] >= low
+            if high is not None:
+                keep &= snapshot.values[name][ids] <= high
+        return keep
+
+    def search(self, cid=None, amount=(None, None), date=(None, None), order="date", cursor=None,
+               page_size=DEFAULT_PAGE_SIZE):
+        """
+        One page of transactions whose AMOUNT and DATE (a day number) fall in
+        the inclusive ``amount`` and ``date`` ranges, and of ``cid`` when
+        given, ordered by ``order`` then by row; with the match count and the
+        next cursor.
+        """
+        # One read: a concurrent refresh publishes a new snapshot and leaves this one whole
+        snapshot = self.snapshot
+        values = snapshot.values[order]
+        ranges = {"amount": amount, "date": date}
+        other = "amount" if order == "date" else "date"
+        filtered = {other: ranges[other]} if ranges[other] != (None, None) else {}
+        column = snapshot.columns[order]
+        lo, hi = column.range(*ranges[order])
+        after = None
+        if cursor:
+            after = decode_cursor(cursor)
+            if not (isinstance(after, list) and len(after) == 2 and all(isinstance(v, int) for v in after)):
+                raise ValueError("Invalid cursor.")
+
+        candidates = None
+        if cid is not None:
+            candidates = self.customer_rows(snapshot, cid)
+        elif filtered:
+            olo, ohi = snapshot.columns[other].range(*ranges[other])
+            if ohi - olo < hi - lo:
+                candidates = snapshot.columns[other].ids[olo:ohi]
+
+        if candidates is not None:
+            # Few rows: filter them all, then sort by (value, row)
+            ids = candidates[self.within(snapshot, candidates, ranges)]
+            ids = ids[np.lexsort((ids, values[ids]))]
+            count = len(ids)
+            if after is not None:
+                keys = values[ids]
+                ids = ids[(keys > after[0]) | ((keys == after[0]) & (ids > after[1]))]
+            page = ids[:page_size + 1]
+        else:
+            # Walk the sorted range from the cursor, filtering chunk by chunk
+            count = hi - lo
+            if filtered:
+                count = int(np.count_nonzero(self.within(snapshot, column.ids[lo:hi], filtered)))
+            position = max(column.position_after(*after), lo) if after is not None else lo
+            found, total = [], 0
+            while position < hi and total <= page_size:
+                chunk = column.ids[position:min(position + (SCAN_CHUNK if filtered else page_size + 1), hi)]
+                position += len(chunk)
+                if filtered:
+                    chunk = chunk[self.within(snapshot, chunk, filtered)]
+                found.append(chunk)
+                total += len(chunk)
+            page = np.concatenate(found)[:page_size + 1] if found else np.array([], dtype=np.int64)
+
+        rows = page[:page_size].tolist()
+        return {
+            "count": int(count),
+            "results": [self.record(snapshot, row) for row in rows],
+            "next": encode_cursor([int(values[rows[-1]]), rows[-1]]) if len(page) > page_size else None,
+        }
+
+
+_indexes = None
+_indexes_lock = threading.Lock()
+
+
+def get_search_indexes(store):
+    """
+    Returns the (customer, transaction) indexes of ``store``, built on first
+    use and rebuilt when the store is replaced; new log rows are merged in.
+    """
+    global _indexes
+    if _indexes is None or _indexes[0].store is not store:
+        with _indexes_lock:
+            if _indexes is None or _indexes[0].store is not store:
+                _indexes = (CustomerIndex(store), TransactionIndex(store))
+    customers, transactions = _indexes
+    return customers, transactions.refresh()
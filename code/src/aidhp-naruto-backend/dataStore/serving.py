@@ -0,0 +1,135 @@
+"""
+On-disk serving table of precomputed recommendations.
+
+``manage.py precompute`` fills it for every CID; views look a result up by
+(kind, CID, flag) before generating one live. Each row carries a fingerprint
+of the customer's record and transactions, so a row whose customer data has
+changed since it was computed is ignored rather than served stale.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+def customer_fingerprint(store, cid):
+    """Hash of everything a recommendation for a CID is computed from."""
+    data = repr((store.customer(cid), store.customer_transactions(cid), store.recent_transactions(cid)))
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class ServingTable:
+    """SQLite table keyed by (kind, cid, flag); readable by many processes while being filled."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS recommendations ("
+                "kind TEXT NOT NULL, cid TEXT NOT NULL, flag INTEGER NOT NULL, "
+                "fingerprint TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (kind, cid, flag)) WITHOUT ROWID"
+            )
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, kind, cid, flag, fingerprint):
+        """Returns the stored payload, or None when missing or computed from other data."""
+        row = self.connection().execute(
+            "SELECT fingerprint, payload FROM recommendations WHERE kind = ? AND cid = ? AND flag = ?",
+            (kind, cid, int(bool(flag))),
+        ).fetchone()
+        if row is None or row[0] != fingerprint:
+            return None
+        return json.loads(row[1])
+
+    def put_many(self, rows):
+        """Stores [(kind, cid, flag, fingerprint, payload)] in one transaction."""
+        now = time.time()
+        with self.connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO recommendations (kind, cid, flag, fingerprint, payload, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(kind, cid, int(bool(flag)), fingerprint, json.dumps(payload), now)
+                 for kind, cid, flag, fingerprint, payload in rows],
+            )
+
+    def fingerprints(self, kind, flag):
+        """Returns {cid: fingerprint} of the rows stored for a kind and flag."""
+        return dict(self.connection().execute(
+            "SELECT cid, fingerprint FROM recommendations WHERE kind = ? AND flag = ?", (kind, int(bool(flag)))
+        ))
+
+    def delete(self, kind=None, cid=None):
+        clauses = [(column, value) for column, value in (("kind", kind), ("cid", cid)) if value is not None]
+        where = " AND ".join(f"{column} = ?" for column, _ in clauses) or "1"
+        with self.connection() as conn:
+            conn.execute(f"DELETE FROM recommendations WHERE {where}", [value for _, value in clauses])
+
+    def delete_customers(self, cids):
+        with self.connection() as conn:
+            conn.executemany("DELETE FROM recommendations WHERE cid = ?", [(cid,) for cid in cids])
+
+    def counts(self):
+        return {
+            (kind, bool(flag)): count for kind, flag, count in self.connection().execute(
+                "SELECT kind, flag, COUNT(*) FROM recommendations GROUP BY kind, flag"
+            )
+        }
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_serving_table(create=False):
+    """
+    Returns the serving table at settings.SERVING_TABLE_PATH, or None when it
+    is disabled or (unless ``create``) has not been built yet.
+    """
+    global _table
+    path = getattr(settings, "SERVING_TABLE_PATH", None)
+    if not path or not (create or os.path.exists(path)):
+        return None
+    if _table is None or _table.path != str(path):
+        with _table_lock:
+            if _table is None or _table.path != str(path):
+                _table = ServingTable(path)
+    return _table
+
+
+def serve_precomputed(store, kind, cid, flag=False):
+    """Returns the precomputed payload for a CID if it is still current, else None."""
+    table = get_serving_table()
+    if table is None or not cid or store.customer(cid) is None:
+        return None
+    try:
+        return table.get(kind, cid, flag, customer_fingerprint(store, cid))
+    except sqlite3.Error:
+        return None
+
+
+async def aserve_precomputed(store, kind, cid, flag=False):
+    """Async counterpart of ``serve_precomputed``; the SQLite read runs in a worker thread."""
+    if get_serving_table() is None:
+        return None
+    return await sync_to_async(serve_precomputed)(store, kind, cid, flag)
+
+
+def invalidate_customers(store, cids):
+    """Drops the precomputed rows of customers whose data changed."""
+    table = get_serving_table()
+    if table is not None:
+        table.delete_customers(cids)
@@ -0,0 +1,172 @@
+import os
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .columnar import load_tables
+from .db import keeps_database_copy, save_recent_transactions
+from .txnlog import LoggedTransactionTable, TransactionLog, normalize_transaction
+
+
+class CustomerStore:
+    """
+    Read-only view of the customer data files, keyed by CID.
+
+    ``individuals``, ``organizations``, ``transactions`` and ``txnadapt`` are
+    columnar tables that behave like the dicts stored in the pickles. They are
+    memory-mapped from ``COLUMNAR_DATA_DIR`` when ``manage.py compiledata`` has
+    been run against the current data files, and compiled in memory otherwise.
+
+    With a ``log_path``, ``txnadapt`` also holds the transactions appended to
+    that log (see ``txnlog``); ``refresh`` picks up lines written since the
+    last read, by this or any other process.
+    """
+
+    def __init__(self, data_dir, compiled_dir=None, log_path=None):
+        self.data_dir = str(data_dir)
+
+        tables = load_tables(self.data_dir, compiled_dir and str(compiled_dir))
+        self.individuals = tables["individual"]
+        self.organizations = tables["organization"]
+        self.transactions = tables["transaction"]
+        self.txnadapt = tables["txnadapt"]
+
+        self.log = TransactionLog(log_path) if log_path else None
+        self.log_offset = 0
+        self.log_checked = 0.0
+        self.log_lock = threading.Lock()
+        if self.log is not None:
+            self.txnadapt = LoggedTransactionTable(self.txnadapt)
+            self.refresh(notify=False)
+
+        self.orgsvcs = self.load_pickle_file("orgsvc.dat", default=[])
+        self.orgprds = self.load_pickle_file("orgprd.dat", default=[])
+        self.indsvcs = self.load_pickle_file("indsvc.dat", default=[])
+        self.indprds = self.load_pickle_file("indprd.dat", default=[])
+
+    def load_pickle_file(self, filename, default=None):
+        """Loads a pickle file from the data directory, or returns default if it is missing."""
+        file_path = os.path.join(self.data_dir, filename)
+        if not os.path.exists(file_path):
+            return {} if default is None else default
+        with open(file_path, "rb") as f:
+            return pickle.load(f)
+
+    def customer(self, cid):
+        """Returns the individual or organization record for a CID, or None."""
+        if cid.startswith("ORG"):
+            return self.organizations.get(cid)
+        if cid.startswith("IND"):
+            return self.individuals.get(cid)
+        return None
+
+    def customer_transactions(self, cid):
+        """Returns the old transactions for a CID."""
+        return self.transactions.get(cid, [])
+
+    def recent_transactions(self, cid):
+        """Returns the recent (adaptive) transactions for a CID."""
+        return self.txnadapt.get(cid, [])
+
+    def services(self, cid):
+        """Returns the service catalog matching the customer type of a CID."""
+        return self.orgsvcs if cid.startswith("ORG") else self.indsvcs
+
+    def products(self, cid):
+        """Returns the product catalog matching the customer type of a CID."""
+        return self.orgprds if cid.startswith("ORG") else self.indprds
+
+    def refresh(self, notify=True):
+        """Applies new transaction log lines; returns the set of CIDs they touched."""
+        if self.log is None:
+            return set()
+        with self.log_lock:
+            self.log_checked = time.monotonic()
+            transactions, self.log_offset = self.log.read_from(self.log_offset)
+            touched = self.txnadapt.extend(transactions) if transactions else set()
+        if touched and notify:
+            notify_change(self, touched)
+        return touched
+
+    def poll(self, interval):
+        """Calls ``refresh`` if the log has not been checked for ``interval`` seconds."""
+        if self.log is None or time.monotonic() - self.log_checked < interval:
+            return set()
+        self.log_checked = time.monotonic()
+        if self.log.size() <= self.log_offset:
+            return set()
+        return self.refresh()
+
+    def ingest(self, transactions):
+        """
+        Appends transactions to the log and applies them; returns the touched
+        CIDs. When there is a database copy (``keeps_database_copy``) the
+        normalized rows also go to it, in a database transaction that is
+        rolled back if the log append fails.
+        """
+        if self.log is None:
+            raise RuntimeError("TRANSACTION_LOG_PATH is not set.")
+        rows = [normalize_transaction(txn) for txn in transactions]
+        if not keeps_database_copy():
+            self.log.append(rows)
+            return self.refresh()
+        with transaction.atomic():
+            save_recent_transactions(rows)
+            self.log.append(rows)
+        return self.refresh()
+
+
+_listeners = []
+
+
+def add_change_listener(listener):
+    """
+    Registers ``listener(store, cids)``, called whenever new transactions for
+    some CIDs are applied, so caches derived from those customers can drop
+    just their entries.
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def notify_change(store, cids):
+    for listener in list(_listeners):
+        listener(store, cids)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_store():
+    return CustomerStore(
+        settings.DATA_DIR,
+        getattr(settings, "COLUMNAR_DATA_DIR", None),
+        getattr(settings, "TRANSACTION_LOG_PATH", None),
+    )
+
+
+def get_store():
+    """
+    Returns the process-wide store, loading it on first use. New transaction
+    log lines are picked up at most every TRANSACTION_LOG_POLL_SECONDS.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store()
+    _store.poll(getattr(settings, "TRANSACTION_LOG_POLL_SECONDS", 1.0))
+    return _store
+
+
+def reload_store():
+    """Reloads the data files and swaps the process-wide store."""
+    global _store
+    store = create_store()
+    with _store_lock:
+        _store = store
+    return store
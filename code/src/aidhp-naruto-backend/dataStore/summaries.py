@@ -0,0 +1,109 @@
+"""
+Compact, prompt-ready summaries of a customer's transactions.
+
+Instead of the raw list of transaction dicts, prompts get per-window aggregates
+computed straight from the columnar arrays: spend per TYPE and MODE, recency,
+frequency, and the shift between the old (transaction.dat) and recent
+(txnadapt.dat) windows.
+"""
+import numpy as np
+
+
+def estimate_tokens(text):
+    """Rough token count for Gemini prompts (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def format_amount(amount):
+    for threshold, suffix in ((1e12, "T"), (1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if abs(amount) >= threshold:
+            return f"{amount / threshold:.2f}{suffix}"
+    return f"{amount:.0f}"
+
+
+def format_record(record):
+    """Renders a customer record as 'KEY: value' pairs instead of a dict repr."""
+    return "; ".join(f"{key}: {value}" for key, value in record.items())
+
+
+def window_stats(table, cid, as_of):
+    """Aggregates one customer's rows of a transaction table, or None when it has none."""
+    amounts = table.values(cid, "AMOUNT").astype(np.float64)
+    if not len(amounts):
+        return None
+    dates = table.values(cid, "DATE")
+    types = table.values(cid, "TYPE")
+    modes = table.values(cid, "MODE")
+
+    first, last = dates.min(), dates.max()
+    months = max(1.0, (last - first).astype(int) / 30.44)
+    return {
+        "count": len(amounts),
+        "total": float(amounts.sum()),
+        "first": first,
+        "last": last,
+        "days_since_last": int((as_of - last).astype(int)),
+        "per_month": len(amounts) / months,
+        "types": spend_by_code(types, amounts, table.vocab["TYPE"]),
+        "modes": spend_by_code(modes, amounts, table.vocab["MODE"]),
+    }
+
+
+def spend_by_code(codes, amounts, vocab):
+    """Returns [(value, spend)] for a dictionary-encoded column, largest spend first."""
+    unique, inverse = np.unique(codes, return_inverse=True)
+    spend = np.bincount(inverse, weights=amounts)
+    order = np.argsort(-spend, kind="stable")
+    return [(vocab.values[unique[i]], float(spend[i])) for i in order]
+
+
+def describe_window(name, stats, top):
+    if stats is None:
+        return f"{name}: no transactions"
+    total = stats["total"] or 1
+    types = ", ".join(f"{value} {share / total:.0%}" for value, share in stats["types"][:top])
+    modes = ", ".join(f"{value} {share / total:.0%}" for value, share in stats["modes"][:top])
+    return (
+        f"{name}: {stats['count']} txns, total {format_amount(stats['total'])}, "
+        f"{stats['first']} to {stats['last']} (last {stats['days_since_last']} days ago), "
+        f"{stats['per_month']:.1f}/month; spend by type: {types}; by mode: {modes}"
+    )
+
+
+def describe_shift(old, recent, top):
+    if old is None or recent is None:
+        return ""
+    change = (recent["total"] - old["total"]) / old["total"] if old["total"] else 0
+    old_types = {value for value, _ in old["types"]}
+    new_types = [value for value, _ in recent["types"] if value not in old_types][:top]
+    recent_modes = {value for value, _ in recent["modes"]}
+    dropped_modes = [value for value, _ in old["modes"] if value not in recent_modes][:top]
+    parts = [f"shift: recent spend {change:+.0%} vs old"]
+    if new_types:
+        parts.append(f"new types: {', '.join(new_types)}")
+    if dropped_modes:
+        parts.append(f"modes no longer used: {', '.join(dropped_modes)}")
+    return "; ".join(parts)
+
+
+def as_of_date(store):
+    """Reference date for recency: the latest transaction in the dataset."""
+    dates = [
+        np.asarray(part.date).max()
+        for table in (store.transactions, store.txnadapt) for part in table.parts() if part.row_count
+    ]
+    return max(dates) if dates else np.datetime64("today", "D")
+
+
+def summarize_transactions(store, cid, recent=False, top=5):
+    """Returns a compact text summary of a customer's old (and optionally recent) transactions."""
+    as_of = as_of_date(store)
+    old = window_stats(store.transactions, cid, as_of)
+    lines = [describe_window("old transactions", old, top)]
+    if recent:
+        new = window_stats(store.txnadapt, cid, as_of)
+        lines.append(describe_window("recent transactions", new, top))
+        shift = describe_shift(old, new, top)
+        if shift:
+            lines.append(shift)
+    return "\n".join(lines)
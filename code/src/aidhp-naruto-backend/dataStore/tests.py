@@ -0,0 +1,289 @@
+import json
+import os
+import pickle
+import tempfile
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+
+from .columnar import compile_data, load_tables
+from .db import DatabaseStore, get_records, load_database
+from .models import CatalogItem, DatabaseLoad, Transaction
+from .search import CustomerIndex, TransactionIndex
+from .features import NeighbourIndex, build_features, normalize_rows, peer_profile
+from . import store as store_module
+from .store import CustomerStore, add_change_listener, get_store
+from .summaries import summarize_transactions
+
+
+class CustomerStoreTests(TestCase):
+    def test_store_is_loaded_once(self):
+        self.assertIs(get_store(), get_store())
+
+    def test_lookup_by_cid(self):
+        store = get_store()
+        cid = next(iter(store.organizations))
+        self.assertEqual(store.customer(cid)["CID"], cid)
+        self.assertIs(store.services(cid), store.orgsvcs)
+        self.assertIs(store.products("IND0000001"), store.indprds)
+        self.assertIsNone(store.customer("XYZ0000001"))
+
+
+class ColumnarFormatTests(TestCase):
+    def test_compiled_tables_match_pickles(self):
+        data_dir = str(settings.DATA_DIR)
+        with tempfile.TemporaryDirectory() as tmp:
+            compiled_dir = os.path.join(tmp, "columnar")
+            compile_data(data_dir, compiled_dir)
+            tables = load_tables(data_dir, compiled_dir)
+            txnadapt = tables["txnadapt"]
+            self.assertIsInstance(txnadapt.amount, np.memmap)
+
+            with open(os.path.join(data_dir, "txnadapt.dat"), "rb") as f:
+                expected = pickle.load(f)
+            cid = next(iter(expected))
+            self.assertEqual(txnadapt[cid], expected[cid])
+            rows = txnadapt.rows(cid)
+            self.assertEqual(rows.stop - rows.start, len(expected[cid]))
+            self.assertEqual(txnadapt.rows("IND9999999"), slice(0, 0))
+
+
+class NeighbourIndexTests(TestCase):
+    def test_exact_top_k_excludes_self(self):
+        matrix = normalize_rows(np.array([[1, 0], [0.9, 0.1], [0, 1], [0.1, 0.9]], dtype=np.float32))
+        index = NeighbourIndex(["A", "B", "C", "D"], matrix)
+        self.assertEqual([cid for cid, _ in index.neighbours("A", 2)], ["B", "D"])
+        batch = index.batch_neighbours(["C", "A", "missing"], k=1)
+        self.assertEqual({cid: peers[0][0] for cid, peers in batch.items()}, {"C": "D", "A": "B"})
+
+        indices, scores = index.search([0, 2], 0)
+        self.assertEqual(indices.shape, (2, 0))
+        self.assertEqual(scores.shape, (2, 0))
+        self.assertEqual(NeighbourIndex(["A"], matrix[:1]).search([0], 5)[0].shape, (1, 0))
+
+    def test_peer_profile_for_customer(self):
+        store = get_store()
+        cid = next(iter(store.organizations))
+        profile = peer_profile(store, cid, k=5)
+        self.assertEqual(len(profile["similar"]), 5)
+        self.assertTrue(all(peer.startswith("ORG") and peer != cid for peer, _ in profile["similar"]))
+
+
+class TransactionSummaryTests(TestCase):
+    def test_summary_aggregates_both_windows(self):
+        store = get_store()
+        cid = next(cid for cid in store.organizations if store.customer_transactions(cid) and store.recent_transactions(cid))
+        summary = summarize_transactions(store, cid, recent=True)
+        lines = summary.split("\n")
+        self.assertTrue(lines[0].startswith(f"old transactions: {len(store.customer_transactions(cid))} txns"))
+        self.assertTrue(lines[1].startswith(f"recent transactions: {len(store.recent_transactions(cid))} txns"))
+        self.assertTrue(lines[2].startswith("shift: "))
+        self.assertEqual(summarize_transactions(store, "IND9999999"), "old transactions: no transactions")
+
+
+class TransactionLogTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.log_path = os.path.join(tmp.name, "txnadapt.log")
+        self.store = CustomerStore(settings.DATA_DIR, settings.COLUMNAR_DATA_DIR, self.log_path)
+        self.cid = next(iter(self.store.organizations))
+        self.txn = {"CID": self.cid, "TYPE": "Quantum Compute Lease", "AMOUNT": 1000, "MODE": "Wire Transfer", "DATE": "2025-03-01"}
+
+    def test_ingest_extends_recent_transactions_in_place(self):
+        before = len(self.store.recent_transactions(self.cid))
+        summary = summarize_transactions(self.store, self.cid, recent=True)
+        changes = []
+        listener = lambda store, cids: changes.append((store, cids))
+        add_change_listener(listener)
+        self.addCleanup(store_module._listeners.remove, listener)
+
+        self.assertEqual(self.store.ingest([self.txn]), {self.cid})
+        recent = self.store.recent_transactions(self.cid)
+        self.assertEqual(len(recent), before + 1)
+        self.assertEqual(recent[-1]["TYPE"], "Quantum Compute Lease")
+        self.assertIn(f"{before + 1} txns", summarize_transactions(self.store, self.cid, recent=True))
+        self.assertNotIn(f"{before + 1} txns", summary)
+        self.assertIn((self.store, {self.cid}), changes)
+        self.assertEqual(sum(part.row_count for part in self.store.txnadapt.parts()), self.store.txnadapt.row_count)
+        build_features(self.store, "organization")
+
+    def test_other_workers_pick_up_appended_lines(self):
+        worker = CustomerStore(settings.DATA_DIR, settings.COLUMNAR_DATA_DIR, self.log_path)
+        self.store.ingest([self.txn, {**self.txn, "AMOUNT": 5}])
+        self.assertEqual(worker.poll(0), {self.cid})
+        self.assertEqual(worker.recent_transactions(self.cid)[-1]["AMOUNT"], 5)
+        self.assertEqual(worker.poll(0), set())
+
+        # A fresh process replays the whole log
+        self.assertEqual(CustomerStore(settings.DATA_DIR, None, self.log_path).recent_transactions(self.cid)[-2:],
+                         worker.recent_transactions(self.cid)[-2:])
+
+    def test_invalid_batch_is_not_written(self):
+        with self.assertRaises(ValueError):
+            self.store.ingest([self.txn, {**self.txn, "AMOUNT": "lots"}])
+        self.assertFalse(os.path.exists(self.log_path))
+
+    def test_unmigrated_database_is_left_alone(self):
+        rows = Transaction.objects.count()
+        with mock.patch.object(connection.introspection, "table_names", return_value=[]):
+            self.assertEqual(self.store.ingest([self.txn]), {self.cid})
+        self.assertEqual(Transaction.objects.count(), rows)
+
+    @override_settings(TRANSACTION_INGEST_TOKEN="secret")
+    def test_database_errors_are_reported(self):
+        failing = mock.patch("dataStore.store.save_recent_transactions", side_effect=DatabaseError("no such table"))
+        with mock.patch("dataStore.views.get_store", return_value=self.store), failing:
+            response = self.client.post(
+                "/api/transactions/", {"transactions": [self.txn]}, content_type="application/json",
+                HTTP_AUTHORIZATION="Bearer secret",
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(os.path.exists(self.log_path))
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump([self.txn], f)
+            f.flush()
+            with mock.patch("dataStore.management.commands.ingesttxns.get_store", return_value=self.store), failing:
+                with self.assertRaisesMessage(CommandError, "no such table"):
+                    call_command("ingesttxns", f.name)
+
+    @override_settings(TRANSACTION_INGEST_TOKEN="secret")
+    def test_ingest_endpoint_requires_token(self):
+        response = self.client.post("/api/transactions/", {"transactions": [self.txn]}, content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+
+
+class DatabaseStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.counts = load_database(get_store(), batch_size=2000)
+
+    def test_rows_match_the_data_files(self):
+        store = get_store()
+        self.assertEqual(self.counts["individuals"], len(store.individuals))
+        self.assertEqual(self.counts["transactions"], store.transactions.row_count + store.txnadapt.row_count)
+
+        records = DatabaseStore()
+        for cid in (next(iter(store.individuals)), next(iter(store.organizations))):
+            self.assertEqual(list(records.customer(cid).items()), list(store.customer(cid).items()))
+            self.assertEqual(records.customer_transactions(cid), store.customer_transactions(cid))
+            self.assertEqual(records.recent_transactions(cid), store.recent_transactions(cid))
+            self.assertEqual(records.products(cid), store.products(cid))
+            self.assertEqual(records.services(cid), store.services(cid))
+        self.assertIsNone(records.customer("IND9999999"))
+
+    def test_lookups_read_one_customer_through_an_index(self):
+        cid = next(iter(get_store().individuals))
+        with self.assertNumQueries(1):
+            DatabaseStore().recent_transactions(cid)
+        self.assertIn("transaction_cid_date", Transaction.objects.filter(cid=cid, window=Transaction.RECENT).explain())
+
+    def test_views_can_read_from_the_database(self):
+        from adaptiveRecommender.views import build_query
+
+        store = get_store()
+        cid = next(iter(store.organizations))
+        for summarize in (True, False):
+            with override_settings(RECOMMENDER_SUMMARIZE_TRANSACTIONS=summarize):
+                from_files = build_query(store, "true", cid)
+                with override_settings(CUSTOMER_DATA_SOURCE="database"):
+                    self.assertEqual(build_query(store, "true", cid), from_files)
+
+    def test_ingested_rows_reach_the_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CustomerStore(settings.DATA_DIR, settings.COLUMNAR_DATA_DIR, os.path.join(tmp, "txnadapt.log"))
+            cid = next(iter(store.organizations))
+            store.ingest([{"CID": cid, "TYPE": "Dock Fee", "AMOUNT": "1200", "MODE": "Wire Transfer", "DATE": "2025-03-01"}])
+            with override_settings(CUSTOMER_DATA_SOURCE="database"):
+                self.assertEqual(get_records(store).recent_transactions(cid), store.recent_transactions(cid))
+
+            # A failed log append leaves the database as it was
+            rows = Transaction.objects.count()
+            with mock.patch.object(store.log, "append", side_effect=OSError("disk full")), self.assertRaises(OSError):
+                store.ingest([{"CID": cid, "TYPE": "Dock Fee", "AMOUNT": 5, "MODE": "Wire Transfer", "DATE": "2025-03-02"}])
+            self.assertEqual(Transaction.objects.count(), rows)
+
+    def test_catalogs_follow_a_reload(self):
+        records = DatabaseStore()
+        cid = next(iter(get_store().individuals))
+        first = records.services(cid)[0]["services"][0]
+        CatalogItem.objects.filter(name=first).update(name="Renamed service")
+        self.assertEqual(records.services(cid)[0]["services"][0], first)
+        DatabaseLoad.objects.create()
+        records.load_checked = 0.0
+        self.assertEqual(records.services(cid)[0]["services"][0], "Renamed service")
+
+
+class SearchIndexTests(TestCase):
+    def pages(self, url, params):
+        results, cursor = [], None
+        while True:
+            response = self.client.get(url, {**params, **({"cursor": cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            results += response.json()["results"]
+            cursor = response.json()["next"]
+            if not cursor:
+                return response.json()["count"], results
+
+    def test_customers_by_name_prefix_and_fields(self):
+        store = get_store()
+        expected = [
+            cid for cid in list(store.individuals) + list(store.organizations)
+            if store.customer(cid).get("COUNTRY") in ("India", "France")
+            and any(word.lower().startswith("s") for word in store.customer(cid)["NAME"].split())
+        ]
+        count, results = self.pages("/api/search/", {"q": "S", "country": ["india", "France"], "page_size": 7})
+        self.assertEqual(count, len(expected))
+        self.assertEqual([r["CID"] for r in results], expected)
+
+        tag = store.customer(expected[0])["PREFERENCES"].split(",")[-1]
+        found = CustomerIndex(store).search(filters={"preference": [tag.upper()]}, segment="individuals", page_size=500)
+        self.assertIn(expected[0], [r["CID"] for r in found["results"]])
+        self.assertTrue(all(tag.strip() in r["PREFERENCES"] for r in found["results"]))
+
+    def test_transactions_by_amount_and_date_range(self):
+        store = get_store()
+        rows = [txn for table in (store.transactions, store.txnadapt) for cid in table for txn in table[cid]]
+        low, high = sorted(txn["AMOUNT"] for txn in rows)[len(rows) // 2:len(rows) // 2 + 2]
+        in_range = [txn for txn in rows if low <= txn["AMOUNT"] <= high]
+        count, results = self.pages("/api/search/transactions/", {"min_amount": low, "max_amount": high, "order": "amount"})
+        self.assertEqual(count, len(in_range))
+        self.assertEqual([r["AMOUNT"] for r in results], sorted(txn["AMOUNT"] for txn in in_range))
+
+        day = min(txn["DATE"] for txn in rows)
+        count, results = self.pages("/api/search/transactions/", {"start": str(day), "end": str(day), "page_size": 3})
+        self.assertEqual(count, sum(txn["DATE"] == day for txn in rows))
+        self.assertEqual({r["DATE"] for r in results}, {str(day)})
+
+    def test_appended_rows_are_merged_in(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        store = CustomerStore(settings.DATA_DIR, settings.COLUMNAR_DATA_DIR, os.path.join(tmp.name, "txnadapt.log"))
+        index = TransactionIndex(store)
+        cid = next(iter(store.organizations))
+        first = index.search(amount=(10 ** 15, None), order="amount")
+        before = index.snapshot
+        rows = len(before.values["amount"])
+        store.ingest([
+            {"CID": cid, "TYPE": "Quantum Compute Lease", "AMOUNT": 10 ** 15, "MODE": "Wire Transfer", "DATE": "2025-03-01"},
+        ])
+        found = index.refresh().search(amount=(10 ** 15, None), order="amount")
+        self.assertEqual(found["count"], first["count"] + 1)
+        self.assertEqual(found["results"][-1]["WINDOW"], "recent")
+        # A search still reading the old snapshot sees it unchanged
+        self.assertIsNot(index.snapshot, before)
+        self.assertEqual(len(before.values["amount"]), rows)
+        self.assertEqual(len(before.columns["date"].ids), rows)
+        self.assertEqual(len(index.snapshot.columns["date"].ids), rows + 1)
+        self.assertEqual(index.search(cid=cid, page_size=500)["count"], len(store.customer_transactions(cid)) + len(store.recent_transactions(cid)))
+
+    def test_bad_queries(self):
+        self.assertEqual(self.client.get("/api/search/", {"cursor": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/search/", {"segment": "robots"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/search/transactions/", {"start": "March"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/search/transactions/", {"page_size": 0}).status_code, 400)
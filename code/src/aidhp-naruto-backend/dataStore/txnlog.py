@@ -0,0 +1,172 @@
+"""
+Append-only log of recent transactions on top of ``txnadapt.dat``.
+
+New transactions are appended to ``TRANSACTION_LOG_PATH`` as JSON lines
+instead of rewriting the pickle. Every process replays the log over the
+base table at startup and then tails it: ``LoggedTransactionTable`` keeps
+the appended rows in a per-CID index that grows in place, so picking up new
+transactions costs work proportional to the new lines only.
+"""
+import datetime
+import fcntl
+import json
+import os
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+
+from .columnar import Vocabulary, build_transaction_columns, column_encoding, encode_column, wrap_tables
+
+LOG_COLUMNS = ("CID", "TYPE", "AMOUNT", "MODE", "DATE")
+
+
+def normalize_transaction(txn):
+    """Validates one transaction dict and returns it with typed values; raises ValueError."""
+    if not isinstance(txn, dict):
+        raise ValueError("Each transaction must be an object.")
+    missing = [column for column in LOG_COLUMNS if txn.get(column) in (None, "")]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    cid = str(txn["CID"])
+    if not cid.startswith(("IND", "ORG")):
+        raise ValueError(f"Invalid CID: {cid}")
+    date = txn["DATE"]
+    if not isinstance(date, datetime.date):
+        date = datetime.date.fromisoformat(str(date))
+    try:
+        amount = int(txn["AMOUNT"])
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid AMOUNT: {txn['AMOUNT']!r}")
+    return {"CID": cid, "TYPE": str(txn["TYPE"]), "AMOUNT": amount, "MODE": str(txn["MODE"]), "DATE": date}
+
+
+def encode_line(txn):
+    return json.dumps({**txn, "DATE": txn["DATE"].isoformat()}, separators=(",", ":")) + "\n"
+
+
+def decode_line(line):
+    txn = json.loads(line)
+    txn["DATE"] = datetime.date.fromisoformat(txn["DATE"])
+    return txn
+
+
+class TransactionLog:
+    """A JSON-lines file that writers append to under an exclusive lock."""
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def append(self, transactions):
+        """Validates and appends transactions; returns them normalized."""
+        transactions = [normalize_transaction(txn) for txn in transactions]
+        if not transactions:
+            return []
+        data = "".join(encode_line(txn) for txn in transactions).encode("utf-8")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return transactions
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def read_from(self, offset):
+        """Returns (transactions, next offset) for the complete lines after ``offset``."""
+        if self.size() <= offset:
+            return [], offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # A line still being written has no newline yet; leave it for the next read
+        end = data.rfind(b"\n") + 1
+        lines = data[:end].decode("utf-8").splitlines()
+        return [decode_line(line) for line in lines if line.strip()], offset + end
+
+
+class LoggedTransactionTable(Mapping):
+    """
+    A transaction table plus the rows appended to it from the log.
+
+    Reads merge the base rows of a CID with its appended rows. Array readers
+    use ``values`` for one CID or ``parts`` for whole-table scans.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.name = base.name
+        self.order = base.order
+        self.vocab = base.vocab
+        self.appended = {}
+        self.appended_count = 0
+        # The same row dicts in the order they were appended, for incremental readers
+        self.history = []
+        self.lock = threading.Lock()
+        self.delta = None
+
+    def extend(self, transactions):
+        """Adds log rows to the per-CID index; returns the set of CIDs touched."""
+        with self.lock:
+            for txn in transactions:
+                # Encode dictionary values now so later reads never grow the vocabularies
+                for column in self.order:
+                    if column_encoding(column) == "dictionary":
+                        self.vocab.setdefault(column, Vocabulary()).encode(txn[column])
+                row = {column: txn[column] for column in self.order}
+                self.appended.setdefault(txn["CID"], []).append(row)
+                self.history.append(row)
+            self.appended_count += len(transactions)
+            self.delta = None
+        return {txn["CID"] for txn in transactions}
+
+    def __getitem__(self, cid):
+        appended = self.appended.get(cid)
+        if appended is None:
+            return self.base[cid]
+        return self.base.get(cid, []) + [dict(txn) for txn in appended]
+
+    def __iter__(self):
+        yield from self.base
+        for cid in list(self.appended):
+            if cid not in self.base:
+                yield cid
+
+    def __len__(self):
+        return len(self.base) + sum(1 for cid in list(self.appended) if cid not in self.base)
+
+    def __contains__(self, cid):
+        return cid in self.base or cid in self.appended
+
+    def appended_since(self, count):
+        """Returns the rows appended after the first ``count``, in append order."""
+        with self.lock:
+            return self.history[count:]
+
+    def values(self, cid, column):
+        values = self.base.values(cid, column)
+        appended = self.appended.get(cid)
+        if not appended:
+            return values
+        extra = encode_column(column, [txn[column] for txn in appended], self.vocab)
+        return np.concatenate([values, extra.astype(values.dtype)])
+
+    def parts(self):
+        """The base table and a columnar table of the appended rows."""
+        with self.lock:
+            if self.appended and self.delta is None:
+                columns, order = build_transaction_columns(dict(self.appended), self.vocab)
+                self.delta = wrap_tables({self.name: (columns, order)}, self.vocab)[self.name]
+            return [self.base] + ([self.delta] if self.delta is not None else [])
+
+    @property
+    def row_count(self):
+        return self.base.row_count + self.appended_count
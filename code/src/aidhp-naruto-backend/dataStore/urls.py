@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import CustomerSearchView, TransactionIngestView, TransactionSearchView
+
+urlpatterns = [
+    path('transactions/', TransactionIngestView.as_view(), name='transaction_ingest'),
+    path('search/', CustomerSearchView.as_view(), name='customer_search'),
+    path('search/transactions/', TransactionSearchView.as_view(), name='transaction_search'),
+]
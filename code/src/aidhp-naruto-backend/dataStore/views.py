@@ -0,0 +1,117 @@
+import hmac
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .search import (
+    CUSTOMER_FIELDS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SEGMENTS, TRANSACTION_ORDERS, get_search_indexes,
+)
+from .store import get_store
+
+
+def ingest_allowed(request):
+    token = getattr(settings, "TRANSACTION_INGEST_TOKEN", None)
+    if not token:
+        return False
+    return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+
+
+class TransactionIngestView(APIView):
+    """Appends recent transactions to the transaction log; affected CIDs are refreshed everywhere."""
+
+    def post(self, request):
+        if not ingest_allowed(request):
+            return Response({"error": "Not allowed."}, status=status.HTTP_403_FORBIDDEN)
+
+        transactions = request.data.get('transactions')
+        if not isinstance(transactions, list) or not transactions:
+            return Response({"error": "transactions must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+        store = get_store()
+        unknown = sorted({
+            str(txn.get("CID")) for txn in transactions
+            if isinstance(txn, dict) and store.customer(str(txn.get("CID", ""))) is None
+        })
+        if unknown:
+            return Response({"error": f"Unknown CIDs: {', '.join(unknown[:10])}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            touched = store.ingest(transactions)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except DatabaseError as e:
+            return Response({"error": f"Could not save transactions: {e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({"ingested": len(transactions), "cids": sorted(touched)}, status=status.HTTP_200_OK)
+
+
+def page_size(params):
+    """The page_size query parameter; raises ValueError when it is out of range."""
+    try:
+        size = int(params.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        size = 0
+    if not 1 <= size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be an integer between 1 and {MAX_PAGE_SIZE}.")
+    return size
+
+
+def bound(params, name, parse):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return parse(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} {value!r}.") from None
+
+
+def day_number(value):
+    return int(np.datetime64(value, "D").astype(np.int64))
+
+
+class CustomerSearchView(APIView):
+    """
+    Customers in CID order, filtered by name prefix (q), segment and any of
+    the CUSTOMER_FIELDS; a field given several times matches any of its values.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        segment = params.get('segment') or None
+        filters = {field: params.getlist(field) for field in CUSTOMER_FIELDS if params.getlist(field)}
+        try:
+            if segment is not None and segment not in SEGMENTS:
+                raise ValueError(f"segment must be one of {', '.join(SEGMENTS)}.")
+            customers, _ = get_search_indexes(get_store())
+            result = customers.search(
+                params.get('q', '').strip(), filters, segment, params.get('cursor'), page_size(params),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class TransactionSearchView(APIView):
+    """Transactions within an amount and/or date range, ordered by date or amount."""
+
+    def get(self, request):
+        params = request.query_params
+        order = params.get('order', 'date')
+        try:
+            if order not in TRANSACTION_ORDERS:
+                raise ValueError(f"order must be one of {', '.join(TRANSACTION_ORDERS)}.")
+            _, transactions = get_search_indexes(get_store())
+            result = transactions.search(
+                cid=params.get('cid') or None,
+                amount=(bound(params, 'min_amount', int), bound(params, 'max_amount', int)),
+                date=(bound(params, 'start', day_number), bound(params, 'end', day_number)),
+                order=order,
+                cursor=params.get('cursor'),
+                page_size=page_size(params),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK)
@@ -0,0 +1,225 @@
+"""
+Time-series cube over every transaction, for the graph endpoint.
+
+``TimeSeriesCube`` holds spend and transaction counts in dense NumPy arrays
+indexed by month, TYPE code, MODE code and segment, built from the DATE and
+AMOUNT columns of transaction.dat and txnadapt.dat. Rows appended to the
+transaction log are folded in by ``refresh``; the axes grow as new months
+and vocabulary values appear.
+
+``query`` slices a date range, filters a segment, sums out the dimensions
+not grouped by and downsamples months to quarters or years. Results are
+cached per query shape until the next refresh.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from dataStore.columnar import encode_column
+
+SEGMENTS = ("individuals", "organizations")
+GROUP_BY = {"type": "TYPE", "mode": "MODE", "segment": None}
+GRANULARITIES = {"month": 1, "quarter": 3, "year": 12}
+METRICS = ("spend", "count")
+MAX_BUCKETS = 240
+MAX_GROUPS = 20
+QUERY_CACHE_SIZE = 256
+UNITS = ((1e12, "trillions"), (1e9, "billions"), (1e6, "millions"), (1e3, "thousands"))
+
+
+def to_month(value):
+    """Month number of a 'YYYY-MM' or 'YYYY-MM-DD' string; raises ValueError otherwise."""
+    try:
+        return int(np.datetime64(str(value)[:7], "M").astype(np.int64))
+    except ValueError:
+        raise ValueError(f"Invalid month {value!r}; expected YYYY-MM.") from None
+
+
+def month_label(month, granularity):
+    timestamp = pd.Timestamp(str(np.datetime64(month, "M")))
+    if granularity == "year":
+        return str(timestamp.year)
+    if granularity == "quarter":
+        return f"{timestamp.year} Q{timestamp.quarter}"
+    return timestamp.strftime("%b %Y")
+
+
+def scale(values):
+    """Divisor and unit name that keep the largest value readable."""
+    peak = float(np.abs(values).max(initial=0))
+    return next(((threshold, unit) for threshold, unit in UNITS if peak >= threshold), (1, ""))
+
+
+class TimeSeriesCube:
+    """Spend and counts by [month, TYPE, MODE, segment] for every transaction of a store."""
+
+    def __init__(self, store):
+        self.store = store
+        self.vocab = store.transactions.vocab
+        self.lock = threading.Lock()
+        self.first_month = None
+        self.spend = np.zeros((0, 0, 0, len(SEGMENTS)))
+        self.count = np.zeros((0, 0, 0, len(SEGMENTS)), dtype=np.int64)
+        self.appended = 0
+        self.version = 0
+        self.results = OrderedDict()
+        for table in (store.transactions, store.txnadapt):
+            for part in getattr(table, "base", table).parts():
+                segment = np.char.startswith(np.asarray(part.cids), b"ORG").astype(np.int64)[part.owners()]
+                self.add(np.asarray(part.date), np.asarray(part.type), np.asarray(part.mode), segment, np.asarray(part.amount))
+
+    def grow(self, first, last):
+        """Pads the axes to cover months ``first``-``last`` and the current vocabulary."""
+        if self.first_month is None:
+            self.first_month = first
+        before = max(0, self.first_month - first)
+        after = max(0, last - (self.first_month + self.spend.shape[0] - 1) - before)
+        types = max(0, len(self.vocab["TYPE"]) - self.spend.shape[1])
+        modes = max(0, len(self.vocab["MODE"]) - self.spend.shape[2])
+        if before or after or types or modes:
+            padding = [(before, after), (0, types), (0, modes), (0, 0)]
+            self.spend, self.count = np.pad(self.spend, padding), np.pad(self.count, padding)
+            self.first_month -= before
+
+    def add(self, dates, types, modes, segment, amounts):
+        if not len(dates):
+            return
+        months = dates.astype("datetime64[M]").astype(np.int64)
+        self.grow(int(months.min()), int(months.max()))
+        _, n_types, n_modes, n_segments = self.spend.shape
+        index = (((months - self.first_month) * n_types + types) * n_modes + modes) * n_segments + segment
+        self.spend += np.bincount(index, weights=amounts.astype(np.float64), minlength=self.spend.size).reshape(self.spend.shape)
+        self.count += np.bincount(index, minlength=self.count.size).reshape(self.count.shape)
+
+    def refresh(self):
+        """Folds in rows appended to the transaction log since the last call."""
+        table = self.store.txnadapt
+        if not hasattr(table, "appended_since"):
+            return self
+        with self.lock:
+            rows = table.appended_since(self.appended)
+            if rows:
+                columns = {column: encode_column(column, [row[column] for row in rows], self.vocab)
+                           for column in ("TYPE", "MODE", "AMOUNT", "DATE")}
+                segment = np.array([row["CID"].startswith("ORG") for row in rows], dtype=np.int64)
+                self.add(columns["DATE"], columns["TYPE"], columns["MODE"], segment, columns["AMOUNT"])
+                self.appended += len(rows)
+                self.version += 1
+                self.results.clear()
+        return self
+
+    def last_month(self):
+        return self.first_month + self.spend.shape[0] - 1
+
+    def query(self, start=None, end=None, granularity="month", group_by=None, segment=None, metric="spend", top=5):
+        """
+        The series of ``metric`` from month ``start`` to ``end`` (the last 12
+        months of data by default), per ``granularity`` bucket, optionally
+        split into the ``top`` groups of ``group_by`` plus "Other".
+        Raises ValueError for an invalid query.
+        """
+        if self.first_month is None:
+            raise ValueError("There are no transactions to chart.")
+        end = to_month(end) if end else self.last_month()
+        start = to_month(start) if start else end - 11
+        if start > end:
+            raise ValueError("start must not be after end.")
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}.")
+        if group_by is not None and group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}.")
+        if segment is not None and segment not in SEGMENTS:
+            raise ValueError(f"segment must be one of {', '.join(SEGMENTS)}.")
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {', '.join(METRICS)}.")
+        if not isinstance(top, int) or not 1 <= top <= MAX_GROUPS:
+            raise ValueError(f"top must be between 1 and {MAX_GROUPS}.")
+        step = GRANULARITIES[granularity]
+        if (end - (start - start % step)) // step + 1 > MAX_BUCKETS:
+            raise ValueError(f"The range spans more than {MAX_BUCKETS} {granularity}s.")
+
+        key = (start, end, granularity, group_by, segment, metric, top)
+        with self.lock:
+            result = self.results.get(key)
+            if result is None:
+                result = self.results[key] = self.compute(*key)
+                if len(self.results) > QUERY_CACHE_SIZE:
+                    self.results.popitem(last=False)
+            else:
+                self.results.move_to_end(key)
+            return result
+
+    def compute(self, start, end, granularity, group_by, segment, metric, top):
+        step = GRANULARITIES[granularity]
+        # Buckets are aligned to calendar quarters and years
+        first = start - start % step
+        data = self.spend if metric == "spend" else self.count
+        if segment is not None:
+            data = data[..., SEGMENTS.index(segment):SEGMENTS.index(segment) + 1]
+
+        # Months outside the data are zero
+        months = np.zeros((end - start + 1,) + data.shape[1:], dtype=data.dtype)
+        lo, hi = max(start, self.first_month), min(end, self.last_month())
+        if lo <= hi:
+            months[lo - start:hi - start + 1] = data[lo - self.first_month:hi - self.first_month + 1]
+
+        if group_by is None:
+            grouped, names = months.sum(axis=(1, 2, 3))[:, None], []
+        else:
+            axis = {"type": 1, "mode": 2, "segment": 3}[group_by]
+            grouped = months.sum(axis=tuple(a for a in (1, 2, 3) if a != axis))
+            if group_by == "segment":
+                names = [segment] if segment else list(SEGMENTS)
+            else:
+                names = self.vocab[GROUP_BY[group_by]].values[:grouped.shape[1]]
+
+        starts = np.arange(start, end + 1)
+        bucket = (starts - first) // step
+        series = np.zeros((int(bucket[-1]) + 1, grouped.shape[1]), dtype=np.float64)
+        np.add.at(series, bucket, grouped)
+        labels = [month_label(first + i * step, granularity) for i in range(len(series))]
+
+        total = series.sum(1)
+        divisor, unit = scale(total) if metric == "spend" else (1, "transactions")
+        points = [{"month": label, "value": round(float(value) / divisor, 2)} for label, value in zip(labels, total)]
+        groups = []
+        if names:
+            ranked = [i for i in np.argsort(-series.sum(0), kind="stable")[:top] if series[:, i].any()]
+            groups = [names[i] for i in ranked]
+            other = total - series[:, ranked].sum(1)
+            for point, row, rest in zip(points, series, other):
+                point.update({names[i]: round(float(row[i]) / divisor, 2) for i in ranked})
+                if groups and round(float(rest) / divisor, 2):
+                    point["Other"] = round(float(rest) / divisor, 2)
+            if any("Other" in point for point in points):
+                groups.append("Other")
+
+        mean = total.mean()
+        volatility = total.std() / mean if mean else 0
+        return {
+            "time_series": points,
+            "groups": groups,
+            "metric": metric,
+            "unit": unit,
+            "granularity": granularity,
+            "start": str(np.datetime64(start, "M")),
+            "end": str(np.datetime64(end, "M")),
+            "growth_rate": round(float((total[-1] - total[0]) / total[0] * 100), 1) if total[0] else 0.0,
+            "risk_level": "low" if volatility < 0.15 else "moderate" if volatility < 0.35 else "high",
+        }
+
+
+_cube = None
+_cube_lock = threading.Lock()
+
+
+def get_cube(store):
+    """Returns the cube of ``store`` with new log rows folded in; rebuilt when the store is replaced."""
+    global _cube
+    if _cube is None or _cube.store is not store:
+        with _cube_lock:
+            if _cube is None or _cube.store is not store:
+                _cube = TimeSeriesCube(store)
+    return _cube.refresh()
@@ -1,3 +1,101 @@
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
 from django.test import TestCase
 
-# Create your tests here.
+from dataStore.store import CustomerStore, get_store
+from llmGateway.cache import get_cache
+
+from .cube import TimeSeriesCube
+
+
+def post(client, body):
+    return client.post("/api/graphGen/", body, content_type="application/json")
+
+
+class TimeSeriesCubeTests(TestCase):
+    def test_cube_holds_every_transaction(self):
+        store = get_store()
+        cube = TimeSeriesCube(store)
+        self.assertEqual(cube.count.sum(), store.transactions.row_count + store.txnadapt.row_count)
+        expected = sum(float(np.asarray(part.amount, dtype=np.float64).sum())
+                       for table in (store.transactions, store.txnadapt) for part in table.parts())
+        self.assertAlmostEqual(cube.spend.sum(), expected, delta=expected * 1e-9)
+
+    def test_query_downsamples_and_groups(self):
+        cube = TimeSeriesCube(get_store())
+        monthly = cube.query(start="2024-01", end="2024-12", metric="count")
+        quarterly = cube.query(start="2024-01", end="2024-12", metric="count", granularity="quarter", group_by="segment")
+        self.assertEqual(len(monthly["time_series"]), 12)
+        self.assertEqual([point["month"] for point in quarterly["time_series"]], ["2024 Q1", "2024 Q2", "2024 Q3", "2024 Q4"])
+        self.assertEqual(
+            [point["value"] for point in quarterly["time_series"]],
+            [sum(point["value"] for point in monthly["time_series"][i:i + 3]) for i in range(0, 12, 3)],
+        )
+        for point in quarterly["time_series"]:
+            self.assertEqual(point["individuals"] + point["organizations"], point["value"])
+        self.assertIs(cube.query(start="2024-01", end="2024-12", metric="count"), monthly)
+
+        with self.assertRaises(ValueError):
+            cube.query(group_by="city")
+        with self.assertRaises(ValueError):
+            cube.query(start="2025-01", end="2024-01")
+
+    def test_log_rows_extend_the_cube(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CustomerStore(settings.DATA_DIR, settings.COLUMNAR_DATA_DIR, os.path.join(tmp, "txnadapt.log"))
+            cube = TimeSeriesCube(store)
+            before = cube.query(start="2025-01", end="2025-06", metric="count")
+            cid = next(iter(store.organizations))
+            store.ingest([{"CID": cid, "TYPE": "Orbital Launch Fee", "AMOUNT": 10**18, "MODE": "Wire Transfer", "DATE": "2025-06-02"}])
+
+            after = cube.refresh().query(start="2025-01", end="2025-06", metric="count")
+            self.assertEqual(after["time_series"][-1]["value"], before["time_series"][-1]["value"] + 1)
+            by_type = cube.query(start="2025-01", end="2025-06", group_by="type", top=1)
+            self.assertEqual(by_type["groups"][0], "Orbital Launch Fee")
+
+
+class GraphGenViewTests(TestCase):
+    def test_gemini_only_narrates_the_computed_series(self):
+        get_cache().clear()
+        prompts = []
+
+        def generate_content(**kwargs):
+            prompts.append(kwargs["contents"])
+            part = SimpleNamespace(text="Spend is climbing.")
+            return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+        with mock.patch("llmGateway.gateway.get_client", return_value=client):
+            response = post(self.client, {"granularity": "quarter", "start": "2024-01", "group_by": "mode"})
+
+        self.assertEqual(response.status_code, 200)
+        market_trends = response.json()["market_trends"]
+        self.assertEqual(market_trends["narrative"], "Spend is climbing.")
+        self.assertEqual(market_trends["time_series"][0]["month"], "2024 Q1")
+        self.assertIn(f"- 2024 Q1: {market_trends['time_series'][0]['value']}", prompts[0])
+
+    def test_without_narration_or_with_a_bad_query(self):
+        with mock.patch("llmGateway.gateway.get_client") as get_client:
+            market_trends = post(self.client, {"narrate": False}).json()["market_trends"]
+            self.assertNotIn("narrative", post(self.client, {"narrate": "false"}).json()["market_trends"])
+        get_client.assert_not_called()
+        self.assertEqual(len(market_trends["time_series"]), 12)
+        self.assertNotIn("narrative", market_trends)
+
+        response = post(self.client, {"granularity": "week"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["status"], "error")
+        self.assertEqual(post(self.client, {"narrate": "sometimes"}).status_code, 400)
+
+    def test_failed_narration_is_logged(self):
+        get_cache().clear()
+        with mock.patch("graphCreator.views.generate_text", side_effect=RuntimeError("upstream down")), \
+                self.assertLogs("graphCreator.views", level="ERROR") as logs:
+            market_trends = post(self.client, {}).json()["market_trends"]
+        self.assertTrue(market_trends["narrative"].startswith("Spend"))
+        self.assertIn("upstream down", logs.output[0])
@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import path
-from .views import graph_gen_view
+from .views import async_graph_gen_view, graph_gen_view
 
 urlpatterns = [
-    path('graphGen/', graph_gen_view, name='graph_generation'),
+    path('graphGen/', async_graph_gen_view if settings.ASYNC_VIEWS else graph_gen_view, name='graph_generation'),
 ]
\ No newline at end of file
@@ -1,80 +1,116 @@
-import os
-import google.generativeai as genai
-import numpy as np
-import pandas as pd
+import json
+import logging
+
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from dataStore.store import get_store
+from llmGateway.breaker import CircuitOpen
+from llmGateway.gateway import agenerate_text, generate_text
+from llmGateway.scheduler import Overloaded
+from .cube import get_cube
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+MARKET_TREND_PROMPT = """
+    Summarize the trend in this monthly series of our customers' {metric} in two or three sentences
+    for the bank's leadership: the overall direction, notable peaks or dips, and which groups drive them.
+    Use only the figures given; do not invent data or add introductory statements.
 
-def generate_market_trend_data():
+    {series}
     """
-    Generate market trend data using Gemini 2.0 Flash
+
+QUERY_FIELDS = ("start", "end", "granularity", "group_by", "segment", "metric", "top")
+
+logger = logging.getLogger(__name__)
+
+
+def parse_narrate(value):
+    """The narrate flag as a bool; the strings "false" and "0" turn narration off."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("1", "true", "yes"):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ("0", "false", "no"):
+        return False
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    raise ValueError("narrate must be true or false.")
+
+
+def parse_query(request):
+    """The cube query and narrate flag from a JSON request body; raises ValueError when it is malformed."""
+    try:
+        body = json.loads(request.body or b"{}")
+    except json.JSONDecodeError:
+        raise ValueError("Request body must be JSON.") from None
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object.")
+    return {field: body[field] for field in QUERY_FIELDS if body.get(field) is not None}, parse_narrate(body.get("narrate", True))
+
+
+def describe_series(market_trends):
+    """Renders a computed series as text lines for the narration prompt."""
+    unit = f" ({market_trends['unit']})" if market_trends["unit"] else ""
+    lines = [f"{market_trends['metric'].capitalize()}{unit} per {market_trends['granularity']}:"]
+    for point in market_trends["time_series"]:
+        groups = ", ".join(f"{group} {point[group]}" for group in market_trends["groups"] if group in point)
+        lines.append(f"- {point['month']}: {point['value']}" + (f" ({groups})" if groups else ""))
+    lines.append(f"Growth over the range: {market_trends['growth_rate']}%; volatility: {market_trends['risk_level']}.")
+    return "\n".join(lines)
+
+
+def local_narrative(market_trends):
+    """A one-line description of the series, used when the LLM is unavailable."""
+    points = market_trends["time_series"]
+    peak = max(points, key=lambda point: point["value"])
+    direction = "rose" if market_trends["growth_rate"] >= 0 else "fell"
+    unit = f" {market_trends['unit']}" if market_trends["unit"] else ""
+    return (
+        f"{market_trends['metric'].capitalize()} {direction} {abs(market_trends['growth_rate'])}% from "
+        f"{points[0]['month']} to {points[-1]['month']}, peaking at {peak['value']}{unit} in {peak['month']}."
+    )
+
+
+def narration_prompt(market_trends):
+    return MARKET_TREND_PROMPT.format(metric=market_trends["metric"], series=describe_series(market_trends))
+
+
+def narration_error(e, market_trends):
+    if not isinstance(e, (CircuitOpen, Overloaded)):
+        logger.exception("Error generating market trends narrative")
+    return local_narrative(market_trends)
+
+
+def generate_market_trend_data(query, narrate=True):
     """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
-    prompt = """
-    Generate a detailed financial market trend analysis for the past 12 months.
-    Provide data points for:
-    1. Projected market growth rate
-    2. Sector performance variations
-    3. Potential investment opportunities
-    4. Risk assessment metrics
-
-    Respond with a structured JSON format containing numerical data.
+    Market trend series computed from our transactions, narrated by Gemini.
+    The series never waits on the LLM being available; its narrative falls
+    back to a computed sentence.
     """
+    market_trends = dict(get_cube(get_store()).query(**query))
+    if narrate:
+        try:
+            market_trends['narrative'] = generate_text("graph", narration_prompt(market_trends))
+        except Exception as e:
+            market_trends['narrative'] = narration_error(e, market_trends)
+    return market_trends
 
-    try:
-        response = model.generate_content(prompt)
-        
-        # Fallback to default data if generation fails
-        if not response.text:
-            return {
-                'time_series': [
-                    {'month': 'Jan', 'value': 45.2},
-                    {'month': 'Feb', 'value': 47.6},
-                    {'month': 'Mar', 'value': 46.8},
-                    {'month': 'Apr', 'value': 48.3},
-                    {'month': 'May', 'value': 49.1},
-                    {'month': 'Jun', 'value': 50.5},
-                    {'month': 'Jul', 'value': 51.2},
-                    {'month': 'Aug', 'value': 52.7},
-                    {'month': 'Sep', 'value': 53.4},
-                    {'month': 'Oct', 'value': 54.9},
-                    {'month': 'Nov', 'value': 56.2},
-                    {'month': 'Dec', 'value': 57.6}
-                ],
-                'growth_rate': 27.5,
-                'risk_level': 'moderate'
-            }
-
-        # Parse and validate the response
+async def agenerate_market_trend_data(query, narrate=True):
+    """
+    Async version of generate_market_trend_data
+    """
+    market_trends = dict(get_cube(get_store()).query(**query))
+    if narrate:
         try:
-            parsed_data = json.loads(response.text)
-            return parsed_data
-        except json.JSONDecodeError:
-            # Generate default data if parsing fails
-            return {
-                'time_series': [
-                    {'month': 'Jan', 'value': 45.2},
-                    # ... other months ...
-                ],
-                'growth_rate': 27.5,
-                'risk_level': 'moderate'
-            }
+            market_trends['narrative'] = await agenerate_text("graph", narration_prompt(market_trends))
+        except Exception as e:
+            market_trends['narrative'] = narration_error(e, market_trends)
+    return market_trends
 
-    except Exception as e:
-        print(f"Error generating market trends: {e}")
-        return {
-            'time_series': [
-                {'month': 'Jan', 'value': 45.2},
-                # ... other months ...
-            ],
-            'growth_rate': 27.5,
-            'risk_level': 'moderate'
-        }
+def bad_request(e):
+    return JsonResponse({
+        'status': 'error',
+        'message': str(e)
+    }, status=400)
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -83,11 +119,35 @@ def graph_gen_view(request):
     API endpoint for generating market trend graph data
     """
     try:
-        market_trends = generate_market_trend_data()
+        query, narrate = parse_query(request)
+        market_trends = generate_market_trend_data(query, narrate)
+        return JsonResponse({
+            'status': 'success',
+            'market_trends': market_trends
+        }, status=200)
+    except ValueError as e:
+        return bad_request(e)
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def async_graph_gen_view(request):
+    """
+    Async API endpoint for generating market trend graph data under ASGI
+    """
+    try:
+        query, narrate = parse_query(request)
+        market_trends = await agenerate_market_trend_data(query, narrate)
         return JsonResponse({
             'status': 'success',
             'market_trends': market_trends
         }, status=200)
+    except ValueError as e:
+        return bad_request(e)
     except Exception as e:
         return JsonResponse({
             'status': 'error',
@@ -0,0 +1,199 @@
+"""
+Content-addressed on-disk cache of generated images.
+
+Generated images are re-encoded with Pillow (``FORMAT`` at ``QUALITY``,
+scaled down to at most ``MAX_SIZE`` pixels a side) and stored under the
+SHA-256 of the encoded bytes, which is also their ETag. A SQLite index maps
+each normalized prompt to its image, so customers whose recommendations
+share a title share one generation. Once the images take more than
+``MAX_BYTES``, the least recently served are evicted.
+"""
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image
+
+from llmGateway.cache import normalize_prompt
+from llmGateway.client import IMAGE_MODEL
+from telemetry.metrics import registry
+
+DEFAULT_IMAGE_CACHE_SETTINGS = {
+    "PATH": None,
+    "MAX_BYTES": 256 * 1024 * 1024,
+    "FORMAT": "WEBP",
+    "QUALITY": 80,
+    "MAX_SIZE": 768,
+    "RESPONSE": "base64",
+}
+
+# File extension and MIME type per Pillow format
+FORMATS = {"WEBP": ("webp", "image/webp"), "JPEG": ("jpg", "image/jpeg")}
+MIME_TYPES = {extension: mime_type for extension, mime_type in FORMATS.values()}
+
+
+def encode_image(data, image_format, quality, max_size):
+    """Re-encodes image bytes in ``image_format``, at most ``max_size`` pixels on either side."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((max_size, max_size))
+        if image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA")
+        output = io.BytesIO()
+        image.save(output, image_format, quality=quality)
+    return output.getvalue()
+
+
+class CachedImage:
+    __slots__ = ("digest", "extension")
+
+    def __init__(self, digest, extension):
+        self.digest = digest
+        self.extension = extension
+
+    @property
+    def name(self):
+        return f"{self.digest}.{self.extension}"
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.extension]
+
+
+class ImageCache:
+    """Encoded images in ``PATH`` named by content hash, with a SQLite index of prompts and sizes."""
+
+    def __init__(self, options):
+        self.options = options
+        self.path = str(options["PATH"])
+        self.extension = FORMATS[options["FORMAT"]][0]
+        os.makedirs(self.path, exist_ok=True)
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS prompts (key TEXT PRIMARY KEY, digest TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS images "
+                "(digest TEXT PRIMARY KEY, extension TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(os.path.join(self.path, "index.sqlite3"), timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def prompt_key(self, prompt):
+        """Prompts that differ only in case or whitespace share a key; so do requests under the same encoding."""
+        raw = "\x00".join([
+            IMAGE_MODEL, normalize_prompt(prompt).lower(),
+            self.options["FORMAT"], str(self.options["QUALITY"]), str(self.options["MAX_SIZE"]),
+        ])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def file_path(self, image):
+        return os.path.join(self.path, image.digest[:2], image.name)
+
+    def lookup(self, prompt):
+        """Returns the cached image for a prompt, or None."""
+        row = self.connection().execute(
+            "SELECT images.digest, images.extension FROM prompts JOIN images USING (digest) WHERE prompts.key = ?",
+            (self.prompt_key(prompt),),
+        ).fetchone()
+        image = CachedImage(*row) if row else None
+        if image is not None and not os.path.exists(self.file_path(image)):
+            self.forget([image.digest])
+            image = None
+        registry.increment("aidhp_image_cache_total", outcome="hit" if image else "miss")
+        if image is not None:
+            with self.connection() as conn:
+                conn.execute("UPDATE images SET accessed = ? WHERE digest = ?", (time.time(), image.digest))
+        return image
+
+    def store(self, prompt, data):
+        """Encodes and stores generated image bytes for a prompt; returns the cached image."""
+        encoded = encode_image(data, self.options["FORMAT"], self.options["QUALITY"], self.options["MAX_SIZE"])
+        image = CachedImage(hashlib.sha256(encoded).hexdigest(), self.extension)
+        path = self.file_path(image)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(encoded)
+            os.replace(temporary, path)
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO images (digest, extension, size, accessed) VALUES (?, ?, ?, ?)",
+                (image.digest, image.extension, len(encoded), time.time()),
+            )
+            conn.execute("INSERT OR REPLACE INTO prompts (key, digest) VALUES (?, ?)", (self.prompt_key(prompt), image.digest))
+        registry.observe("aidhp_image_bytes", len(encoded), stage="encoded")
+        registry.observe("aidhp_image_bytes", len(data), stage="generated")
+        self.evict()
+        return image
+
+    def read(self, image):
+        try:
+            with open(self.file_path(image), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def evict(self):
+        """Drops the least recently served images until the cache is back under MAX_BYTES."""
+        conn = self.connection()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+        if total <= self.options["MAX_BYTES"]:
+            return
+        evicted = []
+        for digest, size in conn.execute("SELECT digest, size FROM images ORDER BY accessed").fetchall():
+            if total <= self.options["MAX_BYTES"] * 0.9:
+                break
+            evicted.append(digest)
+            total -= size
+        self.forget(evicted)
+        registry.increment("aidhp_image_cache_evictions_total", len(evicted))
+
+    def forget(self, digests):
+        with self.connection() as conn:
+            rows = conn.execute(
+                f"SELECT digest, extension FROM images WHERE digest IN ({','.join('?' * len(digests))})", digests,
+            ).fetchall()
+            conn.executemany("DELETE FROM prompts WHERE digest = ?", [(digest,) for digest in digests])
+            conn.executemany("DELETE FROM images WHERE digest = ?", [(digest,) for digest in digests])
+        for row in rows:
+            try:
+                os.remove(self.file_path(CachedImage(*row)))
+            except FileNotFoundError:
+                pass
+
+
+registry.describe("aidhp_image_cache_total", "Image cache lookups by outcome")
+registry.describe("aidhp_image_cache_evictions_total", "Images evicted from the image cache")
+registry.describe("aidhp_image_bytes", "Image sizes as generated and as stored")
+
+
+def image_cache_settings():
+    return {**DEFAULT_IMAGE_CACHE_SETTINGS, **getattr(settings, "IMAGE_CACHE", {})}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """Returns the process-wide image cache, or None when IMAGE_CACHE["PATH"] is not set."""
+    global _cache
+    options = image_cache_settings()
+    if not options["PATH"]:
+        return None
+    if _cache is None or _cache.options != options:
+        with _cache_lock:
+            if _cache is None or _cache.options != options:
+                _cache = ImageCache(options)
+    return _cache
@@ -0,0 +1,216 @@
+"""
+Image generation shared by the image views and speculative jobs.
+
+The content recommender knows the image prompt (the first recommended title)
+one model round trip before the client asks /api/imageGen/ for it. With
+``SPECULATIVE_IMAGES["ENABLED"]`` it calls ``speculate`` to generate that
+image in the background, so the follow-up request finds it ready.
+
+Finished images go to the image cache, the results table shared by every
+worker process. Within a process, ``ImageJobs`` keeps each job until a
+request claims it. Speculative calls run in their own, lowest scheduler
+class, so they never take queue places from requested images. A request that
+claims a job still waiting for a worker cancels it and generates at its own
+priority; a request that claims a running job waits for it, within its own
+deadline. A job nobody claims within ``CLAIM_TIMEOUT`` seconds is cancelled,
+or dropped once done if it had already started.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from django.conf import settings
+
+from llmGateway.gateway import generate_image
+from llmGateway.scheduler import get_scheduler, remaining_ms
+from telemetry.metrics import registry
+
+from .cache import get_image_cache
+
+DEFAULT_SPECULATIVE_SETTINGS = {
+    "ENABLED": False,
+    "WORKERS": 2,
+    "MAX_PENDING": 32,
+    "CLAIM_TIMEOUT": 120,
+}
+
+# Scheduler endpoint of speculative calls: a class below requested images
+SPECULATIVE_ENDPOINT = "image_speculative"
+
+
+def build_contents(prompt):
+    return 'Create an image for ' + prompt
+
+
+def cached_image(prompt):
+    """The cached image for a prompt and the image cache, or (None, cache) on a miss."""
+    cache = get_image_cache()
+    return (cache.lookup(prompt) if cache else None), cache
+
+
+def store_image(cache, prompt, image_data):
+    """Stores freshly generated bytes; without a cache they are returned as they are."""
+    if not image_data or cache is None:
+        return image_data
+    return cache.store(prompt, image_data)
+
+
+def speculative_settings():
+    return {**DEFAULT_SPECULATIVE_SETTINGS, **getattr(settings, "SPECULATIVE_IMAGES", {})}
+
+
+class ImageJob:
+    __slots__ = ("prompt", "created", "future")
+
+    def __init__(self, prompt, created):
+        self.prompt = prompt
+        self.created = created
+        self.future = None
+
+
+class ImageJobs:
+    """In-flight and finished speculative generations by prompt, until claimed or expired."""
+
+    def __init__(self, options):
+        self.options = options
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.pool = ThreadPoolExecutor(max_workers=options["WORKERS"], thread_name_prefix="speculative-image")
+
+    def key(self, prompt):
+        return " ".join(prompt.lower().split())
+
+    def expired(self, job, now):
+        return now - job.created > self.options["CLAIM_TIMEOUT"]
+
+    def start(self, prompt):
+        """Queues a prompt's image unless it already has a job or too many are pending; returns True if queued."""
+        key = self.key(prompt)
+        if not key:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            self.sweep(now)
+            if key in self.jobs:
+                return False
+            if len(self.jobs) >= self.options["MAX_PENDING"]:
+                registry.increment("aidhp_image_speculative_total", event="skipped")
+                return False
+            job = self.jobs[key] = ImageJob(prompt, now)
+            job.future = self.pool.submit(self.run, job)
+        registry.increment("aidhp_image_speculative_total", event="started")
+        return True
+
+    def run(self, job):
+        # No request came for the image while the job waited for a worker
+        if self.expired(job, time.monotonic()):
+            registry.increment("aidhp_image_speculative_total", event="cancelled")
+            return None
+        try:
+            image, cache = cached_image(job.prompt)
+            if image is None:
+                image_data = generate_image(SPECULATIVE_ENDPOINT, build_contents(job.prompt))
+                image = store_image(cache, job.prompt, image_data)
+        except Exception:
+            # Overloaded, circuit open or upstream errors: a claimer generates it itself
+            registry.increment("aidhp_image_speculative_total", event="failed")
+            raise
+        return image
+
+    def sweep(self, now):
+        """Forgets jobs past CLAIM_TIMEOUT, cancelling those still queued. Call with the lock held."""
+        for key in [key for key, job in self.jobs.items() if self.expired(job, now)]:
+            job = self.jobs.pop(key)
+            if job.future.cancel():
+                registry.increment("aidhp_image_speculative_total", event="cancelled")
+            else:
+                registry.increment("aidhp_image_speculative_total", event="unclaimed")
+
+    def take(self, prompt):
+        """
+        Removes a prompt's job from the table and returns its future, or None
+        when there is none or it had not started (it is then cancelled).
+        """
+        with self.lock:
+            self.sweep(time.monotonic())
+            job = self.jobs.pop(self.key(prompt), None)
+        if job is None:
+            return None
+        if job.future.cancel():
+            registry.increment("aidhp_image_speculative_total", event="preempted")
+            return None
+        registry.increment("aidhp_image_speculative_total", event="claimed")
+        return job.future
+
+    def wait_timeout(self):
+        """
+        Seconds a claimer may wait for a running job: what is left of its
+        request deadline, else the timeout its own image call would get.
+        """
+        left = remaining_ms()
+        if left is not None:
+            return left / 1000
+        scheduler = get_scheduler()
+        return scheduler.options["TIMEOUT"].get(scheduler.priority("image"), 60)
+
+    def claim(self, prompt):
+        """
+        The image of a prompt's job, waiting for it if still running; None
+        when there is no usable job or it does not finish in time.
+        """
+        future = self.take(prompt)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=self.wait_timeout())
+        except FutureTimeout:
+            registry.increment("aidhp_image_speculative_total", event="timed_out")
+            return None
+        except Exception:
+            return None
+
+    async def aclaim(self, prompt):
+        """Async counterpart of ``claim``; waiting does not block the event loop."""
+        future = self.take(prompt)
+        if future is None:
+            return None
+        try:
+            # shield: timing out must not cancel the job, which still fills the image cache
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=self.wait_timeout())
+        except asyncio.TimeoutError:
+            registry.increment("aidhp_image_speculative_total", event="timed_out")
+            return None
+        except Exception:
+            return None
+
+    def __len__(self):
+        return len(self.jobs)
+
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def get_image_jobs():
+    """Returns the process-wide job table, rebuilt when SPECULATIVE_IMAGES changes."""
+    global _jobs
+    options = speculative_settings()
+    if _jobs is None or _jobs.options != options:
+        with _jobs_lock:
+            if _jobs is None or _jobs.options != options:
+                if _jobs is not None:
+                    _jobs.pool.shutdown(wait=False, cancel_futures=True)
+                _jobs = ImageJobs(options)
+    return _jobs
+
+
+def speculate(response):
+    """Starts generating the image of a recommendation response in the background, when enabled."""
+    prompt = response.get('image_gen_prompt') if isinstance(response, dict) else None
+    if prompt and speculative_settings()["ENABLED"]:
+        get_image_jobs().start(prompt)
+    return response
+
+
+registry.describe("aidhp_image_speculative_total", "Speculative image jobs by event (started, claimed, cancelled, ...)")
@@ -1,3 +1,176 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import AsyncRequestFactory, TestCase, override_settings
+
+from llmGateway.cache import get_cache
+from llmGateway.fake import fake_png
+from llmGateway.scheduler import deadline
+
+from .cache import ImageCache, get_image_cache, image_cache_settings
+from .generation import SPECULATIVE_ENDPOINT, get_image_jobs
+from .views import AsyncImageGenView
+
+
+@override_settings(GEMINI_BACKEND="fake", FAKE_GEMINI={"LATENCY_MS": 0, "IMAGE_BYTES": 64 * 1024})
+class ImageCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(IMAGE_CACHE={"PATH": directory.name, "MAX_SIZE": 128})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def post(self, body):
+        return self.client.post("/api/imageGen/", body, content_type="application/json")
+
+    def test_same_title_is_generated_once(self):
+        with mock.patch("imageGen.views.generate_image", return_value=fake_png(7, 64 * 1024)) as generate:
+            first = self.post({"prompt": "High-Yield  Savings Accounts"}).json()
+            second = self.post({"prompt": "high-yield savings accounts", "response": "url"}).json()
+        self.assertEqual(generate.call_count, 1)
+
+        self.assertEqual(first["mime_type"], "image/webp")
+        self.assertLess(len(base64.b64decode(first["base64_image"])), 64 * 1024)
+        self.assertEqual(second["etag"], first["etag"])
+        self.assertNotIn("base64_image", second)
+
+        image = self.client.get(second["image_url"])
+        self.assertEqual(image.status_code, 200)
+        self.assertEqual(image["Content-Type"], "image/webp")
+        self.assertEqual(image.content, base64.b64decode(first["base64_image"]))
+        self.assertEqual(image["ETag"], f'"{first["etag"]}"')
+        revalidated = self.client.get(second["image_url"], HTTP_IF_NONE_MATCH=image["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_least_recently_served_images_are_evicted(self):
+        cache = get_image_cache()
+        images = [cache.store(f"title {seed}", fake_png(seed, 64 * 1024)) for seed in range(3)]
+        cache.lookup("title 0")
+        size = max(len(cache.read(image)) for image in images)
+
+        with override_settings(IMAGE_CACHE={**image_cache_settings(), "MAX_BYTES": 3 * size}):
+            cache = get_image_cache()
+            cache.store("title 3", fake_png(3, 64 * 1024))
+            self.assertIsNone(cache.lookup("title 1"))
+            self.assertIsNone(cache.read(images[1]))
+            self.assertIsNone(cache.lookup("title 2"))
+            self.assertIsNotNone(cache.lookup("title 0"))
+            self.assertIsNotNone(cache.lookup("title 3"))
+
+    def test_unknown_response_mode(self):
+        self.assertEqual(self.post({"prompt": "Auto Loans", "response": "gif"}).status_code, 400)
+
+    def test_upstream_value_errors_are_server_errors(self):
+        with mock.patch("imageGen.views.generate_image", side_effect=ValueError("bad upstream payload")):
+            response = self.post({"prompt": "Auto Loans"})
+        self.assertEqual(response.status_code, 500)
+
+    async def test_async_view_keeps_cache_io_off_the_event_loop(self):
+        on_loop = []
+
+        def recording(method):
+            def wrapper(*args, **kwargs):
+                on_loop.append(asyncio._get_running_loop() is not None)
+                return method(*args, **kwargs)
+            return wrapper
+
+        view = AsyncImageGenView.as_view()
+        with mock.patch.object(ImageCache, "lookup", recording(ImageCache.lookup)), \
+                mock.patch.object(ImageCache, "store", recording(ImageCache.store)), \
+                mock.patch.object(ImageCache, "read", recording(ImageCache.read)):
+            for _ in range(2):
+                response = await view(AsyncRequestFactory().post(
+                    "/api/imageGen/", json.dumps({"prompt": "Auto Loans"}), content_type="application/json"
+                ))
+                self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(len(on_loop), 4)
+        self.assertFalse(any(on_loop))
+
+
+
+@override_settings(
+    GEMINI_BACKEND="fake", FAKE_GEMINI={"LATENCY_MS": 0, "IMAGE_BYTES": 64 * 1024}, SERVING_TABLE_PATH=None,
+    SPECULATIVE_IMAGES={"ENABLED": True, "WORKERS": 1, "MAX_PENDING": 8, "CLAIM_TIMEOUT": 60},
+)
+class SpeculativeImageTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(IMAGE_CACHE={"PATH": directory.name, "MAX_SIZE": 128})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def blocking_generate(self, endpoint, contents):
+        self.assertEqual(endpoint, SPECULATIVE_ENDPOINT)
+        self.release.wait(5)
+        return fake_png(1, 64 * 1024)
+
+    def test_cdr_starts_image_that_image_gen_claims(self):
+        cdr = self.client.post("/api/cdr/", {"message": "IND0000411"}, content_type="application/json").json()
+        prompt = cdr["image_gen_prompt"]
+        self.assertTrue(prompt)
+        job = get_image_jobs().jobs[get_image_jobs().key(prompt)]
+        job.future.result(timeout=5)
+
+        with mock.patch("imageGen.views.generate_image") as generate:
+            image = self.client.post("/api/imageGen/", {"prompt": prompt}, content_type="application/json").json()
+        generate.assert_not_called()
+        self.assertEqual(image["mime_type"], "image/webp")
+        self.assertEqual(len(get_image_jobs()), 0)
+
+    def test_claim_waits_for_running_job(self):
+        jobs = get_image_jobs()
+        with mock.patch("imageGen.generation.generate_image", side_effect=self.blocking_generate):
+            jobs.start("Index Funds")
+            future = jobs.jobs[jobs.key("Index Funds")].future
+            while not future.running():
+                time.sleep(0.01)
+            threading.Timer(0.05, self.release.set).start()
+            with mock.patch("imageGen.views.generate_image") as generate:
+                response = self.client.post("/api/imageGen/", {"prompt": "index funds"}, content_type="application/json")
+        generate.assert_not_called()
+        self.assertTrue(response.json()["etag"])
+
+    def test_claim_gives_up_at_the_request_deadline(self):
+        jobs = get_image_jobs()
+        with mock.patch("imageGen.generation.generate_image", side_effect=self.blocking_generate):
+            jobs.start("Index Funds")
+            future = jobs.jobs["index funds"].future
+            while not future.running():
+                time.sleep(0.01)
+            started = time.monotonic()
+            with deadline(0.1):
+                self.assertIsNone(jobs.claim("Index Funds"))
+            self.assertLess(time.monotonic() - started, 1)
+            self.release.set()
+            self.assertTrue(future.result(timeout=5))
+
+    def test_unclaimed_jobs_are_cancelled(self):
+        jobs = get_image_jobs()
+        with mock.patch("imageGen.generation.generate_image", side_effect=self.blocking_generate) as generate:
+            jobs.start("Running")
+            while not jobs.jobs["running"].future.running():
+                time.sleep(0.01)
+            jobs.start("Queued")
+            queued = jobs.jobs["queued"].future
+            for job in jobs.jobs.values():
+                job.created -= 120
+            jobs.start("Late")
+            self.assertTrue(queued.cancelled())
+            self.assertEqual(list(jobs.jobs), ["late"])
+
+            # Expired before a worker got to it: never generated
+            jobs.jobs["late"].created -= 120
+            self.release.set()
+            self.assertIsNone(jobs.jobs["late"].future.result(timeout=5))
+        self.assertEqual(generate.call_count, 1)
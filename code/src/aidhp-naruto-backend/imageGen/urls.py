@@ -1,6 +1,15 @@
-from django.urls import path
-from .views import ImageGenView
+from django.conf import settings
+from django.urls import path, re_path
+from django.views.decorators.csrf import csrf_exempt
+from .views import AsyncImageGenView, ImageGenView, image_file_view
+
+# Async views hold a coroutine, not a worker thread, per in-flight Gemini call
+if settings.ASYNC_VIEWS:
+    view = csrf_exempt(AsyncImageGenView.as_view())
+else:
+    view = ImageGenView.as_view()
 
 urlpatterns = [
-    path('imageGen/', ImageGenView.as_view(), name='image_generation'),
-]
\ No newline at end of file
+    path('imageGen/', view, name='image_generation'),
+    re_path(r'^images/(?P<digest>[0-9a-f]{64})\.(?P<extension>webp|jpg)$', image_file_view, name='image_file'),
+]
@@ -1,62 +1,129 @@
-from django.shortcuts import render
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.urls import reverse
+from django.views import View
+from django.views.decorators.http import require_http_methods
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import google.generativeai as genai
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-import os
 import base64
+import json
+from asgiref.sync import sync_to_async
+from llmGateway.gateway import agenerate_image, generate_image
+from llmGateway.scheduler import Overloaded, overloaded_response
+from .cache import CachedImage, get_image_cache, image_cache_settings
+from .generation import build_contents, cached_image, get_image_jobs, store_image
 
-# Load environment variables
-load_dotenv()
+NOT_GENERATED = {
+    'message': 'Image not generated successfully',
+    'base64_image': ''
+}
 
-class ImageGenView(APIView):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
+RESPONSE_MODES = ('base64', 'url')
+
+
+def response_mode(data):
+    mode = data.get('response') or image_cache_settings()['RESPONSE']
+    if mode not in RESPONSE_MODES:
+        raise ValueError(f"response must be one of {', '.join(RESPONSE_MODES)}.")
+    return mode
+
+
+def build_response(request, image, mode='base64'):
+    if not image:
+        return NOT_GENERATED
+    try:
+        if not isinstance(image, CachedImage):
+            return {
+                'message': 'Image generated successfully',
+                'base64_image': base64.b64encode(image).decode('utf-8'),
+                'mime_type': 'image/png'
+            }
+        response = {
+            'message': 'Image generated successfully',
+            'image_url': request.build_absolute_uri(
+                reverse('image_file', kwargs={'digest': image.digest, 'extension': image.extension})
+            ),
+            'etag': image.digest,
+            'mime_type': image.mime_type
+        }
+        if mode == 'base64':
+            image_data = get_image_cache().read(image)
+            if not image_data:
+                return NOT_GENERATED
+            response['base64_image'] = base64.b64encode(image_data).decode('utf-8')
+        return response
+    except Exception as e:
+        return NOT_GENERATED
 
+
+class ImageGenView(APIView):
     def post(self, request):
-        client = genai.Client(api_key='GEMINI_API_KEY')
-        contents = 'Create an image for ' + request.data.get('prompt', '')
+        prompt = request.data.get('prompt', '')
+        try:
+            mode = response_mode(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            response = client.models.generate_content(
-                model="gemini-2.0-flash-exp-image-generation",
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    response_modalities=['Text', 'Image']
-                )
-            )
-
-            image_found = False
-            # Loop through the response parts
-            for idx, part in enumerate(response.candidates[0].content.parts):
-                if part.inline_data is not None:
-                    if not part.inline_data.data:
-                        continue
-
-                    try:
-                        base64_utf8_string = base64.b64encode(part.inline_data.data).decode('utf-8')
-                        image_found = True
-                        return Response({
-                            'message': 'Image generated successfully',
-                            'base64_image': base64_utf8_string
-                        }, status=status.HTTP_200_OK)
-
-                    except Exception as e:
-                        return Response({
-                            'message': 'Image not generated successfully',
-                            'base64_image': ''
-                        }, status=status.HTTP_200_OK)
-
-            if not image_found:
-                return Response({
-                            'message': 'Image not generated successfully',
-                            'base64_image': ''
-                        }, status=status.HTTP_200_OK)
+            # A speculative job started by /api/cdr/ may already have it, or be generating it
+            image = get_image_jobs().claim(prompt)
+            if image is None:
+                image, cache = cached_image(prompt)
+                if image is None:
+                    image = store_image(cache, prompt, generate_image("image", build_contents(prompt)))
+            return Response(build_response(request, image, mode), status=status.HTTP_200_OK)
 
+        except Overloaded as e:
+            return overloaded_response(e)
         except Exception as e:
             return Response({
                 'error': f'API Request Failed: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncImageGenView(View):
+    """Async version of ImageGenView for ASGI deployments."""
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b"{}")
+            prompt = data.get('prompt', '')
+            mode = response_mode(data)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            image = await get_image_jobs().aclaim(prompt)
+            if image is None:
+                # The image cache is an SQLite index plus files: its I/O stays off the event loop
+                image, cache = await sync_to_async(cached_image)(prompt)
+                if image is None:
+                    image_data = await agenerate_image("image", build_contents(prompt))
+                    image = await sync_to_async(store_image)(cache, prompt, image_data)
+            return JsonResponse(await sync_to_async(build_response)(request, image, mode), status=status.HTTP_200_OK)
+
+        except Overloaded as e:
+            return overloaded_response(e)
+        except Exception as e:
+            return JsonResponse({'error': f'API Request Failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_http_methods(["GET", "HEAD"])
+def image_file_view(request, digest, extension):
+    """
+    Serves a cached image. Its name is the hash of its bytes, so it never
+    changes: clients may keep it for good and revalidate with If-None-Match.
+    """
+    etag = f'"{digest}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        cache = get_image_cache()
+        image = CachedImage(digest, extension)
+        image_data = cache.read(image) if cache else None
+        if image_data is None:
+            return JsonResponse({'error': 'Image not found.'}, status=status.HTTP_404_NOT_FOUND)
+        response = HttpResponse(image_data, content_type=image.mime_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
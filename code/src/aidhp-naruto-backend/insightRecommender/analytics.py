@@ -0,0 +1,386 @@
+"""
+Analytics over every transaction, for the insights endpoint.
+
+``InsightEngine`` aggregates transaction.dat (the "old" window) and
+txnadapt.dat plus its log (the "recent" window) with NumPy: spend by TYPE,
+MODE, month and segment, and per-customer recency, frequency, monetary
+value and spend per product family. The aggregates are sums and maxima, so
+rows appended to the transaction log are folded in by ``refresh`` without
+rescanning the tables.
+
+``summary`` derives spend trends, RFM churn-risk buckets and preference
+distributions from the aggregates; ``describe`` renders a summary as the
+compact text the LLM is asked to narrate. Per-customer scores live in
+``scoring``.
+"""
+import threading
+from collections import Counter
+
+import numpy as np
+
+from dataStore.columnar import encode_column
+from dataStore.summaries import format_amount
+
+SEGMENTS = ("individuals", "organizations")
+WINDOWS = ("old", "recent")
+RISK_LEVELS = ("low", "medium", "high")
+NO_DATE = np.iinfo(np.int64).min
+
+# Churn risk from the weighted RFM score 2R + F + M (4 to 20)
+HIGH_RISK_MAX_SCORE = 9
+LOW_RISK_MIN_SCORE = 15
+
+# Product families for propensity, with the TYPE keywords that signal them;
+# a TYPE counts for the first family it matches, or for none
+PRODUCTS = (
+    ("Credit Cards", ("credit card",)),
+    ("Retirement & Pension", ("retirement", "pension", "social security")),
+    ("Insurance", ("insurance",)),
+    ("Loans & Mortgages", ("loan", "emi", "mortgage", "debt")),
+    ("Investments", ("investment", "stock", "bond", "dividend", "securities", "share buyback", "cryptocurrency", "gold")),
+    ("Savings & Deposits", ("deposit", "savings", "interest income", "salary credit")),
+    ("Foreign Exchange", ("foreign", "international", "customs", "import duty")),
+    ("Tax Planning", ("tax",)),
+)
+
+
+def quintile_scores(values):
+    """
+    Scores values 1-5 by percentile rank (5 highest). Ties share the midpoint
+    of their ranks, so a value every customer has scores a neutral 3.
+    """
+    if not len(values):
+        return np.zeros(0, dtype=np.int8)
+    ordered = np.sort(values)
+    midpoint = (np.searchsorted(ordered, values, "left") + np.searchsorted(ordered, values, "right")) / (2 * len(values))
+    return (1 + np.minimum(4, (midpoint * 5).astype(np.int64))).astype(np.int8)
+
+
+def product_codes(vocab):
+    """Product family index of every TYPE code; ``len(PRODUCTS)`` for types of no family."""
+    codes = []
+    for name in vocab["TYPE"].values:
+        name = name.lower()
+        codes.append(next((i for i, (_, keywords) in enumerate(PRODUCTS) if any(k in name for k in keywords)), len(PRODUCTS)))
+    return np.array(codes, dtype=np.int64)
+
+
+def grow(array, size):
+    """Pads the last axis of an aggregate with zeros when a vocabulary has grown."""
+    if array.shape[-1] >= size:
+        return array
+    padding = [(0, 0)] * (array.ndim - 1) + [(0, size - array.shape[-1])]
+    return np.pad(array, padding)
+
+
+def change_pct(before, after):
+    return round(float((after - before) / before * 100), 1) if before else None
+
+
+class Window:
+    """Additive aggregates of one transaction window."""
+
+    def __init__(self, customers):
+        self.rows = 0
+        self.type_spend = np.zeros((len(SEGMENTS), 0))
+        self.mode_spend = np.zeros((len(SEGMENTS), 0))
+        self.month_spend = {}
+        self.last = np.full(customers, NO_DATE, dtype=np.int64)
+        self.count = np.zeros(customers, dtype=np.int64)
+        self.total = np.zeros(customers)
+        # Spend per customer and product family, plus a last column for other types
+        self.product_spend = np.zeros((customers, len(PRODUCTS) + 1))
+
+    def add(self, owner, segment, types, modes, amounts, dates, vocab):
+        """Folds in rows given as arrays; ``owner`` indexes the engine's customers."""
+        amounts = amounts.astype(np.float64)
+        n_types, n_modes = len(vocab["TYPE"]), len(vocab["MODE"])
+        self.type_spend = grow(self.type_spend, n_types)
+        self.mode_spend = grow(self.mode_spend, n_modes)
+        self.type_spend += np.bincount(
+            segment * n_types + types, weights=amounts, minlength=len(SEGMENTS) * n_types,
+        ).reshape(-1, n_types)
+        self.mode_spend += np.bincount(
+            segment * n_modes + modes, weights=amounts, minlength=len(SEGMENTS) * n_modes,
+        ).reshape(-1, n_modes)
+
+        months = dates.astype("datetime64[M]").astype(np.int64)
+        keys, inverse = np.unique(months * len(SEGMENTS) + segment, return_inverse=True)
+        for key, spend in zip(keys.tolist(), np.bincount(inverse, weights=amounts)):
+            month, seg = divmod(key, len(SEGMENTS))
+            self.month_spend.setdefault(month, np.zeros(len(SEGMENTS)))[seg] += spend
+
+        np.maximum.at(self.last, owner, dates.astype("datetime64[D]").astype(np.int64))
+        self.count += np.bincount(owner, minlength=len(self.count))
+        self.total += np.bincount(owner, weights=amounts, minlength=len(self.total))
+        width = self.product_spend.shape[1]
+        self.product_spend += np.bincount(
+            owner * width + product_codes(vocab)[types], weights=amounts, minlength=self.product_spend.size,
+        ).reshape(self.product_spend.shape)
+        self.rows += len(amounts)
+
+
+class InsightEngine:
+    """Aggregates of both transaction windows for every customer of a store."""
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.cids = list(store.individuals) + list(store.organizations)
+        self.index = {cid: i for i, cid in enumerate(self.cids)}
+        self.segment = np.repeat(np.arange(len(SEGMENTS)), [len(store.individuals), len(store.organizations)])
+        self.windows = {name: Window(len(self.cids)) for name in WINDOWS}
+        self.appended = {name: 0 for name in WINDOWS}
+        self.preferences = self.count_preferences()
+        self.version = 0
+        self.cached = None
+        for name, table in self.tables():
+            for part in getattr(table, "base", table).parts():
+                self.add_part(name, part)
+
+    def tables(self):
+        return (("old", self.store.transactions), ("recent", self.store.txnadapt))
+
+    def count_preferences(self):
+        counts = []
+        for records in (self.store.individuals, self.store.organizations):
+            counter = Counter()
+            for cid in records:
+                counter.update(p.strip() for p in (records[cid].get("PREFERENCES") or "").split(",") if p.strip())
+            counts.append(counter)
+        return counts
+
+    def add_part(self, name, part):
+        lookup = np.array([self.index.get(cid, -1) for cid in part.cids.astype(str).tolist()], dtype=np.int64)
+        owner = lookup[part.owners()]
+        # Transactions of CIDs without a customer record are left out
+        known = owner >= 0
+        owner = owner[known]
+        self.windows[name].add(
+            owner, self.segment[owner], np.asarray(part.type)[known], np.asarray(part.mode)[known],
+            np.asarray(part.amount)[known], np.asarray(part.date)[known], part.vocab,
+        )
+
+    def add_rows(self, name, rows, vocab):
+        rows = [row for row in rows if row["CID"] in self.index]
+        if not rows:
+            return
+        owner = np.array([self.index[row["CID"]] for row in rows], dtype=np.int64)
+        columns = {
+            column: encode_column(column, [row[column] for row in rows], vocab)
+            for column in ("TYPE", "MODE", "AMOUNT", "DATE")
+        }
+        self.windows[name].add(
+            owner, self.segment[owner], columns["TYPE"], columns["MODE"], columns["AMOUNT"], columns["DATE"], vocab,
+        )
+
+    def refresh(self):
+        """Folds in rows appended to the transaction log since the last call."""
+        with self.lock:
+            for name, table in self.tables():
+                if not hasattr(table, "appended_since"):
+                    continue
+                rows = table.appended_since(self.appended[name])
+                if rows:
+                    self.add_rows(name, rows, table.vocab)
+                    self.appended[name] += len(rows)
+                    self.version += 1
+        return self
+
+    def as_of(self):
+        """Day number of the latest transaction in either window."""
+        latest = max(int(window.last.max(initial=NO_DATE)) for window in self.windows.values())
+        return latest if latest != NO_DATE else int(np.datetime64("today", "D").astype(np.int64))
+
+    def rfm(self):
+        """
+        Per-customer recency (days since last transaction), frequency and
+        monetary value over both windows, their 1-5 quintile scores within the
+        customer's segment (5 best),
+        the weighted RFM score and churn risk (0 low, 1 medium, 2 high),
+        aligned with ``cids``.
+        """
+        old, recent = self.windows["old"], self.windows["recent"]
+        last = np.maximum(old.last, recent.last)
+        as_of = self.as_of()
+        # Customers without any transaction count as inactive since the oldest one
+        seen = last != NO_DATE
+        recency = as_of - np.where(seen, last, last[seen].min(initial=as_of))
+        frequency = old.count + recent.count
+        monetary = old.total + recent.total
+        # Scored within each segment, since organizations spend on another scale
+        scores = {name: np.zeros(len(self.cids), dtype=np.int8) for name in ("recency", "frequency", "monetary")}
+        for i in range(len(SEGMENTS)):
+            members = self.segment == i
+            scores["recency"][members] = quintile_scores(-recency[members])
+            scores["frequency"][members] = quintile_scores(frequency[members])
+            scores["monetary"][members] = quintile_scores(monetary[members])
+        score = 2 * scores["recency"].astype(np.int64) + scores["frequency"] + scores["monetary"]
+        risk = np.ones(len(self.cids), dtype=np.int8)
+        risk[score >= LOW_RISK_MIN_SCORE] = 0
+        risk[score <= HIGH_RISK_MAX_SCORE] = 2
+        return {
+            "recency": recency, "frequency": frequency, "monetary": monetary,
+            "scores": scores, "score": score, "risk": risk,
+        }
+
+    def summary(self, top=5, months=12):
+        """JSON-ready analytics for the whole customer base, recomputed only after new rows."""
+        with self.lock:
+            if self.cached is not None and self.cached[0] == (self.version, top, months):
+                return self.cached[1]
+            summary = self.compute_summary(top, months)
+            self.cached = ((self.version, top, months), summary)
+            return summary
+
+    def compute_summary(self, top, months):
+        vocab = self.store.transactions.vocab
+        old, recent = self.windows["old"], self.windows["recent"]
+        type_recent = recent.type_spend.sum(0)
+        type_old = grow(old.type_spend.sum(0), len(type_recent))
+        mode_recent = recent.mode_spend.sum(0)
+        mode_old = grow(old.mode_spend.sum(0), len(mode_recent))
+
+        types = [
+            {"type": vocab["TYPE"].values[i], "recent_spend": float(type_recent[i]), "old_spend": float(type_old[i]),
+             "change_pct": change_pct(type_old[i], type_recent[i])}
+            for i in np.argsort(-type_recent, kind="stable")[:top]
+        ]
+        old_total, recent_total = mode_old.sum() or 1, mode_recent.sum() or 1
+        modes = [
+            {"mode": vocab["MODE"].values[i], "recent_share": round(float(mode_recent[i] / recent_total), 4),
+             "old_share": round(float(mode_old[i] / old_total), 4)}
+            for i in np.argsort(-mode_recent, kind="stable")[:top]
+        ]
+
+        end = int(np.datetime64(self.as_of(), "D").astype("datetime64[M]").astype(np.int64))
+        monthly = []
+        for month in range(end - months + 1, end + 1):
+            spend = sum((w.month_spend.get(month, 0) for w in self.windows.values()), np.zeros(len(SEGMENTS)))
+            monthly.append({
+                "month": str(np.datetime64(month, "M")), "spend": float(spend.sum()),
+                **{segment: float(spend[i]) for i, segment in enumerate(SEGMENTS)},
+            })
+
+        rfm = self.rfm()
+        segments = {}
+        for i, segment in enumerate(SEGMENTS):
+            members = self.segment == i
+            spend = recent.type_spend[i]
+            segments[segment] = {
+                "customers": int(members.sum()),
+                "recent_spend": float(spend.sum()),
+                "spend_change_pct": change_pct(old.type_spend[i].sum(), spend.sum()),
+                "top_types": [vocab["TYPE"].values[j] for j in np.argsort(-spend, kind="stable")[:3] if spend[j]],
+                "churn_risk": {level: int(((rfm["risk"] == code) & members).sum()) for code, level in enumerate(RISK_LEVELS)},
+                "preferences": [
+                    {"preference": preference, "share": round(count / max(1, int(members.sum())), 4)}
+                    for preference, count in self.preferences[i].most_common(top)
+                ],
+            }
+
+        churn = {}
+        for code, level in enumerate(RISK_LEVELS):
+            members = rfm["risk"] == code
+            churn[level] = {
+                "customers": int(members.sum()),
+                "avg_recency_days": round(float(rfm["recency"][members].mean()), 1) if members.any() else None,
+                "avg_frequency": round(float(rfm["frequency"][members].mean()), 2) if members.any() else None,
+                "avg_monetary": float(rfm["monetary"][members].mean()) if members.any() else None,
+            }
+
+        return {
+            "as_of": str(np.datetime64(self.as_of(), "D")),
+            "customers": len(self.cids),
+            "transactions": {name: window.rows for name, window in self.windows.items()},
+            "spend_by_type": types,
+            "spend_by_mode": modes,
+            "monthly_spend": monthly,
+            "segments": segments,
+            "churn_risk": churn,
+        }
+
+
+def describe(summary):
+    """Renders a summary as a few lines of text, for the prompt or as local insights."""
+    types = ", ".join(
+        f"{t['type']} {format_amount(t['recent_spend'])}"
+        + (f" ({t['change_pct']:+.0f}%)" if t["change_pct"] is not None else " (new)")
+        for t in summary["spend_by_type"]
+    )
+    modes = ", ".join(f"{m['mode']} {m['recent_share']:.0%} (was {m['old_share']:.0%})" for m in summary["spend_by_mode"])
+    months = ", ".join(f"{m['month']} {format_amount(m['spend'])}" for m in summary["monthly_spend"])
+    churn = "; ".join(
+        f"{level} {c['customers']} (last transaction {c['avg_recency_days']:.0f} days ago, "
+        f"{c['avg_frequency']:.1f} transactions, {format_amount(c['avg_monetary'])} spend on average)"
+        for level, c in summary["churn_risk"].items() if c["customers"]
+    )
+    lines = [
+        f"- Data: {summary['customers']} customers, {summary['transactions']['old']} older and "
+        f"{summary['transactions']['recent']} recent transactions up to {summary['as_of']}.",
+        f"- Top recent spend by transaction type (change vs older transactions): {types}.",
+        f"- Payment modes by share of recent spend: {modes}.",
+        f"- Monthly spend: {months}.",
+        f"- Churn risk by RFM quintiles: {churn}.",
+    ]
+    for segment, stats in summary["segments"].items():
+        change = f"{stats['spend_change_pct']:+.0f}%" if stats["spend_change_pct"] is not None else "n/a"
+        preferences = ", ".join(f"{p['preference']} {p['share']:.0%}" for p in stats["preferences"])
+        lines.append(
+            f"- {segment.capitalize()}: {stats['customers']} customers, recent spend "
+            f"{format_amount(stats['recent_spend'])} ({change} vs older), top types {', '.join(stats['top_types'])}, "
+            f"{stats['churn_risk']['high']} at high churn risk; preferences: {preferences}."
+        )
+    return "\n".join(lines)
+
+
+def market_trends(summary):
+    """Trend statements computed from a summary."""
+    trends = []
+    for t in summary["spend_by_type"][:3]:
+        if t["change_pct"] is not None:
+            trends.append(f"{t['type']} spend {'rose' if t['change_pct'] >= 0 else 'fell'} {abs(t['change_pct']):.0f}% "
+                          f"in recent transactions, to {format_amount(t['recent_spend'])}.")
+    modes = summary["spend_by_mode"]
+    if modes:
+        gainer = max(modes, key=lambda m: m["recent_share"] - m["old_share"])
+        trends.append(f"{gainer['mode']} grew from {gainer['old_share']:.1%} to {gainer['recent_share']:.1%} of spend.")
+    monthly = [m["spend"] for m in summary["monthly_spend"]]
+    if len(monthly) >= 6 and sum(monthly[-6:-3]):
+        change = change_pct(sum(monthly[-6:-3]), sum(monthly[-3:]))
+        trends.append(f"Spend over the last three months {'rose' if change >= 0 else 'fell'} {abs(change):.0f}% "
+                      f"against the three months before.")
+    return trends
+
+
+def action_strategy(summary):
+    """Retention and growth actions targeted at the groups in a summary."""
+    churn = summary["churn_risk"]
+    actions = []
+    if churn["high"]["customers"]:
+        actions.append(f"Re-engage the {churn['high']['customers']} high churn-risk customers, inactive for "
+                       f"{churn['high']['avg_recency_days']:.0f} days on average, with win-back offers.")
+    if churn["low"]["customers"]:
+        actions.append(f"Offer loyalty rewards and premium products to the {churn['low']['customers']} low-risk customers, "
+                       f"who spend {format_amount(churn['low']['avg_monetary'])} on average.")
+    for segment, stats in summary["segments"].items():
+        preferences = [p["preference"] for p in stats["preferences"][:2]]
+        if preferences:
+            actions.append(f"Promote products for {' and '.join(preferences)} to {segment}, their most common preferences.")
+        if stats["top_types"]:
+            actions.append(f"Bundle services around {stats['top_types'][0]}, the largest recent spend of {segment}.")
+    return actions
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(store):
+    """Returns the engine of ``store`` with new log rows folded in; rebuilt when the store is replaced."""
+    global _engine
+    if _engine is None or _engine.store is not store:
+        with _engine_lock:
+            if _engine is None or _engine.store is not store:
+                _engine = InsightEngine(store)
+    return _engine.refresh()
@@ -0,0 +1,124 @@
+"""
+Churn-risk and product-propensity scores for every customer.
+
+``Scores`` is computed in one NumPy pass over the ``InsightEngine``
+aggregates, so it covers the whole customer base and is recomputed only
+when the engine has folded in new transactions.
+
+The churn score is a logistic blend of features standardized within each
+segment: days since the last transaction, transaction count and spend over
+both windows, and the shift in count and spend from transaction.dat to
+txnadapt.dat. The propensity for a product family is the customer's
+recency-weighted share of spend on it, nudged by how that share moved
+between the windows, and discounted by the churn score.
+"""
+import numpy as np
+
+from .analytics import PRODUCTS, RISK_LEVELS, SEGMENTS, get_engine
+
+# Weight of each standardized feature in the churn logit; positive raises the risk
+CHURN_WEIGHTS = {
+    "recency": 1.0,
+    "frequency": -0.5,
+    "monetary": -0.5,
+    "count_shift": -0.75,
+    "spend_shift": -0.5,
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def positive_log(values):
+    return np.log1p(np.maximum(values, 0))
+
+
+def standardize(values, segment):
+    """Z-scores of ``values`` within each segment; 0 where a segment does not vary."""
+    scores = np.zeros(len(values))
+    for i in range(len(SEGMENTS)):
+        members = segment == i
+        std = values[members].std() if members.any() else 0
+        if std > 0:
+            scores[members] = (values[members] - values[members].mean()) / std
+    return scores
+
+
+def spend_shares(spend):
+    """Share of each customer's spend per product family, dropping the "other" column."""
+    spend = np.maximum(spend, 0)
+    total = spend.sum(1, keepdims=True)
+    return np.divide(spend[:, :-1], total, out=np.zeros((len(spend), spend.shape[1] - 1)), where=total > 0)
+
+
+class Scores:
+    """Scores of all customers of an engine at one version, aligned with ``engine.cids``."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.version = engine.version
+        self.as_of = str(np.datetime64(engine.as_of(), "D"))
+        old, recent = engine.windows["old"], engine.windows["recent"]
+        self.old, self.recent = old, recent
+        self.rfm = engine.rfm()
+
+        features = {
+            "recency": self.rfm["recency"].astype(np.float64),
+            "frequency": np.log1p(self.rfm["frequency"]),
+            "monetary": positive_log(self.rfm["monetary"]),
+            "count_shift": np.log1p(recent.count) - np.log1p(old.count),
+            "spend_shift": positive_log(recent.total) - positive_log(old.total),
+        }
+        logit = sum(weight * standardize(features[name], engine.segment) for name, weight in CHURN_WEIGHTS.items())
+        self.churn = 1 / (1 + np.exp(-logit))
+
+        recent_share = spend_shares(recent.product_spend)
+        affinity = spend_shares(recent.product_spend + old.product_spend / 2)
+        momentum = recent_share - spend_shares(old.product_spend)
+        self.propensity = np.clip(affinity + momentum / 2, 0, 1) * (1 - self.churn)[:, None]
+
+        ranking = np.argsort(-self.churn, kind="stable")
+        self.rankings = {None: ranking}
+        for i, segment in enumerate(SEGMENTS):
+            self.rankings[segment] = ranking[engine.segment[ranking] == i]
+
+    def customer(self, i, products=3):
+        return {
+            "cid": self.engine.cids[i],
+            "segment": SEGMENTS[self.engine.segment[i]],
+            "churn_score": round(float(self.churn[i]), 4),
+            "risk": RISK_LEVELS[self.rfm["risk"][i]],
+            "recency_days": int(self.rfm["recency"][i]),
+            "transactions": {"old": int(self.old.count[i]), "recent": int(self.recent.count[i])},
+            "spend": {"old": float(self.old.total[i]), "recent": float(self.recent.total[i])},
+            "propensity": [
+                {"product": PRODUCTS[j][0], "score": score}
+                for j in np.argsort(-self.propensity[i], kind="stable")[:products]
+                if (score := round(float(self.propensity[i, j]), 4)) > 0
+            ],
+        }
+
+    def page(self, page=1, page_size=DEFAULT_PAGE_SIZE, segment=None):
+        """One page of customers, highest churn score first."""
+        ranking = self.rankings[segment]
+        start = (page - 1) * page_size
+        return {
+            "as_of": self.as_of,
+            "count": len(ranking),
+            "page": page,
+            "page_size": page_size,
+            "results": [self.customer(i) for i in ranking[start:start + page_size].tolist()],
+        }
+
+
+_scores = None
+
+
+def get_scores(store):
+    """Returns the scores of the store's current engine, recomputed after new transactions."""
+    global _scores
+    engine = get_engine(store)
+    with engine.lock:
+        if _scores is None or _scores.engine is not engine or _scores.version != engine.version:
+            _scores = Scores(engine)
+        return _scores
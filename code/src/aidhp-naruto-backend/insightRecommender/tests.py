@@ -1,3 +1,97 @@
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
 from django.test import TestCase
 
-# Create your tests here.
+from dataStore.store import CustomerStore, get_store
+from llmGateway.cache import get_cache
+
+from .analytics import PRODUCTS, InsightEngine, product_codes, quintile_scores
+from .scoring import get_scores
+
+
+class InsightEngineTests(TestCase):
+    def test_aggregates_cover_every_transaction(self):
+        store = get_store()
+        engine = InsightEngine(store)
+        old = engine.windows["old"]
+        expected = sum(txn["AMOUNT"] for cid in store.transactions for txn in store.transactions[cid])
+        self.assertAlmostEqual(old.type_spend.sum(), expected, delta=expected * 1e-9)
+        self.assertEqual(old.rows + engine.windows["recent"].rows, store.transactions.row_count + store.txnadapt.row_count)
+
+        summary = engine.summary()
+        self.assertEqual(sum(level["customers"] for level in summary["churn_risk"].values()), len(engine.cids))
+        self.assertEqual(len(summary["monthly_spend"]), 12)
+
+    def test_quintile_scores_share_ties(self):
+        self.assertEqual(quintile_scores(np.array([7, 7, 7])).tolist(), [3, 3, 3])
+        self.assertEqual(quintile_scores(np.arange(10)).tolist(), [1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+
+    def test_log_rows_are_folded_in_incrementally(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CustomerStore(settings.DATA_DIR, settings.COLUMNAR_DATA_DIR, os.path.join(tmp, "txnadapt.log"))
+            engine = InsightEngine(store)
+            before = engine.summary()
+            cid = next(iter(store.individuals))
+            store.ingest([{"CID": cid, "TYPE": "Orbital Launch Fee", "AMOUNT": 10**18, "MODE": "Wire Transfer", "DATE": "2025-03-30"}])
+
+            summary = engine.refresh().summary()
+            self.assertIsNot(summary, before)
+            self.assertEqual(summary["transactions"]["recent"], before["transactions"]["recent"] + 1)
+            self.assertEqual(summary["spend_by_type"][0]["type"], "Orbital Launch Fee")
+            self.assertEqual(summary["as_of"], "2025-03-30")
+            # The same result as scanning everything again
+            self.assertEqual(summary, InsightEngine(store).refresh().summary())
+
+
+class ScoringTests(TestCase):
+    def test_every_customer_is_scored(self):
+        scores = get_scores(get_store())
+        self.assertEqual(len(scores.churn), len(scores.engine.cids))
+        self.assertTrue(((scores.churn > 0) & (scores.churn < 1)).all())
+        self.assertTrue((np.diff(scores.churn[scores.rankings[None]]) <= 0).all())
+        self.assertTrue(((scores.propensity >= 0) & (scores.propensity <= 1)).all())
+        self.assertIs(get_scores(get_store()), scores)
+
+    def test_types_map_to_their_product_family(self):
+        vocab = {"TYPE": SimpleNamespace(values=["Credit Card Interest Payment", "Investment in Retirement Fund", "Fast Food Purchase"])}
+        names = [PRODUCTS[code][0] if code < len(PRODUCTS) else None for code in product_codes(vocab)]
+        self.assertEqual(names, ["Credit Cards", "Retirement & Pension", None])
+
+    def test_at_risk_pages(self):
+        response = self.client.get("/api/idr/at-risk/", {"page": 2, "page_size": 5, "segment": "organizations"})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["count"], len(get_store().organizations))
+        self.assertEqual(len(body["results"]), 5)
+        self.assertTrue(all(c["segment"] == "organizations" for c in body["results"]))
+        first_page = self.client.get("/api/idr/at-risk/", {"page_size": 5, "segment": "organizations"}).json()
+        self.assertGreaterEqual(first_page["results"][-1]["churn_score"], body["results"][0]["churn_score"])
+
+        self.assertEqual(self.client.get("/api/idr/at-risk/", {"page_size": 0}).status_code, 400)
+        self.assertEqual(self.client.get("/api/idr/at-risk/", {"segment": "robots"}).status_code, 400)
+
+
+class InsightRecommenderViewTests(TestCase):
+    def test_prompt_and_response_carry_computed_figures(self):
+        get_cache().clear()
+        prompts = []
+
+        def generate_content(**kwargs):
+            prompts.append(kwargs["contents"])
+            part = SimpleNamespace(text="Spending is shifting to digital payments.")
+            return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+        with mock.patch("llmGateway.gateway.get_client", return_value=client):
+            response = self.client.post("/api/idr/", {}, content_type="application/json").json()
+
+        self.assertIn("Churn risk by RFM quintiles", prompts[0])
+        self.assertEqual(response["insights"], "Spending is shifting to digital payments.")
+        self.assertEqual(response["analytics"]["customers"], len(get_store().individuals) + len(get_store().organizations))
+        self.assertTrue(response["market_trends"])
+        self.assertTrue(any("high churn-risk" in action for action in response["action_strategy"]))
@@ -1,6 +1,15 @@
+from django.conf import settings
 from django.urls import path
-from .views import InsightRecommenderView
+from django.views.decorators.csrf import csrf_exempt
+from .views import AsyncInsightRecommenderView, AtRiskCustomersView, InsightRecommenderView
+
+# Async views hold a coroutine, not a worker thread, per in-flight Gemini call
+if settings.ASYNC_VIEWS:
+    view = csrf_exempt(AsyncInsightRecommenderView.as_view())
+else:
+    view = InsightRecommenderView.as_view()
 
 urlpatterns = [
-    path('idr/', InsightRecommenderView.as_view(), name='insight_recommender'),
+    path('idr/', view, name='insight_recommender'),
+    path('idr/at-risk/', AtRiskCustomersView.as_view(), name='at_risk_customers'),
 ]
\ No newline at end of file
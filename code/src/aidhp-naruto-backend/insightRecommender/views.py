@@ -1,70 +1,49 @@
-import os
-import pickle
-from google import generativeai as genai
+from django.http import JsonResponse
+from django.views import View
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
+from dataStore.store import get_store
+from llmGateway.breaker import CircuitOpen
+from llmGateway.gateway import agenerate_text, generate_text
+from llmGateway.scheduler import Overloaded, overloaded_response
+from .analytics import SEGMENTS, action_strategy, describe, get_engine, market_trends
+from .scoring import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, get_scores
 
-class InsightRecommenderView(APIView):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-        self.individuals = self.load_data(os.path.join(BASE_DIR, "data/individual.dat"))
-        self.organizations = self.load_data(os.path.join(BASE_DIR, "data/organization.dat"))
-        self.transactions = self.load_data(os.path.join(BASE_DIR, "data/transaction.dat"))
+INSIGHT_QUERY = (
+    "- Identify key trends in financial product and service preferences among customers.\n"
+    "- Explain the low, medium, and high churn risk groups below, identifying key factors and proactive retention strategies.\n"
+    "- Analyze spending behaviors to estimate the likelihood of purchasing financial products.\n"
+    "- Provide actionable strategies to enhance customer engagement, optimize retention, and improve business growth.\n"
+    "- Suggest market trends based on transaction data and spending patterns.\n"
+    "Do not include any introductory statements or extra information. Do not include any customer-specific data."
+)
 
-        genai.configure(api_key="GEMINI_API_KEY") 
-        self.model = genai.GenerativeModel("gemini-2.0-flash")
 
-    def load_data(self, file_path):
-        """Loads data safely from a pickle file."""
-        return pickle.load(open(file_path, "rb")) if os.path.exists(file_path) else {}
+def build_insight_query(summary):
+    """The insight prompt, grounded in figures computed over every transaction."""
+    return f"{INSIGHT_QUERY}\nBase every point on these figures for the whole customer base:\n{describe(summary)}"
 
-    def generate_insights(self):
-        """Generates business insights using sample data from the dataset."""
 
-        sample_individuals = list(self.individuals.values())[:5]
-        sample_organizations = list(self.organizations.values())[:5]
-        sample_transactions = list(self.transactions.values())[:5]
+def build_insights(insights, summary):
+    return {
+        "insights": insights or describe(summary),
+        "action_strategy": action_strategy(summary),
+        "market_trends": market_trends(summary),
+        "analytics": summary,
+    }
 
-        query = (
-            "- Identify key trends in financial product and service preferences among customers.\n"
-            "- Categorize customers into low, medium, and high churn risk groups, identifying key factors and proactive retention strategies.\n"
-            "- Analyze spending behaviors to estimate the likelihood of purchasing financial products.\n"
-            "- Provide actionable strategies to enhance customer engagement, optimize retention, and improve business growth.\n"
-            "- Suggest market trends based on transaction data and spending patterns.\n"
-            "Do not include any introductory statements or extra information. Do not include any customer-specific data."
-        )
 
+class InsightRecommenderView(APIView):
+    def generate_insights(self):
+        """Generates business insights for the customer base."""
+        summary = get_engine(get_store()).summary()
         try:
-            response = self.model.generate_content(query)
-            insights = response.text if hasattr(response, "text") else "No insights generated."
-
-            
-            action_strategy = [
-                "Implement personalized offers and loyalty programs for high-value customers.",
-                "Enhance digital banking experience to drive self-service adoption.",
-                "Develop AI-driven customer support for proactive issue resolution.",
-                "Leverage targeted marketing campaigns based on past transactions.",
-                "Introduce flexible credit solutions to encourage spending."
-            ]
-
-            
-            market_trends = [
-                "Increased adoption of mobile payments and digital wallets.",
-                "Growing demand for personalized financial products and flexible loans.",
-                "Higher transaction volume in e-commerce and subscription-based services.",
-                "Declining cash transactions in favor of digital and contactless payments.",
-                "Seasonal spikes in spending during festive periods and promotional campaigns."
-            ]
-
-            return {
-                "insights": insights,
-                "action_strategy": action_strategy,
-                "market_trends": market_trends
-            }
+            return build_insights(generate_text("idr", build_insight_query(summary)), summary)
+        except CircuitOpen:
+            return build_insights(None, summary)
+        except Overloaded:
+            raise
         except Exception as e:
             return {"error": f"Error generating insights: {str(e)}"}
 
@@ -72,6 +51,50 @@ class InsightRecommenderView(APIView):
         try:
             insights_data = self.generate_insights()
             return Response(insights_data, status=status.HTTP_200_OK)
+        except Overloaded as e:
+            return overloaded_response(e)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+class AsyncInsightRecommenderView(View):
+    """Async version of InsightRecommenderView for ASGI deployments."""
+
+    async def generate_insights(self):
+        summary = get_engine(get_store()).summary()
+        try:
+            return build_insights(await agenerate_text("idr", build_insight_query(summary)), summary)
+        except CircuitOpen:
+            return build_insights(None, summary)
+        except Overloaded:
+            raise
+        except Exception as e:
+            return {"error": f"Error generating insights: {str(e)}"}
+
+    async def post(self, request):
+        try:
+            return JsonResponse(await self.generate_insights(), status=status.HTTP_200_OK)
+        except Overloaded as e:
+            return overloaded_response(e)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AtRiskCustomersView(APIView):
+    """Customers ranked by churn score, highest first, with their product propensities."""
+
+    def get(self, request):
+        try:
+            page = int(request.query_params.get('page', 1))
+            page_size = int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "page and page_size must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+            return Response(
+                {"error": f"page must be at least 1 and page_size between 1 and {MAX_PAGE_SIZE}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        segment = request.query_params.get('segment') or None
+        if segment is not None and segment not in SEGMENTS:
+            return Response({"error": f"segment must be one of {', '.join(SEGMENTS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_scores(get_store()).page(page, page_size, segment), status=status.HTTP_200_OK)
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class LlmgatewayConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "llmGateway"
+
+    def ready(self):
+        from dataStore.store import add_change_listener
+        from telemetry.metrics import registry
+        from .gateway import collect_metrics, invalidate_customers
+        registry.add_collector(collect_metrics)
+        add_change_listener(invalidate_customers)
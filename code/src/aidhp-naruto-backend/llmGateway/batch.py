@@ -0,0 +1,117 @@
+"""
+Helpers for endpoints that answer many customers per request.
+
+Customers are split into groups that share one prompt; groups run
+concurrently up to a limit, and each group's per-customer results are
+yielded as soon as that group finishes, as NDJSON lines.
+"""
+import asyncio
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.renderers import BaseRenderer
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Lets clients send Accept: application/x-ndjson to batch endpoints."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ndjson_line(data).encode('utf-8')
+
+
+def ndjson_line(data):
+    return json.dumps(data) + "\n"
+
+
+def parse_batch_request(data):
+    """Returns (cids, batch_size, None) or (None, None, (error payload, status))."""
+    cids = data.get('cids')
+    max_cids = getattr(settings, "RECOMMENDER_BATCH_MAX_CIDS", 1000)
+    if not isinstance(cids, list) or not cids or not all(isinstance(cid, str) for cid in cids):
+        return None, None, ({"error": "cids must be a non-empty list of customer IDs."}, status.HTTP_400_BAD_REQUEST)
+    if len(cids) > max_cids:
+        return None, None, ({"error": f"At most {max_cids} cids per request."}, status.HTTP_400_BAD_REQUEST)
+
+    limit = getattr(settings, "RECOMMENDER_BATCH_SIZE", 10)
+    try:
+        batch_size = max(1, min(int(data.get('batch_size') or limit), limit))
+    except (TypeError, ValueError):
+        return None, None, ({"error": "batch_size must be an integer."}, status.HTTP_400_BAD_REQUEST)
+    # Duplicates are answered once
+    return list(dict.fromkeys(cids)), batch_size, None
+
+
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def failed_group(group, e):
+    return [{"cid": cid, "error": str(e)} for cid in group]
+
+
+def run_batches(groups, handle_group, concurrency=None):
+    """
+    Returns an iterator of NDJSON lines for every result of
+    ``handle_group(group)`` (a list of per-customer dicts), group by group in
+    completion order. A group that raises yields an error line per customer
+    instead of ending the stream. Call it in the view: groups run in a copy
+    of the context at the call, so the request's deadline and trace reach
+    them although the response is read after the middleware has returned.
+    """
+    return batch_lines(groups, handle_group, concurrency, contextvars.copy_context())
+
+
+def batch_lines(groups, handle_group, concurrency, context):
+    concurrency = concurrency or getattr(settings, "RECOMMENDER_BATCH_CONCURRENCY", 4)
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    # A context can be entered by one thread at a time: each group gets its own copy
+    futures = {pool.submit(context.copy().run, handle_group, group): group for group in groups}
+    try:
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                results = failed_group(futures[future], e)
+            for result in results:
+                yield ndjson_line(result)
+    finally:
+        # Runs on client disconnect too: groups not started yet are dropped
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def arun_batches(groups, handle_group, concurrency=None):
+    """Async counterpart of ``run_batches``; ``handle_group`` is a coroutine function."""
+    return abatch_lines(groups, handle_group, concurrency, contextvars.copy_context())
+
+
+async def abatch_lines(groups, handle_group, concurrency, context):
+    semaphore = asyncio.Semaphore(concurrency or getattr(settings, "RECOMMENDER_BATCH_CONCURRENCY", 4))
+
+    async def run(group):
+        async with semaphore:
+            try:
+                return await handle_group(group)
+            except Exception as e:
+                return failed_group(group, e)
+
+    tasks = [asyncio.get_running_loop().create_task(run(group), context=context.copy()) for group in groups]
+    try:
+        for task in asyncio.as_completed(tasks):
+            for result in await task:
+                yield ndjson_line(result)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def ndjson_response(lines):
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
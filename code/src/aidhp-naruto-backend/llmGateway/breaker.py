@@ -0,0 +1,162 @@
+"""
+Circuit breaker around upstream Gemini calls.
+
+After ``FAILURE_THRESHOLD`` consecutive failed calls to a model its circuit
+opens: for ``COOLDOWN`` seconds every call fails at once with
+``CircuitOpen`` instead of waiting out a timeout, and views answer from
+local data. The first call after the cooldown is let through as a probe
+(half-open); its success closes the circuit and its failure opens it again.
+
+Failures are errors and timeouts of the upstream call. Calls rejected by
+the scheduler and client errors other than 429 (e.g. a malformed request)
+do not count, since they say nothing about the upstream's health.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from google.genai import errors
+from rest_framework import status
+
+from telemetry.metrics import registry
+
+from .scheduler import Overloaded
+
+DEFAULT_BREAKER_SETTINGS = {
+    "ENABLED": True,
+    "FAILURE_THRESHOLD": 5,
+    "COOLDOWN": 30,
+    # Seconds an upstream call of each endpoint may take before it counts as failed
+    "TIMEOUT": {"chat": 15, "adr": 10, "cdr": 10, "idr": 20, "graph": 20, "image": 45, "image_speculative": 45},
+}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Overloaded):
+    """The upstream is considered down; callers should use a local fallback."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def is_failure(error):
+    if isinstance(error, Overloaded):
+        return False
+    if isinstance(error, errors.ClientError):
+        return error.code == 429
+    return True
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold, cooldown):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def before(self):
+        """Admits a call or raises CircuitOpen; returns True when the call is the probe."""
+        with self.lock:
+            if self.state == CLOSED:
+                return False
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+        raise CircuitOpen(f"{self.name} is unavailable; serving a fallback.", retry_after=max(1, remaining))
+
+    def after(self, probe, error=None):
+        with self.lock:
+            if probe:
+                self.probing = False
+            if error is None:
+                self.state, self.failures = CLOSED, 0
+            elif is_failure(error):
+                self.failures += 1
+                if probe or self.failures >= self.failure_threshold:
+                    self.state, self.opened_at = OPEN, time.monotonic()
+
+    @contextmanager
+    def guard(self):
+        """Runs the enclosed upstream call through the breaker; also usable around ``await``."""
+        probe = self.before()
+        try:
+            yield
+        except Exception as e:
+            self.after(probe, e)
+            raise
+        except BaseException:
+            # Cancelled: no verdict on the upstream, but let another call probe
+            with self.lock:
+                if probe:
+                    self.probing = False
+            raise
+        self.after(probe)
+
+
+def breaker_settings():
+    return {**DEFAULT_BREAKER_SETTINGS, **getattr(settings, "LLM_BREAKER", {})}
+
+
+class Breakers:
+    """One circuit breaker per model."""
+
+    def __init__(self, options):
+        self.options = options
+        self.lock = threading.Lock()
+        self.breakers = {}
+
+    def get(self, model):
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            with self.lock:
+                breaker = self.breakers.setdefault(
+                    model, CircuitBreaker(model, self.options["FAILURE_THRESHOLD"], self.options["COOLDOWN"]),
+                )
+        return breaker
+
+    def timeout(self, endpoint):
+        return self.options["TIMEOUT"].get(endpoint)
+
+    @contextmanager
+    def guard(self, endpoint, model):
+        if not self.options["ENABLED"]:
+            yield
+            return
+        try:
+            with self.get(model).guard():
+                yield
+        except CircuitOpen:
+            registry.increment("aidhp_llm_short_circuited_total", endpoint=endpoint)
+            raise
+
+    def collect_metrics(self):
+        return [
+            ("aidhp_llm_circuit_state", "gauge", "Circuit state per model (0 closed, 1 half-open, 2 open)", [
+                ({"model": model}, STATE_VALUES[breaker.state]) for model, breaker in sorted(self.breakers.items())
+            ]),
+        ]
+
+
+registry.describe("aidhp_llm_short_circuited_total", "LLM calls failed fast by an open circuit")
+
+_breakers = None
+_breakers_lock = threading.Lock()
+
+
+def get_breakers():
+    """Returns the process-wide breakers, rebuilt if settings.LLM_BREAKER changes."""
+    global _breakers
+    options = breaker_settings()
+    if _breakers is None or _breakers.options != options:
+        with _breakers_lock:
+            if _breakers is None or _breakers.options != options:
+                _breakers = Breakers(options)
+    return _breakers
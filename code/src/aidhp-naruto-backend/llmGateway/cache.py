@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+
+DEFAULT_CACHE_SETTINGS = {
+    "MAX_ENTRIES": 1024,
+    "MAX_BYTES": 64 * 1024 * 1024,
+    "DISK_PATH": None,
+    "TTL": {},
+    "DEFAULT_TTL": 0,
+}
+
+
+def normalize_prompt(prompt):
+    """Collapses whitespace so prompts that differ only in formatting share an entry."""
+    return re.sub(r"\s+", " ", str(prompt)).strip()
+
+
+def config_hash(config):
+    """Stable hash of a generation config (dict, pydantic model or None)."""
+    if config is None:
+        return ""
+    if hasattr(config, "model_dump"):
+        config = config.model_dump(exclude_none=True)
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def cache_key(model, prompt, config=None):
+    raw = "\x00".join([model, normalize_prompt(prompt), config_hash(config)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def value_size(value):
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(pickle.dumps(value))
+
+
+class DiskTier:
+    """SQLite-backed tier that survives restarts and is shared by worker processes."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, key):
+        row = self.connection().execute(
+            "SELECT value, expires FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None, 0
+        if row[1] <= time.time():
+            with self.connection() as conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None, 0
+        return pickle.loads(row[0]), row[1]
+
+    def set(self, key, value, expires):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value), expires),
+            )
+
+    def delete(self, key):
+        with self.connection() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        with self.connection() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses.
+
+    Entries live in a bounded in-memory LRU (by entry count and total size) and,
+    when a disk path is configured, in a SQLite file. Each endpoint has its own
+    TTL; a TTL of 0 disables caching for that endpoint. Entries may be tagged
+    (e.g. with the CIDs a prompt describes) and dropped by tag.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, disk_path=None, ttl=None, default_ttl=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = dict(ttl or {})
+        self.default_ttl = default_ttl
+        self.disk = DiskTier(disk_path) if disk_path else None
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.tagged = defaultdict(set)
+        self.key_tags = {}
+        self.lock = threading.Lock()
+        self.counters = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0})
+
+    def ttl_for(self, endpoint):
+        return self.ttl.get(endpoint, self.default_ttl)
+
+    def get(self, endpoint, key):
+        """Returns the cached value or None, counting the hit or miss against the endpoint."""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires, size = entry
+                if expires > now:
+                    self.entries.move_to_end(key)
+                    self.counters[endpoint]["memory_hits"] += 1
+                    return value
+                self.evict(key)
+
+        if self.disk is not None:
+            value, expires = self.disk.get(key)
+            if value is not None:
+                with self.lock:
+                    self.store_in_memory(key, value, expires)
+                    self.counters[endpoint]["disk_hits"] += 1
+                return value
+
+        with self.lock:
+            self.counters[endpoint]["misses"] += 1
+        return None
+
+    def set(self, endpoint, key, value, tags=()):
+        ttl = self.ttl_for(endpoint)
+        # Empty answers (a failed or empty stream) are never worth serving again
+        if not ttl or value is None or value in ("", b""):
+            return
+        expires = time.time() + ttl
+        with self.lock:
+            self.store_in_memory(key, value, expires)
+            self.counters[endpoint]["stores"] += 1
+            if tags and key in self.entries:
+                self.key_tags[key] = tuple(tags)
+                for tag in tags:
+                    self.tagged[tag].add(key)
+        if self.disk is not None:
+            self.disk.set(key, value, expires)
+
+    def store_in_memory(self, key, value, expires):
+        size = value_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.evict(key)
+        self.entries[key] = (value, expires, size)
+        self.size += size
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self.evict(next(iter(self.entries)))
+
+    def evict(self, key):
+        _, _, size = self.entries.pop(key)
+        self.size -= size
+        for tag in self.key_tags.pop(key, ()):
+            keys = self.tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tagged[tag]
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.evict(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def delete_tagged(self, tags):
+        """Drops every entry stored with any of the tags; returns how many were dropped."""
+        with self.lock:
+            keys = set().union(*(self.tagged.get(tag, ()) for tag in tags))
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.tagged.clear()
+            self.key_tags.clear()
+            self.counters.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "endpoints": {endpoint: dict(counts) for endpoint, counts in self.counters.items()},
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Returns the process-wide response cache configured by settings.LLM_CACHE."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                options = {**DEFAULT_CACHE_SETTINGS, **getattr(settings, "LLM_CACHE", {})}
+                _cache = ResponseCache(
+                    max_entries=options["MAX_ENTRIES"],
+                    max_bytes=options["MAX_BYTES"],
+                    disk_path=options["DISK_PATH"],
+                    ttl=options["TTL"],
+                    default_ttl=options["DEFAULT_TTL"],
+                )
+    return _cache
@@ -0,0 +1,78 @@
+import os
+import threading
+
+from django.conf import settings
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+
+# Load environment variables
+load_dotenv()
+
+TEXT_MODEL = "gemini-2.0-flash"
+IMAGE_MODEL = "gemini-2.0-flash-exp-image-generation"
+
+_client = None
+_fake_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the process-wide Gemini client.
+
+    The client keeps one pooled HTTP connection set for sync calls and one
+    for async calls (``client.aio``), so requests reuse connections instead
+    of opening new ones. Async calls must all run on the server's event loop.
+
+    With ``settings.GEMINI_BACKEND = "fake"`` a local stand-in is returned instead.
+    """
+    global _client, _fake_client
+    if getattr(settings, "GEMINI_BACKEND", "gemini") == "fake":
+        from .fake import FakeClient, fake_settings
+        if _fake_client is None or _fake_client.options != fake_settings():
+            _fake_client = FakeClient(fake_settings())
+        return _fake_client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                timeout = getattr(settings, "GEMINI_TIMEOUT_MS", None)
+                _client = genai.Client(
+                    api_key=os.getenv("GEMINI_API_KEY"),
+                    http_options=types.HttpOptions(timeout=timeout) if timeout else None,
+                )
+    return _client
+
+
+def response_parts(response):
+    """The parts of the first candidate; none for blocked or empty candidates, whose parts are None."""
+    if not response or not response.candidates:
+        return []
+    content = response.candidates[0].content
+    return content.parts if content and content.parts else []
+
+
+def response_text(response):
+    """Joins the text parts of the first candidate."""
+    return "".join(part.text for part in response_parts(response) if part.text)
+
+
+def response_image(response):
+    """Returns the bytes of the first inline image in the first candidate, or None."""
+    for part in response_parts(response):
+        if part.inline_data is not None and part.inline_data.data:
+            return part.inline_data.data
+    return None
+
+
+def image_config():
+    return types.GenerateContentConfig(response_modalities=["Text", "Image"])
+
+
+def with_timeout(config, timeout_ms):
+    """Returns ``config`` with a per-request timeout, so a call never outlives its deadline."""
+    if timeout_ms is None:
+        return config
+    config = config.model_copy() if config is not None else types.GenerateContentConfig()
+    config.http_options = types.HttpOptions(timeout=timeout_ms)
+    return config
@@ -0,0 +1,168 @@
+"""
+Deterministic stand-in for the Gemini API, for benchmarks and tests.
+
+Enabled with ``GEMINI_BACKEND = "fake"``. It answers with canned responses
+shaped like what each endpoint expects (recommendation JSON, content links,
+market trend JSON, prose, or PNG bytes for image requests), sized and delayed
+according to ``settings.FAKE_GEMINI``. The same prompt always produces the
+same response.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import struct
+import time
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+from django.conf import settings
+from google.genai import types
+
+DEFAULT_FAKE_SETTINGS = {
+    "LATENCY_MS": 0,
+    "JITTER_MS": 0,
+    "TEXT_CHARS": 600,
+    "IMAGE_BYTES": 64 * 1024,
+    "STREAM_CHUNKS": 8,
+}
+
+WORDS = (
+    "budget savings credit portfolio interest diversify retirement liquidity risk "
+    "yield inflation mortgage equity bonds index fund emergency reserve cash flow"
+).split()
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def fake_settings():
+    return {**DEFAULT_FAKE_SETTINGS, **getattr(settings, "FAKE_GEMINI", {})}
+
+
+def prompt_seed(contents):
+    return int.from_bytes(hashlib.sha256(str(contents).encode("utf-8")).digest()[:8], "big")
+
+
+def prose(seed, chars):
+    words = []
+    length = 0
+    while length < chars:
+        word = WORDS[(seed + len(words) * 7919) % len(WORDS)]
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def fake_png(seed, size):
+    """A valid grayscale PNG of roughly ``size`` bytes whose pixels depend on the seed."""
+    width = 256
+    height = max(1, size // (width + 1))
+    pixels = (seed % 251 + np.arange(width) * 31 + np.arange(height)[:, None] * 17) & 0xFF
+    rows = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels.astype(np.uint8)])
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows.tobytes(), 0)) + chunk(b"IEND", b"")
+
+
+def fake_text(contents, chars):
+    """Picks a canned answer in the format the prompt asks for."""
+    prompt = str(contents)
+    seed = prompt_seed(contents)
+    cids = list(dict.fromkeys(re.findall(r"Customer ((?:IND|ORG)\d+)", prompt)))
+    if "one entry per customer" in prompt:
+        kind = "'services' and 'products'" if "'services' and 'products'" in prompt else "'title' and 'url'"
+        return json.dumps([{"cid": cid, **json.loads(fake_text(f"{cid} {kind}", chars))} for cid in cids])
+    if "'services' and 'products'" in prompt:
+        return json.dumps({
+            "services": [f"Service {seed % 97 + i}" for i in range(3)],
+            "products": [f"Product {seed % 89 + i}" for i in range(3)],
+        })
+    if "'title' and 'url'" in prompt:
+        return json.dumps({"links": [
+            {"title": prose(seed + i, 40).title(), "url": f"https://example.com/finance/{(seed + i) % 10007}"}
+            for i in range(5)
+        ]})
+    if "market trend" in prompt:
+        return json.dumps({
+            "time_series": [{"month": month, "value": round(40 + (seed >> i) % 200 / 10, 1)} for i, month in enumerate(MONTHS)],
+            "growth_rate": round(seed % 400 / 10, 1),
+            "risk_level": ("low", "moderate", "high")[seed % 3],
+        })
+    return prose(seed, chars)
+
+
+def as_response(part):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))]
+    )
+
+
+def wants_image(config):
+    modalities = getattr(config, "response_modalities", None) or []
+    return any(modality.lower() == "image" for modality in modalities)
+
+
+class FakeModels:
+    def __init__(self, client):
+        self.client = client
+
+    def generate_content(self, *, model, contents, config=None):
+        time.sleep(self.client.delay(contents))
+        return self.client.response(contents, config)
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        chunks = self.client.chunks(contents)
+        pause = self.client.delay(contents) / len(chunks)
+        for chunk in chunks:
+            time.sleep(pause)
+            yield as_response(types.Part(text=chunk))
+
+
+class AsyncFakeModels:
+    def __init__(self, client):
+        self.client = client
+
+    async def generate_content(self, *, model, contents, config=None):
+        await asyncio.sleep(self.client.delay(contents))
+        return self.client.response(contents, config)
+
+    async def generate_content_stream(self, *, model, contents, config=None):
+        chunks = self.client.chunks(contents)
+        pause = self.client.delay(contents) / len(chunks)
+
+        async def stream():
+            for chunk in chunks:
+                await asyncio.sleep(pause)
+                yield as_response(types.Part(text=chunk))
+
+        return stream()
+
+
+class FakeClient:
+    """Mimics the parts of ``genai.Client`` the gateway uses."""
+
+    def __init__(self, options=None):
+        self.options = {**DEFAULT_FAKE_SETTINGS, **(options or {})}
+        self.models = FakeModels(self)
+        self.aio = SimpleNamespace(models=AsyncFakeModels(self))
+
+    def delay(self, contents):
+        jitter = self.options["JITTER_MS"]
+        offset = prompt_seed(contents) % (jitter + 1) if jitter else 0
+        return (self.options["LATENCY_MS"] + offset) / 1000
+
+    def response(self, contents, config):
+        if wants_image(config):
+            data = fake_png(prompt_seed(contents), self.options["IMAGE_BYTES"])
+            return as_response(types.Part(inline_data=types.Blob(mime_type="image/png", data=data)))
+        return as_response(types.Part(text=fake_text(contents, self.options["TEXT_CHARS"])))
+
+    def chunks(self, contents):
+        text = fake_text(contents, self.options["TEXT_CHARS"])
+        count = max(1, self.options["STREAM_CHUNKS"])
+        size = -(-len(text) // count) or 1
+        return [text[i:i + size] for i in range(0, len(text), size)] or [""]
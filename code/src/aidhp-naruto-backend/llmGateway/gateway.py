@@ -0,0 +1,327 @@
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+
+from telemetry.spans import record_size, span
+
+from .breaker import get_breakers
+from .cache import cache_key, get_cache
+from .client import IMAGE_MODEL, TEXT_MODEL, get_client, image_config, response_image, response_text, with_timeout
+from .scheduler import get_scheduler, remaining_ms
+from .singleflight import flights
+
+
+@contextmanager
+def upstream_call(endpoint, model, bind=True):
+    """
+    Wraps one upstream call: fails fast with ``CircuitOpen`` while the model's
+    circuit is open, then waits for a scheduler slot. Yields the call's
+    deadline, which includes the endpoint's timeout.
+    """
+    breakers = get_breakers()
+    with breakers.guard(endpoint, model):
+        with get_scheduler().slot(endpoint, model, breakers.timeout(endpoint), bind) as call_deadline:
+            yield call_deadline
+
+
+@asynccontextmanager
+async def aupstream_call(endpoint, model, bind=True):
+    """Async counterpart of ``upstream_call``."""
+    breakers = get_breakers()
+    with breakers.guard(endpoint, model):
+        async with get_scheduler().aslot(endpoint, model, breakers.timeout(endpoint), bind) as call_deadline:
+            yield call_deadline
+
+
+def cached_generate(endpoint, model, prompt, call, config=None, tags=()):
+    """
+    Returns the result of ``call()`` for a prompt, served from the response
+    cache when an identical (model, prompt, config) request is still fresh.
+
+    ``call`` performs the upstream request and returns the value to cache
+    (the response text, or image bytes). Empty results are not cached.
+    Concurrent misses for the same key share a single upstream call, which
+    runs through the model's circuit breaker and in a scheduler slot of the
+    endpoint's priority class (see ``upstream_call``).
+    ``tags`` (e.g. CIDs) let ``ResponseCache.delete_tagged`` drop the entry.
+    """
+    record_size("prompt", prompt)
+    cache = get_cache()
+    key = cache_key(model, prompt, config)
+    value = cache.get(endpoint, key)
+    if value is not None:
+        return value
+
+    def fetch():
+        with upstream_call(endpoint, model):
+            value = call()
+        if value:
+            cache.set(endpoint, key, value, tags=tags)
+        return value
+
+    with span("llm"):
+        value = flights.do(key, fetch)
+    record_size("response", value)
+    return value
+
+
+async def acached_generate(endpoint, model, prompt, call, config=None, tags=()):
+    """Async counterpart of ``cached_generate``; ``call`` is a coroutine function."""
+    record_size("prompt", prompt)
+    cache = get_cache()
+    key = cache_key(model, prompt, config)
+    value = cache.get(endpoint, key)
+    if value is not None:
+        return value
+
+    async def fetch():
+        async with aupstream_call(endpoint, model):
+            value = await call()
+        if value:
+            cache.set(endpoint, key, value, tags=tags)
+        return value
+
+    with span("llm"):
+        value = await flights.ado(key, fetch)
+    record_size("response", value)
+    return value
+
+
+def generate_text(endpoint, prompt, model=TEXT_MODEL, config=None, tags=()):
+    """Generates text with the shared client, through the response cache."""
+    def call():
+        response = get_client().models.generate_content(
+            model=model, contents=prompt, config=with_timeout(config, remaining_ms()),
+        )
+        return response_text(response)
+
+    return cached_generate(endpoint, model, prompt, call, config=config, tags=tags)
+
+
+async def agenerate_text(endpoint, prompt, model=TEXT_MODEL, config=None, tags=()):
+    """Generates text with the shared async client, through the response cache."""
+    async def call():
+        response = await get_client().aio.models.generate_content(
+            model=model, contents=prompt, config=with_timeout(config, remaining_ms()),
+        )
+        return response_text(response)
+
+    return await acached_generate(endpoint, model, prompt, call, config=config, tags=tags)
+
+
+def generate_image(endpoint, prompt, model=IMAGE_MODEL):
+    """Generates an image with the shared client and returns its bytes, or None."""
+    config = image_config()
+
+    def call():
+        response = get_client().models.generate_content(
+            model=model, contents=prompt, config=with_timeout(config, remaining_ms()),
+        )
+        return response_image(response)
+
+    return cached_generate(endpoint, model, prompt, call, config=config)
+
+
+async def agenerate_image(endpoint, prompt, model=IMAGE_MODEL):
+    """Async counterpart of ``generate_image``."""
+    config = image_config()
+
+    async def call():
+        response = await get_client().aio.models.generate_content(
+            model=model, contents=prompt, config=with_timeout(config, remaining_ms()),
+        )
+        return response_image(response)
+
+    return await acached_generate(endpoint, model, prompt, call, config=config)
+
+
+def admit(endpoint, model):
+    """
+    Passes the model's circuit breaker and takes a scheduler slot now, for a
+    call made later (a stream read after the view returns). Returns (stack,
+    deadline); exiting the stack releases both.
+    """
+    breakers = get_breakers()
+    with ExitStack() as stack:
+        stack.enter_context(breakers.guard(endpoint, model))
+        scheduler = get_scheduler()
+        lane, call_deadline = scheduler.acquire(endpoint, model, breakers.timeout(endpoint))
+        stack.enter_context(scheduler.hold(endpoint, lane, call_deadline, bind=False))
+        return stack.pop_all(), call_deadline
+
+
+async def aadmit(endpoint, model):
+    """Async counterpart of ``admit``; the returned stack is still released synchronously."""
+    breakers = get_breakers()
+    with ExitStack() as stack:
+        stack.enter_context(breakers.guard(endpoint, model))
+        scheduler = get_scheduler()
+        lane, call_deadline = await scheduler.aacquire(endpoint, model, breakers.timeout(endpoint))
+        stack.enter_context(scheduler.hold(endpoint, lane, call_deadline, bind=False))
+        return stack.pop_all(), call_deadline
+
+
+class TextStream:
+    """
+    The text chunks of a streamed answer, admitted when it was opened.
+    Reading it to the end or closing it releases the scheduler slot and
+    reports the outcome to the circuit breaker, even if it was never read.
+    """
+
+    def __init__(self, chunks, admission=None):
+        self.chunks = chunks
+        self.admission = admission
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            self.release()
+            raise
+        except Exception as e:
+            self.release(e)
+            raise
+
+    def release(self, error=None):
+        admission, self.admission = self.admission, None
+        if admission is not None:
+            admission.__exit__(type(error) if error else None, error, error.__traceback__ if error else None)
+
+    def close(self):
+        close = getattr(self.chunks, "close", None)
+        if close:
+            close()
+        # Closed early: no verdict on the upstream
+        self.release(GeneratorExit())
+
+
+class AsyncTextStream(TextStream):
+    """Async counterpart of ``TextStream``."""
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.chunks.__anext__()
+        except StopAsyncIteration:
+            self.release()
+            raise
+        except Exception as e:
+            self.release(e)
+            raise
+
+    async def aclose(self):
+        aclose = getattr(self.chunks, "aclose", None)
+        if aclose:
+            await aclose()
+        self.release(GeneratorExit())
+
+    def close(self):
+        # For a response closed before it was read; a started read closes itself through aclose
+        self.release(GeneratorExit())
+
+
+async def cached_chunks(value):
+    yield value
+
+
+def read_stream(endpoint, model, prompt, config, call_deadline, cache, key):
+    stream = get_client().models.generate_content_stream(
+        model=model, contents=prompt, config=with_timeout(config, remaining_ms(call_deadline)),
+    )
+    chunks = []
+    try:
+        for response in stream:
+            text = response_text(response)
+            if text:
+                chunks.append(text)
+                yield text
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+    text = "".join(chunks)
+    record_size("response", text)
+    if text:
+        cache.set(endpoint, key, text)
+
+
+async def aread_stream(endpoint, model, prompt, config, call_deadline, cache, key):
+    stream = await get_client().aio.models.generate_content_stream(
+        model=model, contents=prompt, config=with_timeout(config, remaining_ms(call_deadline)),
+    )
+    chunks = []
+    try:
+        async for response in stream:
+            text = response_text(response)
+            if text:
+                chunks.append(text)
+                yield text
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose:
+            await aclose()
+    text = "".join(chunks)
+    record_size("response", text)
+    if text:
+        cache.set(endpoint, key, text)
+
+
+def stream_text(endpoint, prompt, model=TEXT_MODEL, config=None):
+    """
+    Opens a streamed answer as a ``TextStream`` of text chunks. A fresh
+    cached answer is a single chunk; a stream that runs to completion is
+    cached. The breaker check and the scheduler slot are taken here, so
+    ``CircuitOpen`` and ``Overloaded`` reach the caller before it starts a
+    response, and the request's deadline applies to the upstream call.
+    Closing the stream early closes the upstream stream.
+    """
+    record_size("prompt", prompt)
+    cache = get_cache()
+    key = cache_key(model, prompt, config)
+    value = cache.get(endpoint, key)
+    if value is not None:
+        return TextStream(iter([value]))
+    admission, call_deadline = admit(endpoint, model)
+    return TextStream(read_stream(endpoint, model, prompt, config, call_deadline, cache, key), admission)
+
+
+async def astream_text(endpoint, prompt, model=TEXT_MODEL, config=None):
+    """Async counterpart of ``stream_text``, returning an ``AsyncTextStream``."""
+    record_size("prompt", prompt)
+    cache = get_cache()
+    key = cache_key(model, prompt, config)
+    value = cache.get(endpoint, key)
+    if value is not None:
+        return AsyncTextStream(cached_chunks(value))
+    admission, call_deadline = await aadmit(endpoint, model)
+    return AsyncTextStream(aread_stream(endpoint, model, prompt, config, call_deadline, cache, key), admission)
+
+
+def invalidate_customers(store, cids):
+    """Drops cached responses generated for customers whose data changed."""
+    get_cache().delete_tagged(cids)
+
+
+def collect_metrics():
+    """Response cache, single-flight, scheduler and breaker metrics, for the metrics endpoint."""
+    stats = get_cache().stats()
+    cache_samples = [
+        ({"endpoint": endpoint, "result": result}, count)
+        for endpoint, counts in sorted(stats["endpoints"].items())
+        for result, count in counts.items()
+    ]
+    flight_stats = flights.stats()
+    return [
+        ("aidhp_llm_cache_events_total", "counter", "Response cache lookups and stores", cache_samples),
+        ("aidhp_llm_cache_entries", "gauge", "Entries in the in-memory response cache", [({}, stats["entries"])]),
+        ("aidhp_llm_cache_bytes", "gauge", "Bytes held by the in-memory response cache", [({}, stats["bytes"])]),
+        ("aidhp_llm_singleflight_total", "counter", "Upstream calls led or joined", [
+            ({"role": "leader"}, flight_stats["leaders"]),
+            ({"role": "follower"}, flight_stats["followers"]),
+        ]),
+        *get_scheduler().collect_metrics(),
+        *get_breakers().collect_metrics(),
+    ]
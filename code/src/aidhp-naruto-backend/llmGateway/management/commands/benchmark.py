@@ -0,0 +1,162 @@
+import json
+import resource
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from dataStore.store import get_store
+from llmGateway.cache import get_cache
+
+ENDPOINTS = {
+    "adr": ("/api/adr/", lambda cid: {"message": cid, "flag": "true"}),
+    "cdr": ("/api/cdr/", lambda cid: {"message": cid}),
+    "idr": ("/api/idr/", lambda cid: {}),
+    "chat": ("/api/chat/", lambda cid: {"message": f"How should customer {cid} plan their savings?"}),
+    "graph": ("/api/graphGen/", lambda cid: {}),
+    "image": ("/api/imageGen/", lambda cid: {"prompt": f"a savings plan for customer {cid}"}),
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb(pid=None):
+    """Peak resident set size of this process, or of another one (Linux only)."""
+    if pid:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives the /api/* endpoints at a given concurrency and reports throughput, "
+        "p50/p95/p99 latency and peak RSS. Runs in-process against the fake Gemini "
+        "backend unless --url points at a running server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated subset of " + ", ".join(ENDPOINTS))
+        parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--customers", type=int, default=50, help="Number of distinct CIDs to cycle through")
+        parser.add_argument("--latency-ms", type=int, default=None, help="Latency of the fake Gemini backend")
+        parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache")
+        parser.add_argument("--scheduler", action="store_true", help="Keep the LLM_SCHEDULER rate limits in-process")
+        parser.add_argument("--url", default="", help="Base URL of a running server, e.g. http://localhost:8000")
+        parser.add_argument("--pid", type=int, default=None, help="Server PID to read peak RSS from with --url")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    def request_in_process(self):
+        local = threading.local()
+
+        def send(path, body):
+            if not hasattr(local, "client"):
+                local.client = Client(HTTP_HOST="localhost")
+            return local.client.post(path, json.dumps(body), content_type="application/json").status_code
+
+        return send
+
+    def request_remote(self, base_url):
+        def send(path, body):
+            request = urllib.request.Request(
+                base_url.rstrip("/") + path, data=json.dumps(body).encode("utf-8"),
+                headers={"Content-Type": "application/json"}, method="POST",
+            )
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    return response.status
+            except urllib.error.HTTPError as e:
+                return e.code
+
+        return send
+
+    def run_endpoint(self, send, name, cids, count, concurrency):
+        path, make_body = ENDPOINTS[name]
+
+        def one(i):
+            start = time.perf_counter()
+            code = send(path, make_body(cids[i % len(cids)]))
+            return (time.perf_counter() - start) * 1000, code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(count)))
+        elapsed = time.perf_counter() - start
+
+        samples = [ms for ms, _ in results]
+        return {
+            "endpoint": name,
+            "requests": count,
+            "errors": sum(1 for _, code in results if code >= 400),
+            "throughput": count / elapsed,
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "p99": percentile(samples, 99),
+        }
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options["endpoints"].split(",") if name.strip()]
+        unknown = [name for name in names if name not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(unknown)}")
+
+        store = get_store()
+        per_kind = max(1, options["customers"] // 2)
+        cids = (list(store.individuals)[:per_kind] + list(store.organizations)[:per_kind]) or ["IND0000001"]
+
+        with ExitStack() as stack:
+            if options["url"]:
+                send = self.request_remote(options["url"])
+            else:
+                fake = dict(getattr(settings, "FAKE_GEMINI", {}))
+                if options["latency_ms"] is not None:
+                    fake["LATENCY_MS"] = options["latency_ms"]
+                # Gemini's quotas do not apply to the fake backend unless asked for
+                scheduler = {**getattr(settings, "LLM_SCHEDULER", {}), "ENABLED": options["scheduler"]}
+                stack.enter_context(override_settings(
+                    GEMINI_BACKEND="fake", FAKE_GEMINI=fake, LLM_SCHEDULER=scheduler,
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "localhost"],
+                ))
+                send = self.request_in_process()
+
+            cache = get_cache()
+            if options["no_cache"]:
+                # A zero TTL makes every lookup a miss and every store a no-op
+                stack.callback(setattr, cache, "ttl", cache.ttl)
+                stack.callback(setattr, cache, "default_ttl", cache.default_ttl)
+                cache.ttl, cache.default_ttl = {}, 0
+            cache.clear()
+
+            results = [
+                self.run_endpoint(send, name, cids, options["requests"], options["concurrency"])
+                for name in names
+            ]
+
+        rss = peak_rss_mb(options["pid"] if options["url"] else None)
+        if options["json"]:
+            self.stdout.write(json.dumps({"results": results, "peak_rss_mb": rss}))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['endpoint']:<6} requests={result['requests']} errors={result['errors']} "
+                f"throughput={result['throughput']:.1f}/s p50={result['p50']:.2f}ms "
+                f"p95={result['p95']:.2f}ms p99={result['p99']:.2f}ms"
+            )
+        self.stdout.write(f"peak RSS: {rss:.1f} MB")
@@ -0,0 +1,44 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .scheduler import deadline
+
+
+def request_timeout(request):
+    """Seconds from the client's ``X-Request-Timeout`` header, or None."""
+    try:
+        seconds = float(request.headers.get("X-Request-Timeout", ""))
+    except ValueError:
+        return None
+    return seconds if seconds > 0 else None
+
+
+class DeadlineMiddleware:
+    """
+    Applies a client's ``X-Request-Timeout`` (in seconds) as the deadline of
+    the LLM calls the request makes, so queued calls give up and upstream
+    calls time out once the client would have stopped waiting.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        seconds = request_timeout(request)
+        if seconds is None:
+            return self.get_response(request)
+        with deadline(seconds):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        seconds = request_timeout(request)
+        if seconds is None:
+            return await self.get_response(request)
+        with deadline(seconds):
+            return await self.get_response(request)
@@ -0,0 +1,355 @@
+"""
+Admission control for upstream Gemini calls.
+
+Every ``generate_content`` call made through the gateway first takes a slot
+from the lane of its model. A lane caps concurrent calls and refills a token
+bucket at the model's request rate. When neither is free, the caller waits
+in the queue of its priority class; slots go to the highest class first, so
+chat is never stuck behind bulk insight, graph or image calls.
+
+Queues are bounded: a full queue rejects at once with ``Overloaded`` (429),
+and a caller still waiting when its deadline passes gives up with
+``DeadlineExceeded`` (503). The deadline is the tighter of the class timeout
+and any deadline already set for the request (``deadline``, or the client's
+``X-Request-Timeout`` header via ``DeadlineMiddleware``); what remains of it
+is passed on as the upstream request timeout.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import status
+
+from telemetry.metrics import registry
+from telemetry.spans import span
+
+DEFAULT_SCHEDULER_SETTINGS = {
+    "ENABLED": True,
+    # Lower runs first; endpoints not listed get the lowest class
+    "PRIORITY": {"chat": 0, "adr": 1, "cdr": 1, "idr": 2, "graph": 2, "image": 3, "image_speculative": 4},
+    # Waiting callers allowed per class before new ones are rejected
+    "QUEUE_LIMIT": {0: 64, 1: 128, 2: 16, 3: 8, 4: 2},
+    # Seconds a call of each class may take, queueing included
+    "TIMEOUT": {0: 20, 1: 60, 2: 60, 3: 90, 4: 90},
+    # Per model; "default" applies to models not listed
+    "MODELS": {
+        "default": {"CONCURRENCY": 16, "RPM": 1000, "BURST": 20},
+    },
+}
+
+_deadline = ContextVar("llm_deadline", default=None)
+
+
+class Overloaded(Exception):
+    """The call was not admitted; ``status_code`` is 429 or 503."""
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Overloaded):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def overloaded_response(e):
+    """The JSON error response for a rejected call, with a Retry-After header."""
+    response = JsonResponse({"error": str(e)}, status=e.status_code)
+    response["Retry-After"] = str(max(1, round(e.retry_after)))
+    return response
+
+
+@contextmanager
+def deadline(seconds):
+    """Limits LLM calls made inside the block to finish within ``seconds`` from now."""
+    token = _deadline.set(min_deadline(_deadline.get(), time.monotonic() + seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def min_deadline(*deadlines):
+    return min((d for d in deadlines if d is not None), default=None)
+
+
+def current_deadline():
+    return _deadline.get()
+
+
+def remaining_ms(current=None):
+    """Milliseconds left before ``current`` or the request's deadline, or None when there is none."""
+    current = current if current is not None else _deadline.get()
+    if current is None:
+        return None
+    return max(1, int((current - time.monotonic()) * 1000))
+
+
+class Waiter:
+    __slots__ = ("priority", "deadline", "future")
+
+    def __init__(self, priority, deadline):
+        self.priority = priority
+        self.deadline = deadline
+        self.future = Future()
+
+
+class Lane:
+    """Concurrency cap, token bucket and per-class queues for one model."""
+
+    def __init__(self, model, concurrency, rpm, burst, queue_limits):
+        self.model = model
+        self.concurrency = concurrency
+        self.rate = rpm / 60
+        self.burst = burst
+        self.queue_limits = queue_limits
+        self.lock = threading.Lock()
+        self.active = 0
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.queues = {priority: deque() for priority in sorted(queue_limits)}
+        self.timer = None
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def can_start(self, now):
+        # A rate of 0 (RPM 0) disables the token bucket
+        if not self.rate:
+            return self.active < self.concurrency
+        self.refill(now)
+        return self.active < self.concurrency and self.tokens >= 1
+
+    def start(self):
+        if self.rate:
+            self.tokens -= 1
+        self.active += 1
+
+    def acquire(self, priority, deadline):
+        """Returns None when admitted at once, else a Waiter to wait on."""
+        now = time.monotonic()
+        if deadline <= now:
+            raise DeadlineExceeded("Request deadline passed before the call could start.")
+        with self.lock:
+            ahead = any(queue for p, queue in self.queues.items() if p <= priority)
+            if not ahead and self.can_start(now):
+                self.start()
+                return None
+            queue = self.queues.get(priority)
+            if queue is None or len(queue) >= self.queue_limits[priority]:
+                raise Overloaded(f"Too many pending requests for {self.model}; try again shortly.")
+            waiter = Waiter(priority, deadline)
+            queue.append(waiter)
+            self.dispatch(now)
+            return waiter
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+            self.dispatch(time.monotonic())
+
+    def abandon(self, waiter):
+        """Called when a waiter stops waiting; hands back a slot granted meanwhile."""
+        with self.lock:
+            if waiter.future.cancel():
+                self.queues[waiter.priority].remove(waiter)
+                return
+        if not waiter.future.exception():
+            self.release()
+
+    def dispatch(self, now):
+        """Grants free slots to waiters, highest class first. Call with the lock held."""
+        for queue in self.queues.values():
+            while queue and self.active < self.concurrency:
+                waiter = queue[0]
+                if waiter.deadline <= now:
+                    queue.popleft()
+                    if waiter.future.set_running_or_notify_cancel():
+                        waiter.future.set_exception(DeadlineExceeded("Request deadline passed while queued."))
+                    continue
+                if not self.can_start(now):
+                    # Only an empty token bucket stops a dispatch with free slots
+                    self.wake_later((1 - self.tokens) / self.rate)
+                    return
+                queue.popleft()
+                if waiter.future.set_running_or_notify_cancel():
+                    self.start()
+                    waiter.future.set_result(True)
+
+    def wake_later(self, delay):
+        if self.timer is None:
+            self.timer = threading.Timer(delay, self.wake)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def wake(self):
+        with self.lock:
+            self.timer = None
+            self.dispatch(time.monotonic())
+
+    def stats(self):
+        with self.lock:
+            return {
+                "active": self.active,
+                "queued": {priority: len(queue) for priority, queue in self.queues.items()},
+            }
+
+
+def scheduler_settings():
+    options = {**DEFAULT_SCHEDULER_SETTINGS, **getattr(settings, "LLM_SCHEDULER", {})}
+    options["MODELS"] = {**DEFAULT_SCHEDULER_SETTINGS["MODELS"], **options["MODELS"]}
+    return options
+
+
+class Scheduler:
+    """Routes calls to per-model lanes by endpoint priority class."""
+
+    def __init__(self, options):
+        self.options = options
+        self.lock = threading.Lock()
+        self.lanes = {}
+
+    def lane(self, model):
+        lane = self.lanes.get(model)
+        if lane is None:
+            with self.lock:
+                lane = self.lanes.get(model)
+                if lane is None:
+                    limits = self.options["MODELS"].get(model, self.options["MODELS"]["default"])
+                    lane = self.lanes[model] = Lane(
+                        model, limits["CONCURRENCY"], limits["RPM"], limits["BURST"], self.options["QUEUE_LIMIT"],
+                    )
+        return lane
+
+    def priority(self, endpoint):
+        priorities = self.options["PRIORITY"]
+        return priorities.get(endpoint, max(priorities.values(), default=0))
+
+    def admit(self, endpoint, model, timeout=None):
+        """
+        Returns (lane, deadline, waiter) for a new call; lane is None when the
+        scheduler is disabled and waiter is None when admitted at once.
+        ``timeout`` (seconds) can only tighten the class timeout.
+        """
+        priority = self.priority(endpoint)
+        now = time.monotonic()
+        call_deadline = min_deadline(
+            _deadline.get(), now + self.options["TIMEOUT"].get(priority, 60), now + timeout if timeout else None,
+        )
+        if not self.options["ENABLED"]:
+            return None, call_deadline, None
+        lane = self.lane(model)
+        try:
+            waiter = lane.acquire(priority, call_deadline)
+        except Overloaded as e:
+            self.count(endpoint, "rejected" if type(e) is Overloaded else "expired")
+            raise
+        return lane, call_deadline, waiter
+
+    def acquire(self, endpoint, model, timeout=None):
+        """
+        Waits for a slot of ``model`` in the endpoint's class; returns (lane,
+        deadline) to pass to ``hold``, which releases the slot on exit.
+        """
+        lane, call_deadline, waiter = self.admit(endpoint, model, timeout)
+        if waiter is not None:
+            with span("llm_queue"):
+                try:
+                    waiter.future.result(timeout=max(0, call_deadline - time.monotonic()))
+                except BaseException as e:
+                    self.give_up(endpoint, lane, waiter, e)
+        return lane, call_deadline
+
+    async def aacquire(self, endpoint, model, timeout=None):
+        """Async counterpart of ``acquire``; waiting does not block the event loop."""
+        lane, call_deadline, waiter = self.admit(endpoint, model, timeout)
+        if waiter is not None:
+            with span("llm_queue"):
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(asyncio.wrap_future(waiter.future)),
+                        timeout=max(0, call_deadline - time.monotonic()),
+                    )
+                except BaseException as e:
+                    self.give_up(endpoint, lane, waiter, e)
+        return lane, call_deadline
+
+    @contextmanager
+    def slot(self, endpoint, model, timeout=None, bind=True):
+        """
+        Holds a slot of ``model`` for the block, waiting in the endpoint's class
+        if needed, and yields the call's deadline. With ``bind`` the deadline is
+        also made current for the block; generators pass False, since a context
+        variable set there would leak into their consumer.
+        """
+        lane, call_deadline = self.acquire(endpoint, model, timeout)
+        with self.hold(endpoint, lane, call_deadline, bind):
+            yield call_deadline
+
+    @asynccontextmanager
+    async def aslot(self, endpoint, model, timeout=None, bind=True):
+        """Async counterpart of ``slot``; waiting does not block the event loop."""
+        lane, call_deadline = await self.aacquire(endpoint, model, timeout)
+        with self.hold(endpoint, lane, call_deadline, bind):
+            yield call_deadline
+
+    @contextmanager
+    def hold(self, endpoint, lane, call_deadline, bind):
+        if lane is not None:
+            self.count(endpoint, "admitted")
+        token = _deadline.set(call_deadline) if bind else None
+        try:
+            yield
+        finally:
+            if token is not None:
+                _deadline.reset(token)
+            if lane is not None:
+                lane.release()
+
+    def give_up(self, endpoint, lane, waiter, error):
+        lane.abandon(waiter)
+        self.count(endpoint, "expired")
+        if isinstance(error, Overloaded):
+            raise error
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+            raise DeadlineExceeded("Request deadline passed while queued.") from None
+        raise error
+
+    def count(self, endpoint, outcome):
+        registry.increment("aidhp_llm_scheduler_total", endpoint=endpoint, outcome=outcome)
+
+    def collect_metrics(self):
+        active, queued = [], []
+        for model, lane in sorted(self.lanes.items()):
+            stats = lane.stats()
+            active.append(({"model": model}, stats["active"]))
+            queued += [({"model": model, "priority": priority}, count) for priority, count in stats["queued"].items()]
+        return [
+            ("aidhp_llm_scheduler_active", "gauge", "Upstream calls in progress", active),
+            ("aidhp_llm_scheduler_queued", "gauge", "Calls waiting for a slot", queued),
+        ]
+
+
+registry.describe("aidhp_llm_scheduler_total", "LLM calls admitted, rejected or expired by the scheduler")
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Returns the process-wide scheduler, rebuilt if settings.LLM_SCHEDULER changes."""
+    global _scheduler
+    options = scheduler_settings()
+    if _scheduler is None or _scheduler.options != options:
+        with _scheduler_lock:
+            if _scheduler is None or _scheduler.options != options:
+                _scheduler = Scheduler(options)
+    return _scheduler
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class LeaderCancelled(Exception):
+    """Passed to followers when the leader was cancelled; they join the key again."""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one upstream call.
+
+    The first caller for a key (the leader) runs the call; callers that arrive
+    while it is in flight wait for the leader's result or exception instead of
+    repeating the call. Waiters may be threads (``do``) or coroutines
+    (``ado``), on any event loop, since the shared result is a
+    ``concurrent.futures.Future``. A leader cancelled by its own client
+    (disconnect, deadline) does not fail the others: one of its followers
+    becomes the leader and makes the call.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.counters = {"leaders": 0, "followers": 0}
+
+    def join(self, key):
+        """Returns (future, is_leader) for a key."""
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.counters["followers"] += 1
+                return future, False
+            future = self.calls[key] = Future()
+            self.counters["leaders"] += 1
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """Runs ``fn()`` once for all threads calling with the same key."""
+        while True:
+            future, leader = self.join(key)
+            if leader:
+                return self.lead(key, future, fn)
+            try:
+                return future.result()
+            except LeaderCancelled:
+                continue
+
+    async def ado(self, key, fn):
+        """Awaits ``fn()`` once for all coroutines and threads calling with the same key."""
+        while True:
+            future, leader = self.join(key)
+            if leader:
+                break
+            try:
+                # shield: a follower cancelled itself must not cancel the shared future
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except LeaderCancelled:
+                continue
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.finish(key, future, error=self.shared_error(e))
+            raise
+        self.finish(key, future, result)
+        return result
+
+    def lead(self, key, future, fn):
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, future, error=self.shared_error(e))
+            raise
+        self.finish(key, future, result)
+        return result
+
+    def shared_error(self, error):
+        """What followers get for the leader's ``error``: its own cancellation is not theirs."""
+        return LeaderCancelled() if isinstance(error, asyncio.CancelledError) else error
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.calls)
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "in_flight": len(self.calls)}
+
+
+flights = SingleFlight()
@@ -0,0 +1,138 @@
+"""
+Schema-constrained generation.
+
+``generate_structured`` asks the model for JSON matching a pydantic type
+(sent as ``response_mime_type``/``response_schema``) and validates the
+answer against that type. An answer that fails validation only because it is
+wrapped in code fences or prose is repaired locally. Otherwise the model is
+asked again with the validation errors, at most
+``LLM_STRUCTURED_OUTPUT["RETRIES"]`` times. Invalid answers are dropped from
+the response cache. When no attempt validates, ``StructuredOutputError`` is
+raised so views can answer from local data instead of returning empty lists.
+
+Every model answer is counted by endpoint and outcome (valid, repaired,
+invalid), so the share of wasted calls shows on /api/metrics/.
+"""
+import functools
+import re
+
+from django.conf import settings
+from google.genai import types
+from pydantic import TypeAdapter, ValidationError
+
+from telemetry.metrics import registry
+
+from .cache import cache_key, get_cache
+from .client import TEXT_MODEL
+from .gateway import agenerate_text, generate_text
+
+DEFAULT_STRUCTURED_SETTINGS = {"RETRIES": 1}
+FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+
+
+class StructuredOutputError(ValueError):
+    """No answer of the model matched the requested schema."""
+
+    def __init__(self, endpoint, errors):
+        super().__init__(f"{endpoint}: model output did not match the schema ({errors})")
+        self.endpoint = endpoint
+        self.errors = errors
+
+
+def structured_settings():
+    return {**DEFAULT_STRUCTURED_SETTINGS, **getattr(settings, "LLM_STRUCTURED_OUTPUT", {})}
+
+
+def output_config(schema):
+    return types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema)
+
+
+@functools.lru_cache(maxsize=None)
+def adapter(schema):
+    return TypeAdapter(schema)
+
+
+def extract_json(text):
+    """The JSON value inside an answer wrapped in code fences or prose, or None."""
+    text = FENCE.sub("", text.strip())
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return None
+    start = min(starts)
+    end = text.rfind("}" if text[start] == "{" else "]")
+    return text[start:end + 1] if end > start else None
+
+
+def validate(schema, text):
+    """Returns (value, repaired); raises ValidationError when the answer does not match ``schema``."""
+    try:
+        return adapter(schema).validate_json(text), False
+    except ValidationError as error:
+        candidate = extract_json(text or "")
+        if candidate is None or candidate == text:
+            raise
+        try:
+            return adapter(schema).validate_json(candidate), True
+        except ValidationError:
+            raise error from None
+
+
+def describe_errors(error, limit=3):
+    return "; ".join(
+        f"{'.'.join(map(str, e['loc']))}: {e['msg']}" if e["loc"] else e["msg"]
+        for e in error.errors()[:limit]
+    )
+
+
+def repair_prompt(prompt, errors):
+    return (f"{prompt}\nYour previous answer did not match the required JSON schema: {errors}. "
+            f"Answer again with only JSON matching the schema.")
+
+
+def check(endpoint, model, prompt, config, schema, text):
+    """Validates one answer and counts it; returns (value, None) or (None, error description)."""
+    try:
+        value, repaired = validate(schema, text)
+    except ValidationError as error:
+        registry.increment("aidhp_llm_structured_total", endpoint=endpoint, outcome="invalid")
+        # A fresh call must not be served the same invalid answer from the cache
+        get_cache().delete(cache_key(model, prompt, config))
+        return None, describe_errors(error)
+    registry.increment("aidhp_llm_structured_total", endpoint=endpoint, outcome="repaired" if repaired else "valid")
+    return value, None
+
+
+def generate_structured(endpoint, prompt, schema, model=TEXT_MODEL, tags=()):
+    """
+    Generates a value of ``schema`` (a pydantic model or e.g. ``list[Model]``)
+    through ``generate_text``; raises ``StructuredOutputError`` when the
+    answer and every retry fail validation.
+    """
+    config = output_config(schema)
+    attempt = prompt
+    for _ in range(structured_settings()["RETRIES"] + 1):
+        text = generate_text(endpoint, attempt, model=model, config=config, tags=tags)
+        value, errors = check(endpoint, model, attempt, config, schema, text)
+        if errors is None:
+            return value
+        attempt = repair_prompt(prompt, errors)
+    registry.increment("aidhp_llm_structured_failures_total", endpoint=endpoint)
+    raise StructuredOutputError(endpoint, errors)
+
+
+async def agenerate_structured(endpoint, prompt, schema, model=TEXT_MODEL, tags=()):
+    """Async counterpart of ``generate_structured``."""
+    config = output_config(schema)
+    attempt = prompt
+    for _ in range(structured_settings()["RETRIES"] + 1):
+        text = await agenerate_text(endpoint, attempt, model=model, config=config, tags=tags)
+        value, errors = check(endpoint, model, attempt, config, schema, text)
+        if errors is None:
+            return value
+        attempt = repair_prompt(prompt, errors)
+    registry.increment("aidhp_llm_structured_failures_total", endpoint=endpoint)
+    raise StructuredOutputError(endpoint, errors)
+
+
+registry.describe("aidhp_llm_structured_total", "Structured model answers by validation outcome")
+registry.describe("aidhp_llm_structured_failures_total", "Structured requests with no valid answer after retries")
@@ -0,0 +1,448 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from io import StringIO
+
+from types import SimpleNamespace
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from pydantic import BaseModel
+
+from contentRecommender.schemas import ContentRecommendations
+from dataStore.store import get_store
+from telemetry.metrics import registry
+
+from .breaker import CircuitBreaker, CircuitOpen
+from .cache import ResponseCache, cache_key, get_cache
+from .client import get_client, response_image, response_text
+from .fake import FakeClient
+from .gateway import acached_generate, cached_generate, generate_image, generate_text, stream_text
+from .scheduler import DeadlineExceeded, Lane, Overloaded, Scheduler, deadline, remaining_ms, scheduler_settings
+from .singleflight import SingleFlight
+from .structured import StructuredOutputError, generate_structured
+
+
+class ResponseCacheTests(TestCase):
+    def test_key_ignores_whitespace_but_not_config(self):
+        self.assertEqual(cache_key("m", "a  b\n"), cache_key("m", "a b"))
+        self.assertNotEqual(cache_key("m", "a b"), cache_key("m", "a b", {"temperature": 0}))
+
+    def test_lru_eviction_and_ttl(self):
+        cache = ResponseCache(max_entries=2, ttl={"adr": 60})
+        for key in ("a", "b", "c"):
+            cache.set("adr", key, key.upper())
+        self.assertIsNone(cache.get("adr", "a"))
+        self.assertEqual(cache.get("adr", "c"), "C")
+
+        with mock.patch("llmGateway.cache.time.time", return_value=10**12):
+            self.assertIsNone(cache.get("adr", "c"))
+        self.assertEqual(cache.stats()["endpoints"]["adr"]["misses"], 2)
+
+    def test_disk_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "responses.sqlite3")
+            ResponseCache(disk_path=path, ttl={"image": 60}).set("image", "k", b"png")
+            cache = ResponseCache(disk_path=path, ttl={"image": 60})
+            self.assertEqual(cache.get("image", "k"), b"png")
+            self.assertEqual(cache.stats()["endpoints"]["image"]["disk_hits"], 1)
+
+
+class CachedGenerateTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+
+    def test_identical_prompts_call_upstream_once(self):
+        call = mock.Mock(return_value="answer")
+        self.assertEqual(cached_generate("adr", "m", "prompt", call), "answer")
+        self.assertEqual(cached_generate("adr", "m", " prompt ", call), "answer")
+        self.assertEqual(call.call_count, 1)
+
+    def test_empty_results_are_not_cached(self):
+        call = mock.Mock(return_value="")
+        cached_generate("adr", "m", "prompt", call)
+        cached_generate("adr", "m", "prompt", call)
+        self.assertEqual(call.call_count, 2)
+
+
+class SingleFlightTests(TestCase):
+    def test_concurrent_threads_share_one_call(self):
+        group = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def upstream():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(group.do, "key", upstream) for _ in range(8)]
+            while group.stats()["leaders"] + group.stats()["followers"] < 8:
+                time.sleep(0.001)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, ["result"] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(group.in_flight(), 0)
+
+    def test_concurrent_coroutines_share_one_call_and_error(self):
+        group = SingleFlight()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        async def run():
+            return await asyncio.gather(*[group.ado("key", upstream) for _ in range(5)], return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    def test_follower_takes_over_from_a_cancelled_leader(self):
+        group = SingleFlight()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def run():
+            leader = asyncio.ensure_future(group.ado("key", upstream))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(group.ado("key", upstream)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            # A cancelled follower leaves the others waiting on the shared call
+            followers[0].cancel()
+            return await asyncio.gather(leader, *followers, return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertIsInstance(results[0], asyncio.CancelledError)
+        self.assertIsInstance(results[1], asyncio.CancelledError)
+        self.assertEqual(results[2:], ["result", "result"])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(group.in_flight(), 0)
+
+    def test_async_gateway_coalesces(self):
+        get_cache().clear()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "insights"
+
+        async def run():
+            return await asyncio.gather(*[acached_generate("idr", "m", "same prompt", upstream) for _ in range(5)])
+
+        self.assertEqual(asyncio.run(run()), ["insights"] * 5)
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(GEMINI_BACKEND="fake", FAKE_GEMINI={"LATENCY_MS": 0, "IMAGE_BYTES": 4096}, CHAT_MEMORY={"PATH": None})
+class FakeBackendTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        # The benchmark's image requests are cached in a scratch directory
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        images = override_settings(IMAGE_CACHE={"PATH": directory.name})
+        images.enable()
+        self.addCleanup(images.disable)
+
+    def test_candidates_without_parts_are_empty_answers(self):
+        for content in (None, SimpleNamespace(parts=None), SimpleNamespace(parts=[])):
+            response = SimpleNamespace(candidates=[SimpleNamespace(content=content)])
+            self.assertEqual(response_text(response), "")
+            self.assertIsNone(response_image(response))
+
+    def test_setting_switches_in_fake_client(self):
+        self.assertIsInstance(get_client(), FakeClient)
+        self.assertEqual(get_client().options["IMAGE_BYTES"], 4096)
+
+    def test_responses_are_deterministic_and_shaped_per_prompt(self):
+        prompt = "Generate json strictly with only two keys 'services' and 'products' without extra fields."
+        answer = json.loads(generate_text("adr", prompt))
+        self.assertEqual(set(answer), {"services", "products"})
+        self.assertEqual(FakeClient().models.generate_content(model="m", contents=prompt).text, json.dumps(answer))
+        self.assertEqual("".join(stream_text("chat", "hello")), generate_text("chat", "hello"))
+
+        image = generate_image("image", "a chart")
+        self.assertTrue(image.startswith(b"\x89PNG"))
+        self.assertGreater(len(image), 2048)
+
+    def test_benchmark_covers_every_endpoint(self):
+        out = StringIO()
+        call_command("benchmark", requests=4, concurrency=2, customers=4, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual([result["endpoint"] for result in report["results"]], ["adr", "cdr", "idr", "chat", "graph", "image"])
+        self.assertTrue(all(result["errors"] == 0 for result in report["results"]))
+        self.assertGreater(report["peak_rss_mb"], 0)
+
+
+@override_settings(CHAT_MEMORY={"PATH": None})
+class SchedulerTests(TestCase):
+    def scheduler(self, concurrency=1, rpm=60000, burst=100, queue_limit=4):
+        options = scheduler_settings()
+        options["QUEUE_LIMIT"] = {priority: queue_limit for priority in range(4)}
+        options["MODELS"] = {"default": {"CONCURRENCY": concurrency, "RPM": rpm, "BURST": burst}}
+        return Scheduler(options)
+
+    def test_free_slots_go_to_the_highest_class_first(self):
+        scheduler = self.scheduler()
+        order = []
+        holder = scheduler.lane("m").acquire(0, time.monotonic() + 5)
+        self.assertIsNone(holder)
+
+        def call(endpoint):
+            with scheduler.slot(endpoint, "m"):
+                order.append(endpoint)
+
+        threads = []
+        for endpoint in ("image", "idr", "chat"):
+            threads.append(threading.Thread(target=call, args=(endpoint,)))
+            threads[-1].start()
+            while sum(scheduler.lane("m").stats()["queued"].values()) < len(threads):
+                time.sleep(0.001)
+        scheduler.lane("m").release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ["chat", "idr", "image"])
+
+    def test_full_queue_and_passed_deadline_are_rejected(self):
+        scheduler = self.scheduler(queue_limit=0)
+        with scheduler.slot("chat", "m"):
+            with self.assertRaises(Overloaded) as rejected:
+                with scheduler.slot("chat", "m"):
+                    pass
+        self.assertEqual(rejected.exception.status_code, 429)
+
+        scheduler = self.scheduler()
+        with scheduler.slot("chat", "m"), deadline(0.02):
+            with self.assertRaises(DeadlineExceeded) as expired:
+                with scheduler.slot("image", "m"):
+                    pass
+        self.assertEqual(expired.exception.status_code, 503)
+        self.assertEqual(scheduler.lane("m").stats(), {"active": 0, "queued": {0: 0, 1: 0, 2: 0, 3: 0}})
+
+    def test_token_bucket_spaces_calls_and_deadline_reaches_the_call(self):
+        scheduler = self.scheduler(concurrency=4, rpm=6000, burst=1)
+        start = time.monotonic()
+
+        async def call():
+            async with scheduler.aslot("adr", "m"):
+                return remaining_ms()
+
+        async def run():
+            return await asyncio.gather(*[call() for _ in range(3)])
+
+        timeouts = asyncio.run(run())
+        # 100 calls per second with a burst of one: the third starts ~20ms in
+        self.assertGreaterEqual(time.monotonic() - start, 0.015)
+        self.assertTrue(all(0 < ms <= 60000 for ms in timeouts))
+        self.assertIsNone(remaining_ms())
+
+    def test_lane_hands_back_slot_granted_after_giving_up(self):
+        lane = Lane("m", concurrency=1, rpm=60000, burst=10, queue_limits={0: 1})
+        self.assertIsNone(lane.acquire(0, time.monotonic() + 5))
+        waiter = lane.acquire(0, time.monotonic() + 5)
+        lane.release()
+        self.assertTrue(waiter.future.result(timeout=1))
+        lane.abandon(waiter)
+        self.assertEqual(lane.stats()["active"], 0)
+
+    @override_settings(GEMINI_BACKEND="fake", LLM_SCHEDULER={
+        "QUEUE_LIMIT": {0: 0, 1: 0, 2: 0, 3: 0}, "MODELS": {"default": {"CONCURRENCY": 0, "RPM": 60, "BURST": 1}},
+    })
+    def test_views_answer_429_when_overloaded(self):
+        get_cache().clear()
+        response = self.client.post("/api/chat/", {"message": "hello"}, content_type="application/json")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+
+        streamed = self.client.post("/api/chat/", {"message": "hello", "stream": True}, content_type="application/json")
+        self.assertEqual(streamed.status_code, 429)
+        self.assertEqual(streamed["Retry-After"], "1")
+        self.assertNotEqual(streamed["Content-Type"], "text/event-stream")
+
+    def test_zero_rpm_disables_the_token_bucket(self):
+        lane = Lane("m", concurrency=2, rpm=0, burst=0, queue_limits={0: 1})
+        self.assertIsNone(lane.acquire(0, time.monotonic() + 5))
+        self.assertIsNone(lane.acquire(0, time.monotonic() + 5))
+        waiter = lane.acquire(0, time.monotonic() + 5)
+        lane.release()
+        self.assertTrue(waiter.future.result(timeout=1))
+
+
+@override_settings(CHAT_MEMORY={"PATH": None})
+class CircuitBreakerTests(TestCase):
+    def fail(self, breaker, error=RuntimeError("upstream down")):
+        with self.assertRaises(type(error)):
+            with breaker.guard():
+                raise error
+
+    def test_opens_after_threshold_and_probes_once_after_cooldown(self):
+        breaker = CircuitBreaker("m", failure_threshold=2, cooldown=0.05)
+        self.fail(breaker, Overloaded("queue full"))
+        self.fail(breaker)
+        self.assertEqual(breaker.state, "closed")
+        self.fail(breaker)
+        with self.assertRaises(CircuitOpen):
+            breaker.before()
+
+        time.sleep(0.06)
+        with breaker.guard():
+            # Only the probe gets through while half-open
+            with self.assertRaises(CircuitOpen):
+                breaker.before()
+        self.assertEqual((breaker.state, breaker.failures), ("closed", 0))
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("m", failure_threshold=1, cooldown=0.01)
+        self.fail(breaker)
+        time.sleep(0.02)
+        self.fail(breaker)
+        self.assertEqual(breaker.state, "open")
+
+    @override_settings(LLM_BREAKER={"FAILURE_THRESHOLD": 1, "COOLDOWN": 60})
+    def test_views_fall_back_to_local_data_while_open(self):
+        get_cache().clear()
+        calls = []
+
+        def generate_content(**kwargs):
+            calls.append(kwargs)
+            raise RuntimeError("upstream down")
+
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+        post = lambda path, body: self.client.post(path, body, content_type="application/json")
+        with mock.patch("llmGateway.gateway.get_client", return_value=client), \
+                override_settings(SERVING_TABLE_PATH=None):
+            self.assertEqual(post("/api/chat/", {"message": "hi"}).status_code, 500)
+            self.assertEqual(len(calls), 1)
+
+            adr = post("/api/adr/", {"message": "IND0000411", "flag": "true"})
+            self.assertEqual(adr.status_code, 200)
+            self.assertEqual(len(adr.json()["services"]), 3)
+            cdr = post("/api/cdr/", {"message": "IND0000411"}).json()
+            self.assertIn("Link: https://", cdr["message"])
+            self.assertIn("Churn risk", post("/api/idr/", {}).json()["insights"])
+            self.assertEqual(len(post("/api/graphGen/", {}).json()["market_trends"]["time_series"]), 12)
+
+            chat = post("/api/chat/", {"message": "hi"})
+            self.assertEqual(chat.status_code, 503)
+            self.assertGreater(int(chat["Retry-After"]), 1)
+        self.assertEqual(len(calls), 1)
+
+
+class Pick(BaseModel):
+    services: list[str]
+    products: list[str]
+
+
+@override_settings(LLM_STRUCTURED_OUTPUT={"RETRIES": 1})
+class StructuredOutputTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+
+    def answers(self, *texts):
+        prompts = []
+
+        def generate(endpoint, prompt, **kwargs):
+            prompts.append(prompt)
+            self.assertEqual(kwargs["config"].response_mime_type, "application/json")
+            return texts[len(prompts) - 1]
+
+        return prompts, mock.patch("llmGateway.structured.generate_text", generate)
+
+    def outcomes(self, outcome):
+        return registry.counters.get(("aidhp_llm_structured_total", (("endpoint", "adr"), ("outcome", outcome))), 0)
+
+    def test_fenced_answer_is_repaired_without_a_retry(self):
+        prompts, patch = self.answers('```json\n{"services": ["A"], "products": ["B"]}\n```')
+        repaired = self.outcomes("repaired")
+        with patch:
+            self.assertEqual(generate_structured("adr", "pick", Pick), Pick(services=["A"], products=["B"]))
+        self.assertEqual(len(prompts), 1)
+        self.assertEqual(self.outcomes("repaired"), repaired + 1)
+
+    def test_invalid_answer_is_retried_with_its_errors(self):
+        prompts, patch = self.answers('{"services": "A"}', '{"services": ["A"], "products": []}')
+        invalid = self.outcomes("invalid")
+        with patch:
+            self.assertEqual(generate_structured("adr", "pick", Pick).services, ["A"])
+        self.assertEqual(prompts[0], "pick")
+        self.assertIn("products: Field required", prompts[1])
+        self.assertEqual(self.outcomes("invalid"), invalid + 1)
+
+    def test_invalid_answers_are_not_cached(self):
+        texts = iter(['not json', '{"services": [], "products": []}'])
+        call = mock.Mock(side_effect=lambda: next(texts))
+        with mock.patch("llmGateway.gateway.get_client") as client:
+            client.return_value.models.generate_content.side_effect = lambda **kwargs: SimpleNamespace(
+                candidates=[SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text=call())]))]
+            )
+            with override_settings(LLM_STRUCTURED_OUTPUT={"RETRIES": 0}):
+                with self.assertRaises(StructuredOutputError):
+                    generate_structured("adr", "pick", Pick)
+                self.assertEqual(generate_structured("adr", "pick", Pick).services, [])
+        self.assertEqual(call.call_count, 2)
+
+    @override_settings(GEMINI_BACKEND="fake", SERVING_TABLE_PATH=None)
+    def test_views_answer_locally_when_no_answer_validates(self):
+        prompts, patch = self.answers("Sure! Here are my picks.", "Sorry.")
+        with patch:
+            response = self.client.post("/api/adr/", {"message": "IND0000411"}, content_type="application/json")
+        self.assertEqual(len(prompts), 2)
+        self.assertEqual(len(response.json()["services"]), 3)
+
+        cdr = self.client.post("/api/cdr/", {"message": "IND0000411"}, content_type="application/json").json()
+        self.assertEqual(cdr["message"].count("\nLink: https://example.com/finance/"), 5)
+        self.assertEqual(cdr["image_gen_prompt"], cdr["message"].split("\n")[0])
+
+    @override_settings(GEMINI_BACKEND="fake", SERVING_TABLE_PATH=None)
+    def test_invalid_links_are_dropped_one_by_one(self):
+        good = {"title": "Budgeting basics", "url": "https://example.com/budget"}
+        bad = {"title": "Broken", "url": "javascript:alert(1)"}
+        prompts, patch = self.answers(json.dumps({"links": [bad, good]}))
+        with patch:
+            cdr = self.client.post("/api/cdr/", {"message": "IND0000411"}, content_type="application/json").json()
+        self.assertEqual(len(prompts), 1)
+        self.assertEqual(cdr["message"], "Budgeting basics\nLink: https://example.com/budget")
+
+        prompts, patch = self.answers(json.dumps({"links": [bad]}), json.dumps({"links": [good]}))
+        with patch:
+            self.assertEqual(generate_structured("cdr", "links", ContentRecommendations).links[0].url, good["url"])
+        self.assertEqual(len(prompts), 2)
+
+    @override_settings(GEMINI_BACKEND="fake", SERVING_TABLE_PATH=None)
+    def test_batch_answers_missing_customers_locally(self):
+        store = get_store()
+        first, second = list(store.individuals)[:2]
+        link = {"title": "Budgeting basics", "url": "https://example.com/budget"}
+        cdr = json.dumps([{"cid": first, "links": [link]}, {"cid": second, "links": [{"title": "x", "url": "ftp://x"}]}])
+        adr = json.dumps([{"cid": first, "services": ["A"], "products": ["B"]}])
+        for path, answer in (("/api/cdr/batch/", cdr), ("/api/adr/batch/", adr)):
+            prompts, patch = self.answers(answer)
+            with patch:
+                response = self.client.post(path, {"cids": [first, second]}, content_type="application/json")
+                lines = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+            results = {result["cid"]: result for result in lines}
+            self.assertNotIn("error", results[second])
+            if path == "/api/cdr/batch/":
+                self.assertEqual(results[first]["message"], "Budgeting basics\nLink: https://example.com/budget")
+                self.assertIn("investopedia.com/search", results[second]["message"])
+            else:
+                self.assertEqual(results[first]["services"], ["A"])
+                self.assertEqual(len(results[second]["services"]), 3)
@@ -0,0 +1,65 @@
+"""
+HDR-style histogram: log-linear buckets with bounded relative error.
+
+Values are non-negative integers (microseconds, bytes). Each power-of-two
+range is split into ``2 ** sub_bits`` linear sub-buckets, so any recorded
+value is reported within a relative error of about ``2 ** -sub_bits``
+whatever its magnitude, while memory grows only with the log of the range.
+"""
+import math
+import threading
+
+
+def sub_bits_for(significant_digits):
+    """Sub-bucket bits needed to keep ``significant_digits`` decimal digits."""
+    return max(1, math.ceil(math.log2(2 * 10 ** significant_digits)))
+
+
+class Histogram:
+    def __init__(self, significant_digits=2):
+        self.sub_bits = sub_bits_for(significant_digits)
+        self.sub_count = 1 << self.sub_bits
+        self.half = self.sub_count >> 1
+        self.counts = {}
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def index(self, value):
+        magnitude = max(0, value.bit_length() - self.sub_bits)
+        return magnitude * self.half + (value >> magnitude)
+
+    def highest_equivalent(self, index):
+        """Largest value that falls into the bucket at ``index``."""
+        if index < self.sub_count:
+            return index
+        magnitude = index // self.half - 1
+        sub = index - magnitude * self.half
+        return ((sub + 1) << magnitude) - 1
+
+    def record(self, value, count=1):
+        value = max(0, int(value))
+        index = self.index(value)
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + count
+            self.total += count
+            self.sum += value * count
+            self.max = max(self.max, value)
+
+    def percentile(self, pct):
+        """Value at or below which ``pct`` percent of the recorded values fall."""
+        with self.lock:
+            if not self.total:
+                return 0
+            target = max(1, math.ceil(pct / 100 * self.total))
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= target:
+                    return min(self.highest_equivalent(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        with self.lock:
+            return {"count": self.total, "sum": self.sum, "max": self.max}
@@ -0,0 +1,124 @@
+"""
+In-process metrics registry rendered in the Prometheus text format.
+
+Histograms are exported as summaries (quantiles, ``_sum`` and ``_count``),
+since the HDR buckets are too fine-grained to publish one by one. Other
+modules can register collectors that yield extra samples at scrape time.
+"""
+import threading
+
+from django.conf import settings
+
+from .histogram import Histogram
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    def __init__(self, significant_digits=2):
+        self.significant_digits = significant_digits
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+        self.scales = {}
+        self.collectors = []
+
+    def describe(self, name, help_text, scale=1):
+        """Sets the help text of a metric and the divisor applied to its recorded values."""
+        self.help[name] = help_text
+        self.scales[name] = scale
+
+    def histogram(self, name, labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram(self.significant_digits))
+        return histogram
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, labels).record(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_collector(self, collector):
+        """Registers a callable returning [(name, type, help, [(labels dict, value)])]."""
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self):
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        current = None
+        for (name, labels), histogram in histograms:
+            if name != current:
+                current = name
+                lines.append(f"# HELP {name} {self.help.get(name, name)}")
+                lines.append(f"# TYPE {name} summary")
+            scale = self.scales.get(name, 1)
+            for quantile in QUANTILES:
+                value = histogram.percentile(quantile * 100) / scale
+                lines.append(f"{name}{format_labels(labels + (('quantile', quantile),))} {value:g}")
+            snapshot = histogram.snapshot()
+            lines.append(f"{name}_sum{format_labels(labels)} {snapshot['sum'] / scale:g}")
+            lines.append(f"{name}_count{format_labels(labels)} {snapshot['count']}")
+
+        current = None
+        for (name, labels), value in counters:
+            if name != current:
+                current = name
+                lines.append(f"# HELP {name} {self.help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{format_labels(labels)} {value:g}")
+
+        for collector in self.collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{format_labels(tuple(sorted(labels.items())))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+DEFAULT_TELEMETRY_SETTINGS = {
+    "ENABLED": True,
+    "SIGNIFICANT_DIGITS": 2,
+    "SERVER_TIMING": True,
+    "PROFILING": False,
+    "PROFILE_INTERVAL_MS": 5,
+    "PROFILE_DIR": None,
+}
+
+
+def telemetry_settings():
+    return {**DEFAULT_TELEMETRY_SETTINGS, **getattr(settings, "TELEMETRY", {})}
+
+
+registry = Registry(telemetry_settings()["SIGNIFICANT_DIGITS"])
+registry.describe("aidhp_request_duration_seconds", "Time spent handling API requests", scale=1e6)
+registry.describe("aidhp_stage_duration_seconds", "Time spent in each request stage", scale=1e6)
+registry.describe("aidhp_payload_bytes", "Size of LLM prompts and responses")
+registry.describe("aidhp_requests_total", "API requests by endpoint and status")
@@ -0,0 +1,103 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.urls import Resolver404, resolve
+
+from .metrics import registry, telemetry_settings
+from .profiler import SamplingProfiler
+from .spans import end_trace, record_stage, start_trace
+
+
+def endpoint_name(request):
+    """The URL name of the request, so metric labels stay bounded."""
+    try:
+        return resolve(request.path_info).url_name or "unnamed"
+    except Resolver404:
+        return "unmatched"
+
+
+class TimingMiddleware:
+    """
+    Times every request, records its stage breakdown and status into the
+    metrics registry, and reports the stages in a ``Server-Timing`` header.
+
+    With ``TELEMETRY["PROFILING"]`` on, a request sent with an ``X-Profile``
+    header (or ``?profile=1``) is sampled and its folded stacks are written to
+    ``TELEMETRY["PROFILE_DIR"]``; the file name is returned in ``X-Profile``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.options = telemetry_settings()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.options["ENABLED"]:
+            return self.get_response(request)
+        state = self.begin(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self.abandon(state)
+            raise
+        return self.end(state, request, response)
+
+    async def __acall__(self, request):
+        if not self.options["ENABLED"]:
+            return await self.get_response(request)
+        state = self.begin(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            self.abandon(state)
+            raise
+        return self.end(state, request, response)
+
+    def begin(self, request):
+        trace, token = start_trace(endpoint_name(request))
+        profiler = None
+        if self.options["PROFILING"] and self.options["PROFILE_DIR"] and (
+            "X-Profile" in request.headers or request.GET.get("profile")
+        ):
+            profiler = SamplingProfiler(interval=self.options["PROFILE_INTERVAL_MS"] / 1000).start()
+        return {"trace": trace, "token": token, "profiler": profiler, "start": time.perf_counter()}
+
+    def abandon(self, state):
+        if state["profiler"] is not None:
+            state["profiler"].stop()
+        end_trace(state["token"])
+
+    def end(self, state, request, response):
+        trace = state["trace"]
+        elapsed = time.perf_counter() - state["start"]
+        status = str(response.status_code)
+        registry.observe("aidhp_request_duration_seconds", elapsed * 1e6, endpoint=trace.endpoint, method=request.method)
+        registry.increment("aidhp_requests_total", endpoint=trace.endpoint, status=status)
+
+        if self.options["SERVER_TIMING"]:
+            timings = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in trace.stages.items()]
+            timings.append(f"total;dur={elapsed * 1000:.2f}")
+            response["Server-Timing"] = ", ".join(timings)
+
+        profiler = state["profiler"]
+        if profiler is not None:
+            profiler.stop()
+            response["X-Profile"] = profiler.write(self.options["PROFILE_DIR"], trace.endpoint)
+        end_trace(state["token"])
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that as "serialize"
+        start = time.perf_counter()
+
+        def rendered(response):
+            record_stage("serialize", time.perf_counter() - start)
+
+        response.add_post_render_callback(rendered)
+        return response
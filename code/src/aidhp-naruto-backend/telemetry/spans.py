@@ -0,0 +1,80 @@
+"""
+Stage timings and payload sizes for the request being handled.
+
+``TimingMiddleware`` starts a trace per request; code anywhere below it
+records into that trace with ``span`` and ``record_size``::
+
+    with span("prompt_build"):
+        query = build_query(...)
+
+Every span is also aggregated into the process-wide registry by endpoint
+and stage. The trace lives in a context variable, so it follows the request
+across ``sync_to_async`` threads and coroutines.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .metrics import registry
+
+_current = ContextVar("telemetry_trace", default=None)
+
+
+class Trace:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.stages = {}
+        self.sizes = {}
+
+    def add_stage(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_size(self, kind, size):
+        self.sizes[kind] = self.sizes.get(kind, 0) + size
+
+
+def start_trace(endpoint):
+    """Makes a new trace current; returns (trace, token) for ``end_trace``."""
+    trace = Trace(endpoint)
+    return trace, _current.set(trace)
+
+
+def end_trace(token):
+    _current.reset(token)
+
+
+def current_trace():
+    return _current.get()
+
+
+def current_endpoint():
+    trace = _current.get()
+    return trace.endpoint if trace is not None else "background"
+
+
+def record_stage(stage, seconds):
+    trace = _current.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+    registry.observe("aidhp_stage_duration_seconds", seconds * 1e6, endpoint=current_endpoint(), stage=stage)
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as one stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_size(kind, value):
+    """Records the size of a prompt or response (str is measured in UTF-8 bytes)."""
+    if value is None:
+        return
+    size = len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_size(kind, size)
+    registry.observe("aidhp_payload_bytes", size, endpoint=current_endpoint(), kind=kind)
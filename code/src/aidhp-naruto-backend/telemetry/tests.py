@@ -0,0 +1,71 @@
+import random
+
+from django.test import TestCase, override_settings
+
+from llmGateway.cache import get_cache
+from .histogram import Histogram
+from .metrics import Registry, registry
+from .spans import current_trace, end_trace, span, start_trace
+
+
+class HistogramTests(TestCase):
+    def test_percentiles_within_relative_error(self):
+        histogram = Histogram(significant_digits=2)
+        values = random.Random(7).sample(range(1, 10 ** 7), 100000)
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        for pct in (50, 90, 99, 99.9):
+            exact = values[int(pct / 100 * len(values)) - 1]
+            self.assertAlmostEqual(histogram.percentile(pct) / exact, 1, delta=0.01)
+        self.assertEqual(histogram.percentile(100), max(values))
+
+    def test_small_values_are_exact(self):
+        histogram = Histogram()
+        for value in (0, 3, 3, 250):
+            histogram.record(value)
+        self.assertEqual(histogram.percentile(50), 3)
+        self.assertEqual(histogram.snapshot(), {"count": 4, "sum": 256, "max": 250})
+
+
+class SpanTests(TestCase):
+    def test_spans_accumulate_into_trace_and_registry(self):
+        metrics = Registry()
+        metrics.describe("latency_seconds", "test", scale=1e6)
+        metrics.observe("latency_seconds", 1500, endpoint="adr")
+        metrics.increment("hits_total", endpoint="adr")
+        text = metrics.render()
+        self.assertIn('latency_seconds{endpoint="adr",quantile="0.5"} 0.0015', text)
+        self.assertIn('hits_total{endpoint="adr"} 1', text)
+
+        trace, token = start_trace("adaptive_recommender")
+        try:
+            with span("parse"):
+                pass
+            with span("parse"):
+                pass
+            self.assertIs(current_trace(), trace)
+        finally:
+            end_trace(token)
+        self.assertEqual(list(trace.stages), ["parse"])
+        self.assertIsNone(current_trace())
+
+
+@override_settings(GEMINI_BACKEND="fake", CHAT_MEMORY={"PATH": None})
+class MiddlewareTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        registry.clear()
+
+    def test_request_stages_are_reported_and_exported(self):
+        response = self.client.post("/api/chat/", {"message": "How do I budget?"}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        stages = [timing.split(";")[0] for timing in response["Server-Timing"].split(", ")]
+        self.assertEqual(stages, ["llm", "serialize", "total"])
+
+        metrics = self.client.get("/api/metrics/")
+        self.assertTrue(metrics["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = metrics.content.decode()
+        self.assertIn('aidhp_requests_total{endpoint="finance_chatbot",status="200"} 1', text)
+        self.assertIn('aidhp_payload_bytes_count{endpoint="finance_chatbot",kind="prompt"} 1', text)
+        self.assertIn('aidhp_llm_cache_events_total{endpoint="chat",result="misses"} 1', text)
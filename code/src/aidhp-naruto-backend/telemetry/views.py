@@ -0,0 +1,10 @@
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from .metrics import registry
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape endpoint for the in-process metrics."""
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -106,7 +106,7 @@ const ContentRecommendations = ({
             });
             
             if (imageResponse.data.base64_image) {
-              setGeneratedImage(`data:image/png;base64,${imageResponse.data.base64_image}`);
+              setGeneratedImage(`data:${imageResponse.data.mime_type || 'image/png'};base64,${imageResponse.data.base64_image}`);
             }
           } catch (imageError) {
             console.error('Failed to generate image', imageError);
@@ -44,6 +44,7 @@ export function FinanceChatbot() {
   const [isListening, setIsListening] = useState<boolean>(false);
   const chatContainerRef = useRef<HTMLDivElement>(null);
   const recognitionRef = useRef<any>(null);
+  const sessionRef = useRef<string | null>(null);
 
   // Scroll to bottom when messages change
   useEffect(() => {
@@ -98,8 +99,10 @@ export function FinanceChatbot() {
 
     try {
       const response = await axios.post('http://localhost:8000/api/chat/', {
-        message: input
+        message: input,
+        session_id: sessionRef.current
       });
+      sessionRef.current = response.data.session_id;
 
       const botMessage: Message = {
         id: messages.length + 1,
@@ -67,7 +67,7 @@ const MarketTrendsGraph = () => {
             </div>
             <div className="bg-gray-100 p-4 rounded">
               <h3 className="font-bold">Trend Insight</h3>
-              <p>Steady market progression</p>
+              <p>{graphData?.narrative || 'Steady market progression'}</p>
             </div>
           </div>
         </CardContent>
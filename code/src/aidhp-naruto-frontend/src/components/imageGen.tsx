@@ -23,7 +23,7 @@ const ImageGenerator: React.FC<ImageGeneratorProps> = ({ prompt }) => {
         const response = await axios.post('http://127.0.0.1:8000/api/imageGen/', { prompt });
         
         if (response.data.base64_image) {
-          setImage(`data:image/png;base64,${response.data.base64_image}`);
+          setImage(`data:${response.data.mime_type || 'image/png'};base64,${response.data.base64_image}`);
         } else {
           setError('No image generated');
         }